@@ -1,19 +1,28 @@
 import streamlit as st
-from openai import OpenAI
 import os
-from dotenv import load_dotenv
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
-import base64
-import json
-import docx
-import PyPDF2
-import tempfile
-from supabase import create_client, Client
+import logging
+import asyncio
+import time
+from types import SimpleNamespace
+# First, so .env is loaded before the other modules read their settings
+from brand_core import async_openai_client, get_openai_client, get_setting, get_supabase, refresh_access_token, remember_auth_session, supabase_credentials
+from document_extraction import collect_documents, format_document_context
+from context_compressor import compress_documents
+from chunk_index import BM25Index, INDEX_CHAR_BUDGET, chunk_documents, stage_query
+from llm_cache import cached_chat_completion, acached_chat_completion, get_llm_cache
+from llm_retry import get_retry_metrics
+from llm_streaming import astream_chat_completion, stream_chat_completion
+from llm_pipeline import Pipeline
+from job_queue import get_job_queue, DONE
+from results_store import get_results_store, fingerprint, user_job_id
+from draft_autosave import get_draft_autosaver, get_draft_store
+from template_registry import TemplateError, get_registry
+from model_routing import get_routes, record_stage, route
+from question_schema import QuestionStreamParser, generate_questions, get_question_metrics, question_request_kwargs
+from report_renderer import arender_report, render_report
+from session_store import browser_binding, end_session, get_session_store, restore_session, rotate_session, save_session
+import tracing
+from trace_panel import render_trace_panel, timed_rerun
 
 # Initialize session state variables
 if 'logged_in' not in st.session_state:
@@ -38,193 +47,544 @@ if 'max_question_viewed' not in st.session_state:
     st.session_state.max_question_viewed = 0
 if 'login_error' not in st.session_state:
     st.session_state.login_error = None
+if 'questions_key' not in st.session_state:
+    st.session_state.questions_key = None
+if 'documents_key' not in st.session_state:
+    st.session_state.documents_key = None
+if 'analysis_job_id' not in st.session_state:
+    st.session_state.analysis_job_id = None
+if 'questions_job_id' not in st.session_state:
+    st.session_state.questions_job_id = None
+if 'analysis_record' not in st.session_state:
+    st.session_state.analysis_record = None
+if 'access_token' not in st.session_state:
+    st.session_state.access_token = None
+if 'refresh_token' not in st.session_state:
+    st.session_state.refresh_token = None
+if 'token_expires_at' not in st.session_state:
+    st.session_state.token_expires_at = None
+if 'trace_ids' not in st.session_state:
+    st.session_state.trace_ids = {}
 
-def extract_text_from_pdf(file_path):
-    """Extract text from a PDF file."""
-    pdf_reader = PyPDF2.PdfReader(file_path)
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text() + "\n"
-    return text
-
-def extract_text_from_docx(file_path):
-    """Extract text from a DOCX file."""
-    doc = docx.Document(file_path)
-    text = ""
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
-
-def extract_text_from_txt(file):
-    """Extract text from a TXT file."""
-    return file.getvalue().decode('utf-8')
-
-def process_uploaded_files(files):
-    """Process all uploaded files and extract their content."""
-    extracted_texts = []
-    for file in files:
-        # Create a temporary file to handle the uploaded file
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            tmp_file.write(file.getvalue())
-            tmp_file_path = tmp_file.name
-
-        try:
-            if file.type == "application/pdf":
-                text = extract_text_from_pdf(tmp_file_path)
-            elif file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                text = extract_text_from_docx(tmp_file_path)
-            elif file.type == "text/plain":
-                text = extract_text_from_txt(file)
-            else:
-                text = f"Unsupported file type: {file.type}"
-            
-            extracted_texts.append({
-                "filename": file.name,
-                "content": text
-            })
-        finally:
-            # Clean up the temporary file
-            os.unlink(tmp_file_path)
-    
-    return extracted_texts
+# "local" matches similar figures from the catalog alone; "explain" also has a model phrase why they fit
+SIMILAR_FIGURES_MODE = os.getenv("SIMILAR_FIGURES_MODE", "local")
 
 # Set page config must be the first Streamlit command
 st.set_page_config(page_title="Personal Brand Discovery", layout="centered")
 
-# Load environment variables
-load_dotenv()
+# Pick up this session's state if an earlier run was served by another process
+restore_session(st.session_state, st.query_params, browser_binding(st.context.cookies))
 
-# Initialize Supabase client
-def init_supabase() -> Client:
-    """Initialize Supabase client with credentials from environment variables."""
-    supabase_url = os.getenv("SUPABASE_URL") or st.secrets.get("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY") or st.secrets.get("SUPABASE_KEY")
-    
-    if not supabase_url or not supabase_key:
-        st.error("""
-            Please set up your Supabase credentials:
-            - For local development: Add them to your .env file
-            - For Streamlit Cloud: Add them to your app secrets
-            """)
-        st.stop()
-    
-    return create_client(supabase_url, supabase_key)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 
-supabase = init_supabase()
+# The Supabase client is only created when a session first needs it; check its settings up front
+supabase_credentials()
 
 def handle_login():
     if st.session_state.login_email and st.session_state.login_password:
         try:
-            response = supabase.auth.sign_in_with_password({
+            response = get_supabase().auth.sign_in_with_password({
                 "email": st.session_state.login_email,
                 "password": st.session_state.login_password
             })
             if response.user:
+                # Only what the app reads, so the session state stays serializable
+                user = SimpleNamespace(id=str(response.user.id), email=response.user.email)
+                # A session ID that existed before login must not carry the login
+                rotate_session(st.session_state, st.query_params, user.id)
                 st.session_state.logged_in = True
-                st.session_state.user = response.user
+                st.session_state.user = user
+                remember_auth_session(response.session)
                 st.session_state.login_error = None
+                # State restored for this browser, e.g. after a move to another replica, is newer than the saved results
+                if not st.session_state.get("questions_data"):
+                    restore_saved_results()
         except Exception as e:
             st.session_state.login_error = str(e)
     else:
         st.session_state.login_error = "Please fill in all fields"
 
-def create_pdf(result, responses, questions_data, similar_figures):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        textColor=colors.HexColor('#2E4053')
-    )
-    
-    section_title_style = ParagraphStyle(
-        'SectionTitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=15,
-        textColor=colors.HexColor('#2E4053')
-    )
-    
-    body_style = ParagraphStyle(
-        'CustomBody',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        leading=14
+def get_store():
+    """Results store acting on behalf of the signed-in user."""
+    refresh_access_token()
+    return get_results_store(get_supabase())
+
+def get_drafts():
+    """Draft answer store acting on behalf of the signed-in user."""
+    refresh_access_token()
+    return get_draft_store(get_supabase())
+
+def logout(save_drafts=True):
+    """Sign out, writing any unsaved answers first, and forget the stored session."""
+    if save_drafts:
+        autosave_drafts()
+    get_draft_autosaver().flush(st.session_state.user.id)
+    st.session_state.logged_in = False
+    st.session_state.user = None
+    st.session_state.login_error = None
+    st.session_state.access_token = None
+    st.session_state.refresh_token = None
+    st.session_state.token_expires_at = None
+    # The client still carries the old access token
+    st.session_state.pop("_supabase_client", None)
+    st.session_state.analysis_job_id = None
+    st.session_state.questions_job_id = None
+    st.session_state.analysis_record = None
+    end_session(st.session_state, st.query_params)
+    st.query_params.clear()
+
+def restore_saved_results():
+    """Bring back a returning user's latest report, or at least their questions and draft answers."""
+    store = get_store()
+    user_id = st.session_state.user.id
+    record = store.latest(user_id, "analysis") or store.latest(user_id, "questions")
+    if not record:
+        return
+    st.session_state.user_name = record["user_name"]
+    st.session_state.initial_context = record["initial_context"]
+    st.session_state.questions_data = record["questions_data"]
+    st.session_state.responses = record.get("responses") or [""] * len(record["questions_data"])
+    st.session_state.questions_key = record.get("questions_key")
+    if record.get("analysis"):
+        st.session_state.analysis_result = record["analysis"]
+        st.session_state.analysis_record = record
+    elif st.session_state.questions_key:
+        restore_drafts(st.session_state.questions_key)
+
+def restore_drafts(questions_key):
+    """Fill in answers autosaved for this questionnaire, keeping any already in the session."""
+    drafts = get_drafts().load_answers(st.session_state.user.id, questions_key)
+    responses = st.session_state.responses
+    for index, text in drafts.items():
+        if index < len(responses) and not responses[index]:
+            responses[index] = text
+    get_draft_autosaver().remember(st.session_state.user.id, questions_key, drafts)
+
+def autosave_drafts(flush=False):
+    """Hand the current answers to the write-behind autosaver; flush asks for an immediate write."""
+    if not st.session_state.questions_key:
+        return
+    autosaver = get_draft_autosaver()
+    autosaver.update(get_drafts(), st.session_state.user.id, st.session_state.questions_key, st.session_state.responses)
+    if flush:
+        autosaver.request_flush(st.session_state.user.id)
+
+async def run_text_stage(async_client, stage, messages, bypass=False, on_update=None):
+    """Run one stage on its routed model, publishing its text through on_update token by token when given."""
+    stage_route = route(stage)
+    started = time.perf_counter()
+    if on_update is not None:
+        completion = astream_chat_completion(
+            async_client,
+            stage=stage,
+            messages=messages,
+            bypass=bypass,
+            **stage_route.request_kwargs()
+        )
+        streamed = ""
+        async for delta in completion:
+            streamed += delta
+            on_update(stage, streamed)
+        text = completion.text
+    else:
+        text = await acached_chat_completion(
+            async_client,
+            messages=messages,
+            bypass=bypass,
+            **stage_route.request_kwargs()
+        )
+    record_stage(stage, stage_route, messages, text, time.perf_counter() - started)
+    return text
+
+def build_analysis_pipeline(async_client, analysis_prompt, responses, questions_data, initial_context, bypass=False, on_update=None):
+    """Declare the post-submission stages and their dependencies."""
+
+    async def analysis():
+        return await run_text_stage(
+            async_client,
+            "analysis",
+            [
+                {"role": "system", "content": "You are a personal brand development expert. Provide detailed, actionable insights based on the available information. If some questions were not answered, focus on the information provided in the initial context and answered questions."},
+                {"role": "user", "content": analysis_prompt}
+            ],
+            bypass,
+            on_update
+        )
+
+    async def similar_figures(analysis):
+        from figure_index import explanation_messages, format_matches, get_figure_index
+
+        # Nearest neighbours in the local catalog; a model only phrases the explanations, if enabled
+        matches = get_figure_index().query(analysis)
+        if SIMILAR_FIGURES_MODE == "explain" and matches:
+            return await run_text_stage(async_client, "similar_figures", explanation_messages(analysis, matches), bypass, on_update)
+        text = format_matches(matches) or "No close match was found in our catalog of notable figures."
+        if on_update is not None:
+            on_update("similar_figures", text)
+        return text
+
+    async def pdf(analysis, similar_figures):
+        from report_engine import create_brand_pdf
+
+        # Rendering is CPU-bound, so keep it off the event loop
+        return await arender_report(create_brand_pdf, analysis, responses, questions_data, similar_figures, initial_context)
+
+    pipeline = Pipeline()
+    pipeline.add("analysis", analysis, timeout=180)
+    pipeline.add("similar_figures", similar_figures, deps=["analysis"], timeout=120)
+    pipeline.add("pdf", pdf, deps=["analysis", "similar_figures"], timeout=60)
+    return pipeline
+
+def run_analysis_job(job, api_key, user_name, analysis_prompt, responses, questions_data, initial_context, bypass, stream, store, user_id, result_key, trace_id=None):
+    """Background job: run the analysis pipeline outside the script run, save and return its results."""
+    # Worker threads do not inherit the submitting run's span, so rejoin its trace by ID
+    with tracing.span("analysis_pipeline", trace_id=trace_id, job_id=job.id):
+        async_client = async_openai_client(api_key)
+        pipeline = build_analysis_pipeline(
+            async_client,
+            analysis_prompt,
+            responses,
+            questions_data,
+            initial_context,
+            bypass,
+            job.set_partial if stream else None
+        )
+        results, report = asyncio.run(pipeline.run())
+        record = {
+            "analysis": results["analysis"],
+            "similar_figures": results["similar_figures"],
+            "user_name": user_name,
+            "initial_context": initial_context,
+            "questions_data": questions_data,
+            "responses": responses
+        }
+        with tracing.span("store"):
+            store.put(user_id, result_key, "analysis", record)
+    return dict(record, pdf=results["pdf"], report=report.as_dict())
+
+def run_questions_job(job, api_key, messages, bypass, store, user_id, result_key, user_name, initial_context, trace_id=None):
+    """Background job: stream question generation, publishing each question as soon as it is complete."""
+    with tracing.span("question_generation", trace_id=trace_id, job_id=job.id):
+        client = get_openai_client(api_key)
+        stage_route = route("questions")
+        started = time.perf_counter()
+        completion = stream_chat_completion(
+            client,
+            stage="questions",
+            messages=messages,
+            bypass=bypass,
+            **stage_route.request_kwargs(),
+            **question_request_kwargs(stage_route.model)
+        )
+        parser = QuestionStreamParser()
+        for delta in completion:
+            if parser.feed(delta):
+                job.set_partial("questions", list(parser.questions))
+
+        # The full answer is validated (and repaired, or regenerated as a last resort) once it is in
+        questions_data = generate_questions(
+            lambda retry, fresh: cached_chat_completion(
+                client,
+                messages=retry,
+                bypass=bypass or fresh,
+                **stage_route.request_kwargs(),
+                **question_request_kwargs(stage_route.model)
+            ),
+            messages,
+            text=completion.text
+        )
+        record_stage("questions", stage_route, messages, completion.text, time.perf_counter() - started)
+        with tracing.span("store"):
+            store.put(user_id, result_key, "questions", {
+                "questions_data": questions_data,
+                "questions_key": result_key,
+                "user_name": user_name,
+                "initial_context": initial_context
+            })
+    return {"questions_data": questions_data}
+
+def set_questions(questions_data):
+    """Show questions_data, keeping answers only for questions whose text is unchanged.
+
+    The final list of a generation job can differ from the questions it
+    streamed (a retry asks for a fresh set), so answers are matched by
+    question text, not position. Returns how many typed answers were dropped.
+    """
+    old_questions = st.session_state.questions_data or []
+    answers = {q["question"]: r for q, r in zip(old_questions, st.session_state.responses) if r}
+    responses = [answers.pop(q["question"], "") for q in questions_data]
+    for index, q in enumerate(questions_data):
+        if index >= len(old_questions) or old_questions[index]["question"] != q["question"]:
+            # The answer box of this position still holds the text typed for the old question
+            st.session_state.pop(f"response_{index}", None)
+    st.session_state.questions_data = list(questions_data)
+    st.session_state.responses = responses
+    st.session_state.current_question = min(st.session_state.current_question, max(len(questions_data) - 1, 0))
+    return len(answers)
+
+def sync_questions_job():
+    """Pull questions streamed by the generation job into session state; True while it is still running."""
+    job_id = st.session_state.questions_job_id
+    job = get_job_queue().get(job_id) if job_id else None
+    if job is None or job.owner != st.session_state.user.id:
+        st.session_state.questions_job_id = None
+        return False
+
+    if job.active:
+        streamed = job.snapshot().get("questions") or []
+        if len(streamed) > len(st.session_state.questions_data or []):
+            set_questions(streamed)
+        return True
+
+    st.session_state.questions_job_id = None
+    if job.status == DONE:
+        if set_questions(job.result["questions_data"]):
+            st.warning("The questions were regenerated, so answers to questions that changed have been cleared.")
+    else:
+        st.error("An error occurred while generating questions. Please try again.")
+        st.code(job.error)
+    return False
+
+@st.fragment(run_every=1.0)
+def questions_job_panel(known):
+    """Poll the question generation job and rerun the page whenever a new question is ready."""
+    job = get_job_queue().get(st.session_state.questions_job_id)
+    streamed = (job.snapshot().get("questions") or []) if job else []
+    if job is None or not job.active or len(streamed) > known:
+        st.rerun()
+    if known:
+        st.caption("More questions are on the way; you can start answering these now.")
+    else:
+        with st.spinner("Analyzing your context to determine relevant questions..."):
+            st.caption(f"Working for {time.time() - (job.started_at or job.created_at):.0f}s.")
+
+def analysis_pdf(record):
+    """PDF bytes for an analysis record; memoized, so reruns do not render it again."""
+    if record.get("pdf"):
+        return record["pdf"]
+    from report_engine import create_brand_pdf
+
+    return render_report(create_brand_pdf, record["analysis"], record["responses"], record["questions_data"], record["similar_figures"], record["initial_context"])
+
+def render_analysis_results(result):
+    """Show the finished analysis, similar figures and PDF download."""
+    st.success("Here is your personal brand insight:")
+    st.write(result["analysis"])
+
+    # Find similar personal brands
+    st.markdown("---")
+    st.subheader("Notable People with Similar Personal Brands")
+    st.write(result["similar_figures"])
+
+    # PDF Download functionality
+    st.markdown("---")
+    st.subheader("Download Your Results")
+
+    # Served from Streamlit's media endpoint, keyed by content, rather than inlined into the page
+    st.download_button(
+        "📥 Download PDF Report",
+        data=analysis_pdf(result),
+        file_name=f"{result['user_name']}-personal-brand-analysis.pdf",
+        mime="application/pdf"
     )
+
+@st.fragment(run_every=1.0)
+def analysis_job_panel(job_id):
+    """Poll a running analysis job and show its partial output until it finishes."""
+    job = get_job_queue().get(job_id)
+    if job is None or not job.active:
+        # Hand over to the full-page render of the finished job
+        st.rerun()
+
+    partial = job.snapshot()
+    with st.spinner("Analyzing your responses..."):
+        if partial.get("analysis"):
+            st.success("Here is your personal brand insight:")
+            st.write(partial["analysis"])
+        if partial.get("similar_figures"):
+            st.markdown("---")
+            st.subheader("Notable People with Similar Personal Brands")
+            st.write(partial["similar_figures"])
+        st.caption(f"Working for {time.time() - (job.started_at or job.created_at):.0f}s. You can refresh this page; your results will be kept.")
+
+def show_analysis_job(job_id):
+    """Render whatever state the analysis job is in."""
+    job = get_job_queue().get(job_id)
+    if job is None or job.owner != st.session_state.user.id:
+        st.session_state.analysis_job_id = None
+        return
+
+    if job.active:
+        analysis_job_panel(job_id)
+    elif job.status == DONE:
+        # Only the fully assembled text is kept in session state
+        st.session_state.analysis_result = job.result["analysis"]
+        st.session_state.analysis_record = job.result
+        st.session_state.pipeline_report = job.result["report"]
+        render_analysis_results(job.result)
+    else:
+        stage = (job.error_stage or "analysis").replace('_', ' ')
+        st.error(f"An error occurred during the {stage} step. Please try again.")
+        st.code(job.error)
+
+@st.fragment
+def questionnaire_panel(api_key, generating):
+    """Progress, navigation and the current question.
+
+    Navigating or answering reruns only this fragment, not the initial
+    context form and uploader above it.
+    """
+    with timed_rerun("questionnaire"):
+        try:
+            render_questionnaire(api_key, generating)
+        finally:
+            # A fragment rerun never reaches the end of the script, where the session is saved
+            save_session(st.session_state)
+
+def render_questionnaire(api_key, generating):
+    """Body of questionnaire_panel; submitting starts the analysis and reruns the whole page."""
+    total_questions = len(st.session_state.questions_data)
+    unanswered_questions = sum(1 for r in st.session_state.responses if not r.strip())
     
-    bold_style = ParagraphStyle(
-        'BoldStyle',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#2E4053')
-    )
+    # Update max question viewed
+    st.session_state.max_question_viewed = max(st.session_state.max_question_viewed, st.session_state.current_question)
     
-    # Build PDF content
-    content = []
+    # Display progress; while questions are still arriving the total is not known yet
+    answered = total_questions - unanswered_questions
+    if generating:
+        st.progress(answered / total_questions, text=f"{answered} answered of {total_questions} questions so far")
+        st.write(f"Questions remaining: {unanswered_questions} so far, more are being generated")
+    else:
+        st.progress(answered / total_questions)
+        st.write(f"Questions remaining: {unanswered_questions} out of {total_questions}")
     
-    # Add title
-    content.append(Paragraph("Personal Brand Analysis", title_style))
-    content.append(Spacer(1, 20))
+    # Navigation buttons
+    col1, col2 = st.columns(2)
     
-    # Add initial context section
-    content.append(Paragraph("Initial Context", section_title_style))
-    content.append(Paragraph(st.session_state.initial_context, body_style))
-    content.append(Spacer(1, 20))
+    # Only show navigation buttons if they are applicable
+    if st.session_state.current_question > 0:
+        with col1:
+            if st.button("Previous Question"):
+                st.session_state.current_question -= 1
+                autosave_drafts(flush=True)
     
-    # Add analysis section
-    content.append(Paragraph("Analysis", section_title_style))
+    if st.session_state.current_question < total_questions - 1:
+        with col2:
+            if st.button("Next Question"):
+                st.session_state.current_question += 1
+                autosave_drafts(flush=True)
     
-    # Split the result into sections based on numbered points
-    sections = result.split('\n\n')
-    for section in sections:
-        if section.strip():
-            # Check if it's a numbered section
-            if section.strip()[0].isdigit():
-                # Extract the section title and content
-                parts = section.split('.', 1)
-                if len(parts) > 1:
-                    section_title = parts[0].strip() + '.'
-                    section_content = parts[1].strip()
-                    # First line: section number and title
-                    content.append(Paragraph(section_title, bold_style))
-                    # Second line: content
-                    content.append(Paragraph(section_content, body_style))
-                else:
-                    content.append(Paragraph(section, body_style))
+    # Display current question
+    with st.form("personal_brand_form"):
+        q = st.session_state.questions_data[st.session_state.current_question]
+        st.subheader(f"Question {st.session_state.current_question + 1} of {total_questions}")
+        st.subheader(q['question'])
+        if q.get('description'):
+            st.markdown(q['description'])
+        response = st.text_area(
+            "Your response:",
+            height=100,
+            key=f"response_{st.session_state.current_question}",
+            value=st.session_state.responses[st.session_state.current_question]
+        )
+        st.session_state.responses[st.session_state.current_question] = response
+        autosave_drafts()
+        
+        # Always show a submit button, but change the label based on position
+        if st.session_state.current_question == total_questions - 1 and not generating:
+            submitted = st.form_submit_button("Submit Your Responses")
+        else:
+            st.write("*Please use the 'Next Question' button above to continue*")
+            submitted = st.form_submit_button("Submit for Analysis Now (Not Preferred)")
+
+    if submitted:
+        from figure_index import get_figure_index
+
+        try:
+            # Load analysis prompt template
+            try:
+                analysis_template = get_registry().template("analysis_prompt.txt")
+            except FileNotFoundError:
+                st.error("Analysis prompt template file not found. Please contact support.")
+                st.stop()
+            except TemplateError as e:
+                logging.error("Invalid analysis prompt template: %s", e)
+                st.error("Analysis prompt template is invalid. Please contact support.")
+                st.stop()
+
+            # Assembling the prompt opens the trace the background pipeline continues
+            with tracing.span("prompt_assembly") as assembly:
+                # Build the responses section
+                responses_section = ""
+                for i, (q, r) in enumerate(zip(st.session_state.questions_data, st.session_state.responses), 1):
+                    if r.strip():  # Only include non-empty responses
+                        responses_section += f"\nQuestion {i}: {q['question']}\nResponse: {r}\n"
+
+                # Add the document passages most relevant to the analysis
+                analysis_context = st.session_state.initial_context
+                chunks = get_session_store().get_documents(st.session_state.documents_key) if st.session_state.documents_key else []
+                if chunks:
+                    excerpts = BM25Index(chunks).retrieve_documents(stage_query("analysis", responses_section))
+                    excerpts, _ = compress_documents(excerpts, st.session_state.initial_context)
+                    analysis_context = format_document_context(analysis_context, excerpts)
+
+                # Format the analysis prompt
+                analysis_prompt = analysis_template.render(
+                    user_name=st.session_state.user_name,
+                    initial_context=analysis_context,
+                    responses=responses_section
+                )
+            st.session_state.trace_ids["analysis"] = assembly.trace_id
+
+            responses = list(st.session_state.responses)
+            bypass = st.session_state.get("llm_cache_bypass", False)
+            store = get_store()
+            analysis_key = fingerprint(
+                "analysis",
+                get_routes().describe("analysis", "similar_figures"),
+                SIMILAR_FIGURES_MODE,
+                get_figure_index().version,
+                analysis_prompt,
+                st.session_state.questions_data,
+                responses,
+                st.session_state.initial_context
+            )
+            saved = None if bypass else store.get(st.session_state.user.id, analysis_key)
+            if saved:
+                # Same inputs and templates as a stored report: reuse it
+                st.session_state.analysis_result = saved["analysis"]
+                st.session_state.analysis_record = saved
+                st.session_state.analysis_job_id = None
+                st.query_params.pop("job", None)
             else:
-                content.append(Paragraph(section, body_style))
-            content.append(Spacer(1, 12))
-    
-    # Add similar personal brands section
-    content.append(Paragraph("Notable People with Similar Personal Brands", section_title_style))
-    content.append(Paragraph(similar_figures, body_style))
-    content.append(Spacer(1, 20))
-    
-    content.append(PageBreak())
-    
-    # Add questions and responses section
-    content.append(Paragraph("Your Responses", section_title_style))
-    content.append(Spacer(1, 15))
-    
-    for i, (q, r) in enumerate(zip(questions_data, responses), 1):
-        if r.strip():  # Only include answered questions
-            content.append(Paragraph(f"Question {i}: {q['question']}", bold_style))
-            if q.get('description'):
-                content.append(Paragraph(q['description'], body_style))
-            content.append(Paragraph(r, body_style))
-            content.append(Spacer(1, 20))
-    
-    # Build PDF
-    doc.build(content)
-    return buffer.getvalue()
+                # Hand the pipeline to a background worker so a refresh cannot lose it
+                st.session_state.analysis_record = None
+                st.session_state.analysis_job_id = get_job_queue().submit(
+                    "analysis",
+                    run_analysis_job,
+                    api_key,
+                    st.session_state.user_name,
+                    analysis_prompt,
+                    responses,
+                    st.session_state.questions_data,
+                    st.session_state.initial_context,
+                    bypass,
+                    st.session_state.get("stream_output", True),
+                    store,
+                    st.session_state.user.id,
+                    analysis_key,
+                    trace_id=assembly.trace_id,
+                    job_id=user_job_id(st.session_state.user.id, analysis_key),
+                    owner=st.session_state.user.id,
+                    force=bypass
+                )
+                st.query_params["job"] = st.session_state.analysis_job_id
+            # The results are drawn outside this fragment, so hand over to a full rerun
+            st.rerun()
+
+        except Exception as e:
+            st.error("An error occurred while generating the analysis. Please try again.")
+            st.exception(e)
 
 # Main application logic
 def main():
@@ -249,7 +609,7 @@ def main():
             reg_password = st.text_input("Password", type="password", key="reg_password")
             if st.button("Register"):
                 try:
-                    response = supabase.auth.sign_up({
+                    response = get_supabase().auth.sign_up({
                         "email": reg_email,
                         "password": reg_password
                     })
@@ -260,27 +620,55 @@ def main():
         
         return  # Stop here if not logged in
 
+    # The stores act with the user's access token, which expires after about an hour
+    if not refresh_access_token():
+        logout(save_drafts=False)
+        st.session_state.login_error = "Your session has expired. Please log in again."
+        st.rerun()
+
     # Show logout button in sidebar when logged in
     with st.sidebar:
         st.write(f"Logged in as: {st.session_state.user.email}")
+        # Per-run switch to force fresh answers instead of cached ones
+        st.checkbox("Regenerate AI results (skip cache)", key="llm_cache_bypass")
+        st.toggle("Show AI output as it is written", value=True, key="stream_output")
+        cache_stats = get_llm_cache().stats()
+        st.caption(f"AI cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        retry_stats = get_retry_metrics().as_dict()
+        if retry_stats["retries"] or retry_stats["throttle_seconds"]:
+            st.caption(
+                f"AI retries: {retry_stats['retries']} "
+                f"(waited {retry_stats['backoff_seconds'] + retry_stats['throttle_seconds']:.0f}s)"
+            )
+        draft_stats = get_draft_autosaver().metrics.as_dict()
+        if draft_stats["flushes"]:
+            st.caption(
+                f"Drafts autosaved: {draft_stats['flushes']} writes of {draft_stats['mean_batch']} answers on average "
+                f"(p95 {draft_stats['p95_ms']} ms)"
+            )
+        question_stats = get_question_metrics().as_dict()
+        if question_stats["salvage_rate"] is not None:
+            st.caption(
+                f"Question JSON repaired locally: {question_stats['repaired']} of "
+                f"{question_stats['repaired'] + question_stats['retried'] + question_stats['failed']} malformed"
+            )
         if st.button("Logout"):
-            st.session_state.logged_in = False
-            st.session_state.user = None
-            st.session_state.login_error = None
-            st.experimental_rerun()
+            logout()
+            st.rerun()
+
+    # A refreshed page or reconnecting session picks its running or finished job back up
+    if not st.session_state.analysis_job_id and st.query_params.get("job"):
+        st.session_state.analysis_job_id = st.query_params.get("job")
 
     # Load OpenAI API key
-    api_key = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
+    api_key = get_setting("OPENAI_API_KEY")
     if not api_key:
         st.error("OPENAI_API_KEY not found in environment variables")
         st.stop()
 
-    client = OpenAI(api_key=api_key)
-
     # Load initial context gathering instructions
     try:
-        with open("initial_context_gathering.txt", "r") as file:
-            context_instructions = file.read()
+        context_instructions = get_registry().template("initial_context_gathering.txt").text
     except FileNotFoundError:
         st.error("Initial context gathering instructions file not found. Please contact support.")
         st.stop()
@@ -321,22 +709,28 @@ def main():
             st.error("Please provide some information about yourself and your goals.")
             st.stop()
         
-        # Store the initial context, name, and uploaded files in session state
+        # Store the initial context and name in session state; the files stay with the uploader widget
         st.session_state.user_name = user_name
         st.session_state.initial_context = initial_context
-        st.session_state.uploaded_files = uploaded_files
         
-        with st.spinner("Analyzing your context to determine relevant questions..."):
+        with st.spinner("Analyzing your context to determine relevant questions..."), tracing.span("questions") as run:
+            st.session_state.trace_ids = {"questions": run.trace_id}
             try:
-                # Process uploaded files and extract their content
-                if uploaded_files:
-                    extracted_docs = process_uploaded_files(uploaded_files)
-                    # Add document content to the context
-                    full_context = initial_context + "\n\nAdditional information from uploaded documents:\n"
-                    for doc in extracted_docs:
-                        full_context += f"\nContent from {doc['filename']}:\n{doc['content']}\n"
-                else:
-                    full_context = initial_context
+                # Extract uploaded documents lazily, stopping once the index budget is filled
+                with tracing.span("extraction", files=len(uploaded_files or [])) as extraction:
+                    extracted_docs = collect_documents(uploaded_files, INDEX_CHAR_BUDGET) if uploaded_files else []
+                    extraction.set(documents=len(extracted_docs))
+                # Index the documents so each stage retrieves only the passages relevant to it
+                with tracing.span("index"):
+                    chunks = chunk_documents(extracted_docs)
+                    relevant_docs = BM25Index(chunks).retrieve_documents(stage_query("questions", initial_context))
+                    # Kept in the session store, not in memory, until the analysis needs them again
+                    st.session_state.documents_key = get_session_store().put_documents(chunks) if chunks else None
+                # Trim boilerplate and text the user already gave us before paying for tokens
+                with tracing.span("compression"):
+                    relevant_docs, compression = compress_documents(relevant_docs, initial_context)
+                    st.session_state.context_compression = compression.as_dict()
+                    full_context = format_document_context(initial_context, relevant_docs)
                 
                 # Generate questions based on context
                 system_prompt = """You are a personal brand development expert. Based on the user's context and any uploaded documents, generate a set of relevant questions that will help them develop their personal brand. 
@@ -344,28 +738,54 @@ def main():
                 The questions should be thought-provoking and help uncover their unique value proposition, strengths, and professional identity.
                 DO NOT ask questions about information that is already provided in the uploaded documents."""
                 
-                chat_response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": full_context}
-                    ],
-                    temperature=0.7
-                )
-                
-                # Parse the generated questions and store in session state
-                st.session_state.questions_data = json.loads(chat_response.choices[0].message.content)
-                st.session_state.responses = [""] * len(st.session_state.questions_data)
+                bypass = st.session_state.get("llm_cache_bypass", False)
+                store = get_store()
+                questions_key = fingerprint("questions", get_routes().describe("questions"), system_prompt, full_context)
+                with tracing.span("store_lookup"):
+                    saved = None if bypass else store.get(st.session_state.user.id, questions_key)
+                # A new questionnaire replaces any old one and its report
+                st.session_state.questions_data = []
+                st.session_state.responses = []
+                st.session_state.current_question = 0
+                st.session_state.analysis_job_id = None
+                st.session_state.analysis_record = None
+                st.session_state.questions_key = questions_key
+                if saved:
+                    set_questions(saved["questions_data"])
+                    st.session_state.questions_job_id = None
+                    restore_drafts(questions_key)
+                else:
+                    # Generate in the background so questions can be answered as they stream in
+                    st.session_state.questions_job_id = get_job_queue().submit(
+                        "questions",
+                        run_questions_job,
+                        api_key,
+                        [
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": full_context}
+                        ],
+                        bypass,
+                        store,
+                        st.session_state.user.id,
+                        questions_key,
+                        user_name,
+                        initial_context,
+                        trace_id=run.trace_id,
+                        job_id=user_job_id(st.session_state.user.id, questions_key),
+                        owner=st.session_state.user.id,
+                        force=bypass
+                    )
             except Exception as e:
                 st.error("An error occurred while generating questions. Please try again.")
                 st.exception(e)
                 st.stop()
     
+    generating = sync_questions_job()
+    if generating:
+        questions_job_panel(len(st.session_state.questions_data or []))
+
     # Show questions form if we have questions data
     if st.session_state.questions_data:
-        total_questions = len(st.session_state.questions_data)
-        unanswered_questions = sum(1 for r in st.session_state.responses if not r.strip())
-        
         # Add CSS to hide the submit button
         st.markdown("""
             <style>
@@ -375,132 +795,20 @@ def main():
             </style>
         """, unsafe_allow_html=True)
         
-        # Update max question viewed
-        st.session_state.max_question_viewed = max(st.session_state.max_question_viewed, st.session_state.current_question)
-        
-        # Display progress
-        st.progress((total_questions - unanswered_questions) / total_questions)
-        st.write(f"Questions remaining: {unanswered_questions} out of {total_questions}")
-        
-        # Navigation buttons
-        col1, col2 = st.columns(2)
-        
-        # Only show navigation buttons if they are applicable
-        if st.session_state.current_question > 0:
-            with col1:
-                if st.button("Previous Question"):
-                    st.session_state.current_question -= 1
-        
-        if st.session_state.current_question < total_questions - 1:
-            with col2:
-                if st.button("Next Question"):
-                    st.session_state.current_question += 1
-        
-        # Display current question
-        with st.form("personal_brand_form"):
-            q = st.session_state.questions_data[st.session_state.current_question]
-            st.subheader(f"Question {st.session_state.current_question + 1} of {total_questions}")
-            st.subheader(q['question'])
-            if q.get('description'):
-                st.markdown(q['description'])
-            response = st.text_area(
-                "Your response:",
-                height=100,
-                key=f"response_{st.session_state.current_question}",
-                value=st.session_state.responses[st.session_state.current_question]
-            )
-            st.session_state.responses[st.session_state.current_question] = response
-            
-            # Always show a submit button, but change the label based on position
-            if st.session_state.current_question == total_questions - 1:
-                submitted = st.form_submit_button("Submit Your Responses")
-            else:
-                st.write("*Please use the 'Next Question' button above to continue*")
-                submitted = st.form_submit_button("Submit for Analysis Now (Not Preferred)")
+        questionnaire_panel(api_key, generating)
 
-        if submitted:
-            with st.spinner("Analyzing your responses..."):
-                try:
-                    # Load analysis prompt template
-                    try:
-                        with open("analysis_prompt.txt", "r") as file:
-                            analysis_prompt_template = file.read()
-                    except FileNotFoundError:
-                        st.error("Analysis prompt template file not found. Please contact support.")
-                        st.stop()
-
-                    # Build the responses section
-                    responses_section = ""
-                    for i, (q, r) in enumerate(zip(st.session_state.questions_data, st.session_state.responses), 1):
-                        if r.strip():  # Only include non-empty responses
-                            responses_section += f"\nQuestion {i}: {q['question']}\nResponse: {r}\n"
-
-                    # Format the analysis prompt
-                    analysis_prompt = analysis_prompt_template.format(
-                        user_name=st.session_state.user_name,
-                        initial_context=st.session_state.initial_context,
-                        responses=responses_section
-                    )
-                    
-                    analysis_response = client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[
-                            {"role": "system", "content": "You are a personal brand development expert. Provide detailed, actionable insights based on the available information. If some questions were not answered, focus on the information provided in the initial context and answered questions."},
-                            {"role": "user", "content": analysis_prompt}
-                        ],
-                        temperature=0.7
-                    )
-                    
-                    st.session_state.analysis_result = analysis_response.choices[0].message.content
-                    st.success("Here is your personal brand insight:")
-                    st.write(st.session_state.analysis_result)
-
-                    # Find similar personal brands
-                    st.markdown("---")
-                    st.subheader("Notable People with Similar Personal Brands")
-                    
-                    with st.spinner("Finding notable people with similar personal brands..."):
-                        # First, get a concise summary of the personal brand
-                        brand_summary_response = client.chat.completions.create(
-                            model="gpt-4",
-                            messages=[
-                                {"role": "system", "content": "Extract the key characteristics and essence of this person's personal brand in a concise way that can be used for searching similar notable figures. Focus on their unique qualities, values, and impact."},
-                                {"role": "user", "content": st.session_state.analysis_result}
-                            ],
-                            temperature=0.7
-                        )
-                        
-                        brand_summary = brand_summary_response.choices[0].message.content
-                        
-                        # Search for similar notable figures
-                        search_query = f"notable successful famous people who exemplify {brand_summary}"
-                        search_results = client.chat.completions.create(
-                            model="gpt-4",
-                            messages=[
-                                {"role": "system", "content": "You are tasked with identifying 3 notable and positively regarded historical or contemporary figures who share similar personal brand characteristics. Focus on positive role models and avoid controversial or infamous figures. For each person, provide their name and a brief explanation of how their personal brand aligns with the given characteristics."},
-                                {"role": "user", "content": f"Find 3 notable figures who share these brand characteristics: {brand_summary}"}
-                            ],
-                            temperature=0.7
-                        )
-                        
-                        similar_figures = search_results.choices[0].message.content
-                        st.write(similar_figures)
-
-                    # PDF Download functionality
-                    st.markdown("---")
-                    st.subheader("Download Your Results")
-                    
-                    # Create PDF
-                    pdf_data = create_pdf(st.session_state.analysis_result, st.session_state.responses, st.session_state.questions_data, similar_figures)
-                    
-                    # Create download button with personalized filename
-                    b64 = base64.b64encode(pdf_data).decode()
-                    href = f'<a href="data:application/pdf;base64,{b64}" download="{st.session_state.user_name}-personal-brand-analysis.pdf">📥 Download PDF Report</a>'
-                    st.markdown(href, unsafe_allow_html=True)
+    if st.session_state.analysis_job_id:
+        show_analysis_job(st.session_state.analysis_job_id)
+    elif st.session_state.analysis_record:
+        render_analysis_results(st.session_state.analysis_record)
 
-                except Exception as e:
-                    st.error("An error occurred while generating the analysis. Please try again.")
-                    st.exception(e)
+    with st.sidebar:
+        render_trace_panel(st.session_state.trace_ids)
 
 if __name__ == "__main__":
-    main()
+    try:
+        with timed_rerun("page"):
+            main()
+    finally:
+        # Also runs when st.stop() or st.rerun() ends the run early
+        save_session(st.session_state)
@@ -1,18 +1,15 @@
 import streamlit as st
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
-import base64
-import json
-import docx
-import PyPDF2
-import tempfile
+import contextlib
+from brand_core import get_openai_client
+from llm_retry import call_with_retry, sdk_client
+from document_extraction import build_document_context
+from template_registry import TemplateError, get_registry
+from question_schema import generate_questions, question_request_kwargs
+from report_renderer import render_report
+import tracing
+from trace_panel import render_trace_panel
 
 # Initialize session state variables
 if 'initial_context' not in st.session_state:
@@ -31,55 +28,10 @@ if 'current_question' not in st.session_state:
     st.session_state.current_question = 0
 if 'max_question_viewed' not in st.session_state:
     st.session_state.max_question_viewed = 0
-
-def extract_text_from_pdf(file_path):
-    """Extract text from a PDF file."""
-    pdf_reader = PyPDF2.PdfReader(file_path)
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text() + "\n"
-    return text
-
-def extract_text_from_docx(file_path):
-    """Extract text from a DOCX file."""
-    doc = docx.Document(file_path)
-    text = ""
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
-
-def extract_text_from_txt(file):
-    """Extract text from a TXT file."""
-    return file.getvalue().decode('utf-8')
-
-def process_uploaded_files(files):
-    """Process all uploaded files and extract their content."""
-    extracted_texts = []
-    for file in files:
-        # Create a temporary file to handle the uploaded file
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            tmp_file.write(file.getvalue())
-            tmp_file_path = tmp_file.name
-
-        try:
-            if file.type == "application/pdf":
-                text = extract_text_from_pdf(tmp_file_path)
-            elif file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                text = extract_text_from_docx(tmp_file_path)
-            elif file.type == "text/plain":
-                text = extract_text_from_txt(file)
-            else:
-                text = f"Unsupported file type: {file.type}"
-            
-            extracted_texts.append({
-                "filename": file.name,
-                "content": text
-            })
-        finally:
-            # Clean up the temporary file
-            os.unlink(tmp_file_path)
-    
-    return extracted_texts
+if 'trace_ids' not in st.session_state:
+    st.session_state.trace_ids = {}
+if 'analysis_record' not in st.session_state:
+    st.session_state.analysis_record = None
 
 # Try loading from Streamlit secrets first
 if "OPENAI_API_KEY" in st.secrets:
@@ -107,8 +59,6 @@ if not allowed_keys:
     st.error("ALLOWED_KEYS not found in environment variables")
     st.stop()
 
-client = OpenAI(api_key=api_key)
-
 # Access control
 key = st.text_input("Enter access key:", type="password")
 
@@ -118,12 +68,12 @@ if key:
         st.error("Invalid access key. Please try again.")
         st.stop()
     else:
-        # Main app content
+        # Main app content; the OpenAI SDK is only loaded once a valid key has been entered
+        client = get_openai_client(api_key)
         
         # Load initial context gathering instructions
         try:
-            with open("initial_context_gathering.txt", "r") as file:
-                context_instructions = file.read()
+            context_instructions = get_registry().template("initial_context_gathering.txt").text
         except FileNotFoundError:
             st.error("Initial context gathering instructions file not found. Please contact support.")
             st.stop()
@@ -169,17 +119,12 @@ if key:
             st.session_state.initial_context = initial_context
             st.session_state.uploaded_files = uploaded_files
             
-            with st.spinner("Analyzing your context to determine relevant questions..."):
+            with st.spinner("Analyzing your context to determine relevant questions..."), tracing.span("questions") as run:
+                st.session_state.trace_ids = {"questions": run.trace_id}
                 try:
-                    # Process uploaded files and extract their content
-                    if uploaded_files:
-                        extracted_docs = process_uploaded_files(uploaded_files)
-                        # Add document content to the context
-                        full_context = initial_context + "\n\nAdditional information from uploaded documents:\n"
-                        for doc in extracted_docs:
-                            full_context += f"\nContent from {doc['filename']}:\n{doc['content']}\n"
-                    else:
-                        full_context = initial_context
+                    # Extract uploaded documents lazily, stopping once the prompt budget is filled
+                    with tracing.span("extraction", files=len(uploaded_files or [])):
+                        full_context = build_document_context(initial_context, uploaded_files)
                     
                     # Generate questions based on context
                     system_prompt = """You are a personal brand development expert. Based on the user's context and any uploaded documents, generate a set of relevant questions that will help them develop their personal brand. 
@@ -187,18 +132,29 @@ if key:
                     The questions should be thought-provoking and help uncover their unique value proposition, strengths, and professional identity.
                     DO NOT ask questions about information that is already provided in the uploaded documents."""
                     
-                    chat_response = client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": full_context}
-                        ],
-                        temperature=0.7
-                    )
-                    
-                    # Parse the generated questions and store in session state
-                    st.session_state.questions_data = json.loads(chat_response.choices[0].message.content)
+                    def complete(messages, fresh):
+                        chat_response = call_with_retry(
+                            sdk_client(client).chat.completions,
+                            model="gpt-4",
+                            messages=messages,
+                            temperature=0.7,
+                            **question_request_kwargs("gpt-4")
+                        )
+                        tracing.record_usage(chat_response.usage)
+                        return chat_response.choices[0].message.content
+
+                    # Parse the generated questions, repairing malformed JSON locally, and store in session state
+                    with tracing.span("question_generation", model="gpt-4"):
+                        st.session_state.questions_data = generate_questions(
+                            complete,
+                            [
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": full_context}
+                            ]
+                        )
                     st.session_state.responses = [""] * len(st.session_state.questions_data)
+                    # A new questionnaire replaces the report of the old one
+                    st.session_state.analysis_record = None
                 except Exception as e:
                     st.error("An error occurred while generating questions. Please try again.")
                     st.exception(e)
@@ -262,15 +218,19 @@ if key:
                     submitted = st.form_submit_button("Submit for Analysis Now (Not Preferred)")
 
             if submitted:
-                with st.spinner("Analyzing your responses..."):
+                with st.spinner("Analyzing your responses..."), tracing.span("analysis_request") as run:
+                    st.session_state.trace_ids["analysis"] = run.trace_id
+                    st.session_state.analysis_record = None
                     try:
                         # Load analysis prompt template
                         try:
-                            with open("analysis_prompt.txt", "r") as file:
-                                analysis_prompt_template = file.read()
+                            analysis_template = get_registry().template("analysis_prompt.txt")
                         except FileNotFoundError:
                             st.error("Analysis prompt template file not found. Please contact support.")
                             st.stop()
+                        except TemplateError:
+                            st.error("Analysis prompt template is invalid. Please contact support.")
+                            st.stop()
 
                         # Build the responses section
                         responses_section = ""
@@ -279,166 +239,90 @@ if key:
                                 responses_section += f"\nQuestion {i}: {q['question']}\nResponse: {r}\n"
 
                         # Format the analysis prompt
-                        analysis_prompt = analysis_prompt_template.format(
+                        analysis_prompt = analysis_template.render(
                             user_name=st.session_state.user_name,
                             initial_context=st.session_state.initial_context,
                             responses=responses_section
                         )
                         
-                        analysis_response = client.chat.completions.create(
-                            model="gpt-4",
-                            messages=[
-                                {"role": "system", "content": "You are a personal brand development expert. Provide detailed, actionable insights based on the available information. If some questions were not answered, focus on the information provided in the initial context and answered questions."},
-                                {"role": "user", "content": analysis_prompt}
-                            ],
-                            temperature=0.7
-                        )
-                        
-                        st.session_state.analysis_result = analysis_response.choices[0].message.content
-                        st.success("Here is your personal brand insight:")
-                        st.write(st.session_state.analysis_result)
-
-                        # Find similar personal brands
-                        st.markdown("---")
-                        st.subheader("Notable People with Similar Personal Brands")
-                        
-                        with st.spinner("Finding notable people with similar personal brands..."):
-                            # First, get a concise summary of the personal brand
-                            brand_summary_response = client.chat.completions.create(
+                        with tracing.span("analysis", model="gpt-4") as span:
+                            analysis_response = call_with_retry(
+                                sdk_client(client).chat.completions,
                                 model="gpt-4",
                                 messages=[
-                                    {"role": "system", "content": "Extract the key characteristics and essence of this person's personal brand in a concise way that can be used for searching similar notable figures. Focus on their unique qualities, values, and impact."},
-                                    {"role": "user", "content": st.session_state.analysis_result}
+                                    {"role": "system", "content": "You are a personal brand development expert. Provide detailed, actionable insights based on the available information. If some questions were not answered, focus on the information provided in the initial context and answered questions."},
+                                    {"role": "user", "content": analysis_prompt}
                                 ],
                                 temperature=0.7
                             )
-                            
-                            brand_summary = brand_summary_response.choices[0].message.content
-                            
-                            # Search for similar notable figures
-                            search_query = f"notable successful famous people who exemplify {brand_summary}"
-                            search_results = client.chat.completions.create(
-                                model="gpt-4",
-                                messages=[
-                                    {"role": "system", "content": "You are tasked with identifying 3 notable and positively regarded historical or contemporary figures who share similar personal brand characteristics. Focus on positive role models and avoid controversial or infamous figures. For each person, provide their name and a brief explanation of how their personal brand aligns with the given characteristics."},
-                                    {"role": "user", "content": f"Find 3 notable figures who share these brand characteristics: {brand_summary}"}
-                                ],
-                                temperature=0.7
-                            )
-                            
-                            similar_figures = search_results.choices[0].message.content
-                            st.write(similar_figures)
-
-                        # PDF Download functionality
-                        st.markdown("---")
-                        st.subheader("Download Your Results")
+                            tracing.record_usage(analysis_response.usage, span)
                         
-                        def create_pdf(result, responses, questions_data, similar_figures):
-                            buffer = io.BytesIO()
-                            doc = SimpleDocTemplate(buffer, pagesize=letter)
-                            styles = getSampleStyleSheet()
-                            
-                            # Custom styles
-                            title_style = ParagraphStyle(
-                                'CustomTitle',
-                                parent=styles['Heading1'],
-                                fontSize=16,
-                                spaceAfter=30,
-                                textColor=colors.HexColor('#2E4053')
-                            )
-                            
-                            section_title_style = ParagraphStyle(
-                                'SectionTitle',
-                                parent=styles['Heading2'],
-                                fontSize=14,
-                                spaceAfter=15,
-                                textColor=colors.HexColor('#2E4053')
-                            )
-                            
-                            body_style = ParagraphStyle(
-                                'CustomBody',
-                                parent=styles['Normal'],
-                                fontSize=12,
-                                spaceAfter=12,
-                                leading=14
-                            )
-                            
-                            bold_style = ParagraphStyle(
-                                'BoldStyle',
-                                parent=styles['Normal'],
-                                fontSize=12,
-                                spaceAfter=12,
-                                fontName='Helvetica-Bold',
-                                textColor=colors.HexColor('#2E4053')
-                            )
-                            
-                            # Build PDF content
-                            content = []
-                            
-                            # Add title
-                            content.append(Paragraph("Personal Brand Analysis", title_style))
-                            content.append(Spacer(1, 20))
-                            
-                            # Add initial context section
-                            content.append(Paragraph("Initial Context", section_title_style))
-                            content.append(Paragraph(st.session_state.initial_context, body_style))
-                            content.append(Spacer(1, 20))
-                            
-                            # Add analysis section
-                            content.append(Paragraph("Analysis", section_title_style))
-                            
-                            # Split the result into sections based on numbered points
-                            sections = result.split('\n\n')
-                            for section in sections:
-                                if section.strip():
-                                    # Check if it's a numbered section
-                                    if section.strip()[0].isdigit():
-                                        # Extract the section title and content
-                                        parts = section.split('.', 1)
-                                        if len(parts) > 1:
-                                            section_title = parts[0].strip() + '.'
-                                            section_content = parts[1].strip()
-                                            # First line: section number and title
-                                            content.append(Paragraph(section_title, bold_style))
-                                            # Second line: content
-                                            content.append(Paragraph(section_content, body_style))
-                                        else:
-                                            content.append(Paragraph(section, body_style))
-                                    else:
-                                        content.append(Paragraph(section, body_style))
-                                    content.append(Spacer(1, 12))
-                            
-                            # Add similar personal brands section
-                            content.append(Paragraph("Notable People with Similar Personal Brands", section_title_style))
-                            content.append(Paragraph(similar_figures, body_style))
-                            content.append(Spacer(1, 20))
-                            
-                            content.append(PageBreak())
-                            
-                            # Add questions and responses section
-                            content.append(Paragraph("Your Responses", section_title_style))
-                            content.append(Spacer(1, 15))
-                            
-                            for i, (q, r) in enumerate(zip(questions_data, responses), 1):
-                                if r.strip():  # Only include answered questions
-                                    content.append(Paragraph(f"Question {i}: {q['question']}", bold_style))
-                                    if q.get('description'):
-                                        content.append(Paragraph(q['description'], body_style))
-                                    content.append(Paragraph(r, body_style))
-                                    content.append(Spacer(1, 20))
-                            
-                            # Build PDF
-                            doc.build(content)
-                            return buffer.getvalue()
+                        st.session_state.analysis_result = analysis_response.choices[0].message.content
 
-                        # Create PDF
-                        pdf_data = create_pdf(st.session_state.analysis_result, st.session_state.responses, st.session_state.questions_data, similar_figures)
-                        
-                        # Create download button with personalized filename
-                        b64 = base64.b64encode(pdf_data).decode()
-                        href = f'<a href="data:application/pdf;base64,{b64}" download="{st.session_state.user_name}-personal-brand-analysis.pdf">📥 Download PDF Report</a>'
-                        st.markdown(href, unsafe_allow_html=True)
+                        with st.spinner("Finding notable people with similar personal brands..."):
+                            # Match against the local catalog; a model only phrases the explanations, if enabled
+                            from figure_index import explanation_messages, format_matches, get_figure_index
+                            with tracing.span("similar_figures") as span:
+                                matches = get_figure_index().query(st.session_state.analysis_result)
+                                if os.getenv("SIMILAR_FIGURES_MODE", "local") == "explain" and matches:
+                                    search_results = call_with_retry(
+                                        sdk_client(client).chat.completions,
+                                        model="gpt-4",
+                                        messages=explanation_messages(st.session_state.analysis_result, matches),
+                                        temperature=0.7
+                                    )
+                                    tracing.record_usage(search_results.usage, span)
+                                    similar_figures = search_results.choices[0].message.content
+                                else:
+                                    similar_figures = format_matches(matches) or "No close match was found in our catalog of notable figures."
+
+                        # Kept in session state so the report survives the rerun a download click triggers
+                        st.session_state.analysis_record = {
+                            "analysis": st.session_state.analysis_result,
+                            "similar_figures": similar_figures,
+                            "responses": list(st.session_state.responses),
+                            "questions_data": st.session_state.questions_data,
+                            "initial_context": st.session_state.initial_context,
+                            "user_name": st.session_state.user_name
+                        }
 
                     except Exception as e:
                         st.error("An error occurred while generating the analysis. Please try again.")
                         st.exception(e)
+
+            record = st.session_state.get("analysis_record")
+            if record:
+                st.success("Here is your personal brand insight:")
+                st.write(record["analysis"])
+
+                # Find similar personal brands
+                st.markdown("---")
+                st.subheader("Notable People with Similar Personal Brands")
+                st.write(record["similar_figures"])
+
+                # PDF Download functionality
+                st.markdown("---")
+                st.subheader("Download Your Results")
+
+                # Rendered once per distinct report and served by Streamlit's media endpoint;
+                # only the run that produced the report adds the render to its trace
+                pdf_span = tracing.span("pdf", trace_id=st.session_state.trace_ids["analysis"]) if submitted else contextlib.nullcontext()
+                from report_engine import create_brand_pdf
+                with pdf_span:
+                    pdf_data = render_report(
+                        create_brand_pdf,
+                        record["analysis"],
+                        record["responses"],
+                        record["questions_data"],
+                        record["similar_figures"],
+                        record["initial_context"]
+                    )
+                st.download_button(
+                    "📥 Download PDF Report",
+                    data=pdf_data,
+                    file_name=f"{record['user_name']}-personal-brand-analysis.pdf",
+                    mime="application/pdf"
+                )
+
+        with st.sidebar:
+            render_trace_panel(st.session_state.trace_ids)
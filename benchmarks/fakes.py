@@ -0,0 +1,234 @@
+"""Local stand-ins for OpenAI and Supabase with configurable latency.
+
+FakeOpenAIServer is a real HTTP server speaking enough of the Chat
+Completions (including streaming) and Responses APIs for the app's calls, so
+requests go through the genuine OpenAI SDK, retry layer and caches. Point the
+SDK at it with OPENAI_BASE_URL.
+
+FakeSupabase mimics the small part of supabase-py the app uses (password
+auth and table select/upsert chains) in memory. install_fake_supabase()
+registers it as the "supabase" module for the current process only.
+"""
+import json
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+ANALYSIS_TEXT = "\n\n".join(
+    f"{n}. Theme {n}. You bring structure to ambiguous problems and help the people around you grow. "
+    "Your stories show consistent follow-through, calm under pressure and a habit of teaching what you learn."
+    for n in range(1, 9)
+)
+FIGURES_TEXT = (
+    "1. Grace Hopper - made complex technology approachable and mentored widely.\n"
+    "2. Satya Nadella - leads with empathy and a learning mindset.\n"
+    "3. Brene Brown - turns research into practical guidance people act on."
+)
+
+
+def question_payload(count=9):
+    """The JSON the question generation stage expects back."""
+    return json.dumps([
+        {"question": f"Question {n}: what do colleagues rely on you for?", "description": "Think of concrete recent examples."}
+        for n in range(1, count + 1)
+    ])
+
+
+class FakeOpenAIServer:
+    """HTTP server answering /chat/completions and /responses after a fixed delay.
+
+    latency is the time to the first byte; token_delay is added per streamed
+    word, so streamed and non-streamed calls cost about the same in total.
+    """
+
+    def __init__(self, latency=0.2, token_delay=0.002, question_count=9, port=0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.question_count = question_count
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests += 1
+                time.sleep(server.latency)
+                text = server.reply_for(body)
+
+                if self.path.endswith("/responses"):
+                    self.send_json({
+                        "id": "resp", "object": "response", "created_at": 0, "model": body.get("model", ""),
+                        "status": "completed", "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+                        "output": [{"type": "message", "id": "msg", "status": "completed", "role": "assistant",
+                                    "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+                    })
+                    return
+
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    for word in text.split(" "):
+                        chunk = {"id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": body.get("model", ""),
+                                 "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                        time.sleep(server.token_delay)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.close_connection = True
+                    return
+
+                time.sleep(server.token_delay * len(text.split(" ")))
+                self.send_json({
+                    "id": "chat", "object": "chat.completion", "created": 0, "model": body.get("model", ""),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                })
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def reply_for(self, body):
+        messages = body.get("messages") or []
+        system = messages[0]["content"] if messages else ""
+        if "JSON" in system:
+            return question_payload(self.question_count)
+        if "notable" in system:
+            return FIGURES_TEXT
+        return ANALYSIS_TEXT
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _Query:
+    """Chainable table query over the in-memory rows."""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+        self.upsert_rows = None
+
+    def select(self, *columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def upsert(self, rows, on_conflict=""):
+        rows = rows if isinstance(rows, list) else [rows]
+        self.upsert_rows = ([dict(row) for row in rows], [c.strip() for c in on_conflict.split(",") if c.strip()])
+        return self
+
+    def execute(self):
+        time.sleep(self.client.latency)
+        rows = self.client.tables.setdefault(self.table, [])
+        with self.client.lock:
+            if self.upsert_rows is not None:
+                upserted, keys = self.upsert_rows
+                for row in upserted:
+                    row.setdefault("created_at", time.time())
+                    rows[:] = [r for r in rows if not keys or any(r.get(k) != row.get(k) for k in keys)]
+                    rows.append(row)
+                return SimpleNamespace(data=upserted)
+            matched = [r for r in rows if all(r.get(c) == v for c, v in self.filters)]
+            if self.order_by:
+                column, desc = self.order_by
+                matched.sort(key=lambda r: r.get(column), reverse=desc)
+            if self.row_limit is not None:
+                matched = matched[:self.row_limit]
+            return SimpleNamespace(data=[dict(r) for r in matched])
+
+
+class _Auth:
+    def __init__(self, client):
+        self.client = client
+        self.session = None
+
+    def sign_in_with_password(self, credentials):
+        time.sleep(self.client.latency)
+        user = SimpleNamespace(id=f"user-{credentials['email']}", email=credentials["email"])
+        return SimpleNamespace(user=user, session=self._session())
+
+    def get_session(self):
+        return self.session
+
+    def refresh_session(self, refresh_token):
+        time.sleep(self.client.latency)
+        return SimpleNamespace(user=None, session=self._session())
+
+    def _session(self):
+        self.session = SimpleNamespace(
+            access_token=f"fake-token-{time.time()}",
+            refresh_token=f"fake-refresh-{time.time()}",
+            expires_at=int(time.time()) + 3600
+        )
+        return self.session
+
+    def sign_up(self, credentials):
+        return self.sign_in_with_password(credentials)
+
+
+class FakeSupabase:
+    """In-memory Supabase client: auth plus table queries, each paying `latency` seconds."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.tables = {}
+        self.lock = threading.Lock()
+        self.auth = _Auth(self)
+        self.postgrest = SimpleNamespace(auth=lambda token: None)
+
+    def table(self, name):
+        return _Query(self, name)
+
+
+def install_fake_supabase(latency=0.05):
+    """Register a "supabase" module whose create_client returns one shared FakeSupabase."""
+    client = FakeSupabase(latency)
+    module = types.ModuleType("supabase")
+    module.Client = FakeSupabase
+    module.create_client = lambda url, key: client
+    sys.modules["supabase"] = module
+    return client
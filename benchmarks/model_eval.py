@@ -0,0 +1,161 @@
+"""Replay recorded stage inputs through candidate models and compare them.
+
+Record inputs by running the app with EVAL_RECORD_PATH set (see
+model_routing.py), then:
+
+    python -m benchmarks.model_eval recorded.jsonl --stage similar_figures \
+        --candidates gpt-4 gpt-4o-mini gpt-4.1-mini
+
+For each stage and model this reports p50/p95 latency, tokens, estimated cost
+and how similar the outputs are to the recorded baseline output (cosine
+similarity of word counts, 0..1). Re-running the recorded model itself shows
+the noise floor: how much its own answers vary between runs. --fake replays
+against the local FakeOpenAIServer to check the harness without spending
+tokens.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from benchmarks.run import percentile  # noqa: E402
+from llm_retry import call_with_retry, sdk_client  # noqa: E402
+from model_routing import estimate_cost  # noqa: E402
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def similarity(text, reference):
+    """Cosine similarity of the two texts' word counts."""
+    a = Counter(_WORD_RE.findall(text.lower()))
+    b = Counter(_WORD_RE.findall(reference.lower()))
+    dot = sum(count * b[word] for word, count in a.items())
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def load_records(path, stages=None, limit=None):
+    records = []
+    with open(path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if stages and record["stage"] not in stages:
+                continue
+            records.append(record)
+    return records[:limit] if limit else records
+
+
+def replay(client, record, model):
+    """Run one recorded input on model; returns the measurements for that call."""
+    kwargs = {"model": model, "messages": record["messages"], "temperature": record.get("temperature", 0.7)}
+    if record.get("max_tokens"):
+        kwargs["max_tokens"] = record["max_tokens"]
+    started = time.perf_counter()
+    response = call_with_retry(sdk_client(client).chat.completions, **kwargs)
+    latency = time.perf_counter() - started
+    text = response.choices[0].message.content or ""
+    usage = response.usage
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    return {
+        "latency": latency,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": estimate_cost(model, prompt_tokens, completion_tokens),
+        "similarity": similarity(text, record["output"]),
+    }
+
+
+def summarize(rows):
+    latencies = [row["latency"] for row in rows]
+    scores = [row["similarity"] for row in rows]
+    costs = [row["cost"] for row in rows if row["cost"] is not None]
+    return {
+        "calls": len(rows),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "mean_prompt_tokens": round(sum(row["prompt_tokens"] for row in rows) / len(rows), 1),
+        "mean_completion_tokens": round(sum(row["completion_tokens"] for row in rows) / len(rows), 1),
+        "cost_per_call": round(sum(costs) / len(costs), 6) if len(costs) == len(rows) else None,
+        "similarity_mean": round(sum(scores) / len(scores), 3),
+        "similarity_min": round(min(scores), 3),
+    }
+
+
+def evaluate(client, records, candidates):
+    """{stage: {model: summary}} for every candidate on every record."""
+    rows = defaultdict(list)
+    for n, record in enumerate(records, 1):
+        models = candidates or [record["model"]]
+        for model in models:
+            rows[(record["stage"], model)].append(replay(client, record, model))
+        print(f"replayed {n}/{len(records)}", file=sys.stderr)
+    report = defaultdict(dict)
+    for (stage, model), stage_rows in rows.items():
+        report[stage][model] = summarize(stage_rows)
+    return report
+
+
+def print_report(report, records):
+    recorded = {record["stage"]: record["model"] for record in records}
+    print(f"{'stage':18} {'model':16} {'calls':>5} {'p50 ms':>9} {'p95 ms':>9} {'$/call':>10} {'similarity':>10}")
+    for stage, models in report.items():
+        for model, summary in models.items():
+            cost = f"{summary['cost_per_call']:.5f}" if summary["cost_per_call"] is not None else "?"
+            marker = " (recorded)" if model == recorded.get(stage) else ""
+            print(
+                f"{stage:18} {model:16} {summary['calls']:>5} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} "
+                f"{cost:>10} {summary['similarity_mean']:>10.3f}{marker}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded LLM stage inputs through candidate models.")
+    parser.add_argument("records", help="JSONL written by the app with EVAL_RECORD_PATH set")
+    parser.add_argument("--stage", action="append", help="only evaluate this stage (repeatable)")
+    parser.add_argument("--candidates", nargs="+", help="models to try (default: each record's own model)")
+    parser.add_argument("--limit", type=int, help="evaluate at most this many records")
+    parser.add_argument("--output", help="also write the report as JSON here")
+    parser.add_argument("--fake", action="store_true", help="replay against the local fake OpenAI server")
+    args = parser.parse_args(argv)
+
+    from openai import OpenAI
+
+    records = load_records(args.records, args.stage, args.limit)
+    if not records:
+        parser.error("no matching records")
+
+    server = None
+    if args.fake:
+        from benchmarks.fakes import FakeOpenAIServer
+        server = FakeOpenAIServer(latency=0.05).start()
+        client = OpenAI(api_key="sk-eval", base_url=server.base_url)
+    else:
+        client = OpenAI()
+    try:
+        report = evaluate(client, records, args.candidates)
+    finally:
+        if server:
+            server.stop()
+
+    print_report(report, records)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,473 @@
+"""Offline benchmarks for the brand pipeline.
+
+Drives the real code paths with no network access: OpenAI calls go to a
+local FakeOpenAIServer and Supabase is replaced by an in-memory fake, both
+with configurable latency. Every suite reports p50/p95 latency, throughput
+and peak Python memory per stage.
+
+    python -m benchmarks.run                          # all suites, compare with the stored baseline
+    python -m benchmarks.run --suites extraction pdf  # a subset
+    python -m benchmarks.run --save-baseline          # record benchmarks/baselines/baseline.json
+
+Baselines are JSON files under benchmarks/baselines/, so a regression shows
+up both in the comparison table and in the diff of a re-saved baseline.
+Peak memory is measured with tracemalloc over one extra iteration and only
+covers the benchmark process, not extraction worker processes.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+APP_FILE = os.path.join(REPO_DIR, "agent-based-brand-builder-with-supabase.py")
+SUITES = ("extraction", "prompt", "questions", "figures", "drafts", "pdf", "startup", "e2e")
+ENTRY_POINTS = {
+    "builder": "agent-based-brand-builder.py",
+    "builder_supabase": "agent-based-brand-builder-with-supabase.py",
+    "skills_analyzer": "skills_analyzer.py",
+}
+MIN_REGRESSION_MS = 1.0
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def measure(func, iterations, units=1, warmup=1, setup=None):
+    """Time func() over several iterations, then once more under tracemalloc.
+
+    setup() runs before every call and is not timed. units is how many items
+    one call processes, for the throughput figure.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+    times = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(times, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(times, 0.95) * 1000, 3),
+        "throughput_per_sec": round(units * len(times) / sum(times), 3),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def bench_extraction(args):
+    from document_extraction import process_uploaded_files
+    from llm_cache import TieredCache
+    from benchmarks.synthetic import upload_set
+
+    results = {}
+    cache = TieredCache(path=os.path.join(args.workdir, "bench_extraction.sqlite3"), namespace="bench", ttl=None)
+    for size in ("small", "medium", "large"):
+        files = upload_set(size)
+        results[f"extraction.cold.{size}"] = measure(
+            lambda: process_uploaded_files(files, cache=cache), args.iterations, units=len(files), setup=cache.clear
+        )
+        results[f"extraction.warm.{size}"] = measure(
+            lambda: process_uploaded_files(files, cache=cache), args.iterations, units=len(files)
+        )
+    return results
+
+
+def bench_prompt(args):
+    from chunk_index import INDEX_CHAR_BUDGET, BM25Index, stage_query
+    from context_compressor import compress_documents
+    from document_extraction import collect_documents, format_document_context
+    from template_registry import get_registry
+    from benchmarks.synthetic import upload_set
+
+    initial_context = "I lead a platform engineering team, mentor new engineers and want to move into architecture."
+    responses_section = "".join(
+        f"\nQuestion {i}: What do colleagues rely on you for?\nResponse: Designing migrations and coaching engineers through incidents.\n"
+        for i in range(1, 10)
+    )
+    results = {}
+    for size in ("small", "medium", "large"):
+        files = upload_set(size)
+        collect_documents(files, INDEX_CHAR_BUDGET)  # fill the extraction cache so this measures assembly
+
+        def questions_context():
+            docs = collect_documents(files, INDEX_CHAR_BUDGET)
+            index = BM25Index.from_documents(docs)
+            relevant = index.retrieve_documents(stage_query("questions", initial_context))
+            relevant, _ = compress_documents(relevant, initial_context)
+            return index, format_document_context(initial_context, relevant)
+
+        results[f"prompt.questions.{size}"] = measure(questions_context, args.iterations)
+        index, _ = questions_context()
+
+        def analysis_prompt():
+            excerpts = index.retrieve_documents(stage_query("analysis", responses_section))
+            excerpts, _ = compress_documents(excerpts, initial_context)
+            return get_registry().template("analysis_prompt.txt").render(
+                user_name="Jane",
+                initial_context=format_document_context(initial_context, excerpts),
+                responses=responses_section
+            )
+
+        results[f"prompt.analysis.{size}"] = measure(analysis_prompt, args.iterations)
+    return results
+
+
+def bench_questions(args):
+    from benchmarks.fakes import question_payload
+    from question_schema import parse_questions
+
+    results = {}
+    for count in (9, 30, 100):
+        payload = question_payload(count)
+        # What GPT-4 often sends instead: a fenced block with prose and a trailing comma
+        malformed = f"Here are your questions:\n```json\n{payload[:-1]},]\n```\nGood luck!"
+
+        def parse(text):
+            questions_data, _ = parse_questions(text)
+            return [""] * len(questions_data)
+
+        results[f"questions.parse.{count}"] = measure(lambda: parse(payload), args.iterations * 20, units=count)
+        results[f"questions.repair.{count}"] = measure(lambda: parse(malformed), args.iterations * 20, units=count)
+    return results
+
+
+def bench_figures(args):
+    """Similar-figures catalog: vector build and nearest-neighbour lookup, at 1x, 10x and 100x the catalog."""
+    from benchmarks.fakes import ANALYSIS_TEXT
+    from figure_index import FigureIndex, load_catalog
+
+    figures = load_catalog()
+    results = {}
+    for scale in (1, 10, 100):
+        catalog = [dict(figure, name=f"{figure['name']} {n}") for n in range(scale) for figure in figures]
+        results[f"figures.build.{len(catalog)}"] = measure(lambda: FigureIndex(catalog), max(1, args.iterations // scale), units=len(catalog))
+        index = FigureIndex(catalog)
+        results[f"figures.query.{len(catalog)}"] = measure(lambda: index.query(ANALYSIS_TEXT), args.iterations * 10)
+    return results
+
+
+def bench_drafts(args):
+    """Draft autosave: queuing a rerun's answers (on the page) and one batched write (in the background)."""
+    from draft_autosave import DraftAutosaver, SQLiteDraftStore
+
+    store = SQLiteDraftStore(os.path.join(args.workdir, "drafts.sqlite3"))
+    # Long debounce so the background thread never competes with the measurement
+    autosaver = DraftAutosaver(debounce=3600, max_delay=3600)
+    results = {}
+    for count in (9, 30, 100):
+        responses = [f"Answer {i} " * 20 for i in range(count)]
+        autosaver.update(store, "bench-user", f"update-{count}", responses)
+        typed = iter(range(10 ** 9))
+
+        def rerun():
+            # One keystroke in one answer between reruns
+            responses[count // 2] += str(next(typed) % 10)
+            autosaver.update(store, "bench-user", f"update-{count}", responses)
+
+        results[f"drafts.update.{count}"] = measure(rerun, args.iterations * 20)
+
+        def queue_all():
+            autosaver.update(store, "bench-user", f"flush-{count}", [f"{text}{next(typed)}" for text in responses])
+
+        results[f"drafts.flush.{count}"] = measure(lambda: autosaver.flush("bench-user"), args.iterations, units=count, setup=queue_all)
+    autosaver.flush()
+    return results
+
+
+def bench_pdf(args):
+    from report_engine import create_brand_pdf, create_skills_pdf, sample_report
+
+    results = {}
+    for size, scale in (("small", 1), ("medium", 4), ("large", 16)):
+        data = sample_report(0)
+        analysis = "\n\n".join([data["analysis"]] * scale)
+        responses = data["responses"] * scale
+        questions = data["questions"] * scale
+        results[f"pdf.brand.{size}"] = measure(
+            lambda: create_brand_pdf(analysis, responses, questions, data["similar_figures"], data["initial_context"]),
+            args.iterations
+        )
+        skills_questions = [(q["question"], q["description"]) for q in questions]
+        results[f"pdf.skills.{size}"] = measure(
+            lambda: create_skills_pdf(analysis, responses, skills_questions), args.iterations
+        )
+    return results
+
+
+def bench_startup(args):
+    """Time to first paint of each entry point, every iteration in a fresh process."""
+    import subprocess
+
+    results = {}
+    for name, entry in ENTRY_POINTS.items():
+        times, peaks = [], []
+        for _ in range(args.startup_iterations):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.startup", entry],
+                cwd=REPO_DIR, env=dict(os.environ, PYTHONPATH=REPO_DIR),
+                capture_output=True, text=True, check=True,
+            ).stdout
+            run = json.loads(output.strip().splitlines()[-1])
+            times.append(run["first_paint_ms"] / 1000)
+            peaks.append(run["peak_rss_kb"])
+        print(f"{entry}: first paint loads {', '.join(run['loaded']) or 'no heavy modules'}", file=sys.stderr)
+        results[f"startup.{name}"] = {
+            "iterations": len(times),
+            "p50_ms": round(percentile(times, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(times, 0.95) * 1000, 3),
+            "throughput_per_sec": round(len(times) / sum(times), 3),
+            # Peak RSS of the whole fresh process, unlike the tracemalloc figures of other suites
+            "peak_memory_kb": round(percentile(peaks, 0.50), 1),
+        }
+    return results
+
+
+def bench_e2e(args):
+    """Login, question generation, question navigation and the analysis job through the real Streamlit script."""
+    from streamlit.testing.v1 import AppTest
+    from benchmarks.fakes import install_fake_supabase
+    from trace_panel import get_rerun_metrics
+
+    install_fake_supabase(args.supabase_latency)
+    # AppTest touches session state outside a script run, which Streamlit warns about on every call
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+        lambda record: "missing ScriptRunContext" not in record.getMessage()
+    )
+    phases = {"login": [], "first_question": [], "questions": [], "navigate": [], "navigate_fragment": [], "analysis": [], "total": []}
+
+    def run_once(n, record=True, trace=False):
+        if trace:
+            tracemalloc.start()
+        at = AppTest.from_file(APP_FILE, default_timeout=120)
+        at.secrets["OPENAI_API_KEY"] = "sk-bench"
+        at.run()
+        started = time.perf_counter()
+
+        at.text_input(key="login_email").input(f"bench{n}@example.com")
+        at.text_input(key="login_password").input("password")
+        at.button[0].click().run()
+        logged_in = time.perf_counter()
+
+        at.text_input[0].input("Jane")
+        # Distinct context per run so no stored result or cache entry is reused
+        at.text_area[0].input(f"Run {n}: I lead a platform team, mentor engineers and want to grow into architecture.")
+        at.button(key="FormSubmitter:initial_context_form-Submit Initial Information").click().run()
+        # Questions stream in from a background job; the first one is usable before the rest arrive
+        first_question = None
+        while at.session_state.questions_job_id:
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+            if first_question is None and at.session_state.questions_data:
+                first_question = time.perf_counter()
+            time.sleep(0.02)
+            at.run()
+        asked = time.perf_counter()
+        first_question = first_question or asked
+
+        # AppTest always reruns the whole script, so the questionnaire fragment's own
+        # run time stands in for what a fragment-scoped navigation rerun executes
+        navigate, navigate_fragment = [], []
+        while any(b.label == "Next Question" for b in at.button):
+            clicked = time.perf_counter()
+            [b for b in at.button if b.label == "Next Question"][0].click().run()
+            navigate.append(time.perf_counter() - clicked)
+            navigate_fragment.append(get_rerun_metrics().latest("questionnaire"))
+        navigated = time.perf_counter()
+
+        for i in range(len(at.session_state.questions_data)):
+            at.session_state[f"response_{i}"] = f"Answer {i} with a concrete example."
+            at.session_state.responses[i] = f"Answer {i} with a concrete example."
+        submit = [b for b in at.button if "Submit" in b.label and "Initial" not in b.label]
+        submit[0].click().run()
+        while not at.session_state.analysis_result:
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+            time.sleep(0.05)
+            at.run()
+        finished = time.perf_counter()
+
+        if trace:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return traced_peak
+        if not record:
+            return 0
+        phases["login"].append(logged_in - started)
+        phases["first_question"].append(first_question - logged_in)
+        phases["questions"].append(asked - logged_in)
+        phases["navigate"].extend(navigate)
+        phases["navigate_fragment"].extend(navigate_fragment)
+        phases["analysis"].append(finished - navigated)
+        phases["total"].append(finished - started)
+        return 0
+
+    run_once("warmup", record=False)
+    for n in range(args.e2e_iterations):
+        run_once(n)
+    peak = run_once("traced", trace=True)
+
+    results = {}
+    for phase, times in phases.items():
+        results[f"e2e.{phase}"] = {
+            "iterations": len(times),
+            "p50_ms": round(percentile(times, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(times, 0.95) * 1000, 3),
+            "throughput_per_sec": round(len(times) / sum(times), 3),
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline and return the names that regressed beyond threshold."""
+    regressions = []
+    print(f"{'stage':34} {'p50 ms':>10} {'p95 ms':>10} {'per sec':>10} {'peak KB':>10} {'p50 vs base':>12}")
+    for name, stats in results.items():
+        base = baseline.get(name)
+        delta = ""
+        if base and base["p50_ms"]:
+            change = stats["p50_ms"] / base["p50_ms"] - 1
+            delta = f"{change:+.0%}"
+            # Sub-millisecond stages are too noisy for a relative threshold alone
+            if change > threshold and stats["p50_ms"] - base["p50_ms"] > MIN_REGRESSION_MS:
+                regressions.append(name)
+                delta += " !"
+        print(f"{name:34} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} "
+              f"{stats['throughput_per_sec']:>10.2f} {stats['peak_memory_kb']:>10.0f} {delta:>12}")
+    return regressions
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the brand pipeline.")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--iterations", type=int, default=10, help="timed iterations per micro-benchmark")
+    parser.add_argument("--e2e-iterations", type=int, default=3, help="timed runs of the full app flow")
+    parser.add_argument("--startup-iterations", type=int, default=5, help="fresh processes per entry point")
+    parser.add_argument("--openai-latency", type=float, default=0.2, help="fake OpenAI seconds to first byte")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="fake OpenAI seconds per streamed word")
+    parser.add_argument("--supabase-latency", type=float, default=0.05, help="fake Supabase seconds per call")
+    parser.add_argument("--baseline", default="baseline", help="baseline name under benchmarks/baselines/")
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="p50 slowdown that counts as a regression")
+    parser.add_argument("--output", help="also write the results JSON here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.workdir = tempfile.mkdtemp(prefix="brand-bench-")
+    # Isolate every cache and store from the developer's .cache/ and make LLM calls real
+    os.environ.update(
+        LLM_CACHE_DISABLED="1",
+        LLM_CACHE_PATH=os.path.join(args.workdir, "llm.sqlite3"),
+        EXTRACTION_CACHE_PATH=os.path.join(args.workdir, "extraction.sqlite3"),
+        REPORT_CACHE_PATH=os.path.join(args.workdir, "reports.sqlite3"),
+        RESULTS_STORE="supabase",
+        SUPABASE_URL="http://fake-supabase",
+        SUPABASE_KEY="fake-key",
+        OPENAI_API_KEY="sk-bench",
+        LOG_LEVEL="WARNING",
+    )
+    cwd = os.getcwd()
+    os.chdir(args.workdir)
+
+    server = None
+    if "e2e" in args.suites:
+        from benchmarks.fakes import FakeOpenAIServer
+        server = FakeOpenAIServer(latency=args.openai_latency, token_delay=args.token_delay).start()
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    suites = {
+        "extraction": bench_extraction,
+        "prompt": bench_prompt,
+        "questions": bench_questions,
+        "figures": bench_figures,
+        "drafts": bench_drafts,
+        "pdf": bench_pdf,
+        "startup": bench_startup,
+        "e2e": bench_e2e,
+    }
+    results = {}
+    try:
+        for name in args.suites:
+            print(f"running {name}...", file=sys.stderr)
+            results.update(suites[name](args))
+    finally:
+        if server:
+            server.stop()
+        os.chdir(cwd)
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+    baseline_path = os.path.join(BASELINE_DIR, f"{args.baseline}.json")
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r") as file:
+            baseline = json.load(file).get("results", {})
+    regressions = compare(results, baseline, args.threshold)
+
+    document = {
+        "environment": environment(),
+        "settings": {
+            "iterations": args.iterations,
+            "e2e_iterations": args.e2e_iterations,
+            "openai_latency": args.openai_latency,
+            "token_delay": args.token_delay,
+            "supabase_latency": args.supabase_latency,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(document, file, indent=2, sort_keys=True)
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        # Merge so saving one suite keeps the others' numbers
+        document["results"] = dict(baseline, **results)
+        with open(baseline_path, "w") as file:
+            json.dump(document, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"saved baseline to {baseline_path}", file=sys.stderr)
+    elif regressions:
+        print(f"regressions over {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Time to first paint of one Streamlit entry point in a fresh process.
+
+    python -m benchmarks.startup agent-based-brand-builder-with-supabase.py
+
+Streamlit itself is imported before the clock starts, as a running server
+already has it loaded; what is timed is the first script run of a new
+process, which is what the first visitor after a deploy or scale-out waits
+for. Prints one JSON line with the time, the process's peak RSS (Streamlit
+included), and which heavy modules and clients that first run loaded. Used by the
+startup suite of benchmarks/run.py.
+"""
+import json
+import os
+import resource
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+HEAVY_MODULES = ("openai", "reportlab", "PyPDF2", "docx", "numpy")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    from streamlit.testing.v1 import AppTest
+    from benchmarks.fakes import install_fake_supabase
+
+    install_fake_supabase(0)
+    clients = []
+    module = sys.modules["supabase"]
+    create_client = module.create_client
+    module.create_client = lambda url, key: clients.append(url) or create_client(url, key)
+
+    app = AppTest.from_file(os.path.join(REPO_DIR, argv[0]), default_timeout=120)
+    app.secrets["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY", "sk-bench")
+    started = time.perf_counter()
+    app.run()
+    elapsed = time.perf_counter() - started
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    if clients:
+        loaded.append("supabase client")
+    print(json.dumps({
+        "first_paint_ms": round(elapsed * 1000, 1),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "loaded": loaded,
+    }))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Synthetic uploads for the extraction and prompt assembly benchmarks."""
+import io
+import random
+
+import docx
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate
+
+from document_extraction import DOCX_MIME, PDF_MIME, TXT_MIME
+
+WORDS = (
+    "led platform team delivered migration mentored engineers designed architecture improved reliability "
+    "reduced costs customers stakeholders roadmap strategy data analytics cloud security hiring coaching "
+    "presented conference launched product partnered sales research prototype automation quality metrics"
+).split()
+
+
+def paragraph(rng, words=80):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+class SyntheticUpload:
+    """Quacks like a Streamlit UploadedFile: name, type and getvalue()."""
+
+    def __init__(self, name, mime_type, data):
+        self.name = name
+        self.type = mime_type
+        self._data = data
+        self.size = len(data)
+
+    def getvalue(self):
+        return self._data
+
+
+def make_pdf(pages, seed=0):
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    style = getSampleStyleSheet()["Normal"]
+    content = []
+    for page in range(pages):
+        content.extend(Paragraph(paragraph(rng), style) for _ in range(6))
+        content.append(Paragraph(f"Page {page + 1} of {pages}", style))
+        content.append(PageBreak())
+    SimpleDocTemplate(buffer, pagesize=letter, invariant=1).build(content)
+    return SyntheticUpload(f"resume-{pages}p.pdf", PDF_MIME, buffer.getvalue())
+
+
+def make_docx(paragraphs, seed=0):
+    rng = random.Random(seed)
+    document = docx.Document()
+    for _ in range(paragraphs):
+        document.add_paragraph(paragraph(rng))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return SyntheticUpload(f"statement-{paragraphs}para.docx", DOCX_MIME, buffer.getvalue())
+
+
+def make_txt(kilobytes, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    while size < kilobytes * 1024:
+        line = paragraph(rng, 20)
+        lines.append(line)
+        size += len(line) + 1
+    return SyntheticUpload(f"notes-{kilobytes}kb.txt", TXT_MIME, "\n".join(lines).encode("utf-8"))
+
+
+def upload_set(size="medium"):
+    """A typical mix of uploads: small, medium or large."""
+    if size == "small":
+        return [make_pdf(2), make_docx(10), make_txt(4)]
+    if size == "large":
+        return [make_pdf(120), make_docx(400), make_txt(512)]
+    return [make_pdf(20), make_docx(60), make_txt(64)]
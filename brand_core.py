@@ -0,0 +1,135 @@
+"""Settings and API clients shared by the three Streamlit entry points.
+
+Streamlit runs an entry point from the top on every page load, and the first
+run in a new process pays for every import before anything is drawn. The
+OpenAI and Supabase SDKs are therefore imported here on first use, and their
+clients are built only when a code path needs one, not when the page loads.
+The same rule applies to the other heavy modules: reportlab (report_engine),
+numpy (figure_index), PyPDF2 and docx (document_extraction) are imported
+inside the functions that use them. `python -m benchmarks.run --suites
+startup` measures time to first paint for each entry point.
+"""
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Renew the user's access token once it has less than this left. Background
+# jobs hold the token they were started with, so this covers the longest job.
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN", "900"))
+
+
+def get_setting(name):
+    """A setting from the environment (or .env), falling back to Streamlit secrets."""
+    return os.getenv(name) or st.secrets.get(name)
+
+
+_openai_clients = {}
+_openai_clients_lock = threading.Lock()
+
+
+def get_openai_client(api_key):
+    """The process-wide OpenAI client for this API key, created on first use."""
+    with _openai_clients_lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            from openai import OpenAI
+
+            client = _openai_clients[api_key] = OpenAI(api_key=api_key)
+        return client
+
+
+def async_openai_client(api_key):
+    """A new AsyncOpenAI client. Not shared: its connections belong to the event loop that opens them."""
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=api_key)
+
+
+def supabase_credentials():
+    """(url, key) for Supabase; stops the page with setup instructions when either is missing."""
+    supabase_url = get_setting("SUPABASE_URL")
+    supabase_key = get_setting("SUPABASE_KEY")
+
+    if not supabase_url or not supabase_key:
+        st.error("""
+            Please set up your Supabase credentials:
+            - For local development: Add them to your .env file
+            - For Streamlit Cloud: Add them to your app secrets
+            """)
+        st.stop()
+
+    return supabase_url, supabase_key
+
+
+def init_supabase():
+    """Initialize Supabase client with credentials from environment variables."""
+    from supabase import create_client
+
+    return create_client(*supabase_credentials())
+
+
+def get_supabase():
+    """This session's Supabase client, created the first time the session needs one.
+
+    Not shared between sessions, because it is authenticated with the
+    signed-in user's access token.
+    """
+    client = st.session_state.get("_supabase_client")
+    if client is None:
+        client = st.session_state["_supabase_client"] = init_supabase()
+        if st.session_state.get("access_token"):
+            client.postgrest.auth(st.session_state.access_token)
+    return client
+
+
+def remember_auth_session(session):
+    """Keep the tokens of a signed-in Supabase session in session state (in this process only, see session_store).
+
+    Database requests made through this session's client carry the new access
+    token from here on, so the stores never have to authenticate it themselves.
+    """
+    st.session_state.access_token = getattr(session, "access_token", None)
+    st.session_state.refresh_token = getattr(session, "refresh_token", None)
+    st.session_state.token_expires_at = getattr(session, "expires_at", None)
+    if st.session_state.access_token:
+        get_supabase().postgrest.auth(st.session_state.access_token)
+
+
+def refresh_access_token(margin=TOKEN_REFRESH_MARGIN_SECONDS):
+    """Keep the signed-in user's access token current, renewing it when it is about to expire.
+
+    The Supabase client renews the session it signed in with by itself, which
+    retires the refresh token kept in session state, so its session is adopted
+    whenever it has one. A client created for a reloaded page has none, and
+    the refresh token kept in session state is used instead.
+
+    Returns False only when the token has expired and could not be renewed,
+    i.e. the user has to log in again.
+    """
+    if not st.session_state.get("refresh_token"):
+        return True
+    expires_at = st.session_state.get("token_expires_at") or 0
+    client = get_supabase()
+    try:
+        session = client.auth.get_session()
+        if session is None and expires_at - time.time() <= margin:
+            session = client.auth.refresh_session(st.session_state.refresh_token).session
+        elif session is not None and (session.expires_at or 0) - time.time() <= margin:
+            session = client.auth.refresh_session(session.refresh_token).session
+    except Exception as e:
+        logger.warning("Refreshing the access token failed: %s", e)
+        session = None
+    if session is not None:
+        if session.access_token != st.session_state.access_token:
+            remember_auth_session(session)
+        return True
+    # Still usable until it expires; the next run tries again
+    return expires_at > time.time()
@@ -0,0 +1,110 @@
+"""In-memory BM25 index over uploaded document chunks.
+
+Extracted documents are split into overlapping word windows and indexed once
+per submission. Each pipeline stage then retrieves only the top-k chunks that
+match its own task instead of receiving every document in full, which keeps
+prompts small even when several long documents are uploaded.
+"""
+import math
+import os
+from collections import Counter
+
+from context_compressor import content_words
+
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", "120"))
+CHUNK_OVERLAP_WORDS = int(os.getenv("CHUNK_OVERLAP_WORDS", "30"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+# Characters of document text read into the index (far more than fits in one prompt)
+INDEX_CHAR_BUDGET = int(os.getenv("INDEX_CHAR_BUDGET", "400000"))
+
+# What each stage looks for in the user's documents
+STAGE_QUERIES = {
+    "questions": (
+        "career goals role responsibilities achievements projects impact skills expertise strengths "
+        "values passions leadership mentoring team industry transition aspirations"
+    ),
+    "analysis": (
+        "achievements impact results strengths expertise unique value proposition differentiators "
+        "leadership recognition awards skills experience professional identity"
+    ),
+}
+
+
+def chunk_documents(docs, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP_WORDS):
+    """Split {"filename", "content"} documents into overlapping word windows."""
+    step = max(1, chunk_words - overlap)
+    chunks = []
+    for doc in docs:
+        words = doc["content"].split()
+        for start in range(0, len(words), step):
+            window = words[start:start + chunk_words]
+            if not window:
+                break
+            chunks.append({
+                "id": len(chunks),
+                "filename": doc["filename"],
+                "text": " ".join(window),
+            })
+            if start + chunk_words >= len(words):
+                break
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of chunks."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(content_words(chunk["text"])) for chunk in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_frequencies]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequencies = Counter(term for tf in self.term_frequencies for term in tf)
+        count = len(chunks)
+        self.idf = {
+            term: math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for term, df in document_frequencies.items()
+        }
+
+    @classmethod
+    def from_documents(cls, docs, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP_WORDS):
+        return cls(chunk_documents(docs, chunk_words, overlap))
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """Return up to k (score, chunk) pairs for query, best first."""
+        terms = [term for term in set(content_words(query)) if term in self.idf]
+        if not terms or not self.chunks:
+            return []
+        scores = []
+        for index, tf in enumerate(self.term_frequencies):
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.average_length or 1))
+            score = 0.0
+            for term in terms:
+                frequency = tf.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            if score > 0:
+                scores.append((score, index))
+        scores.sort(reverse=True)
+        return [(score, self.chunks[index]) for score, index in scores[:k]]
+
+    def retrieve_documents(self, query, k=RETRIEVAL_TOP_K):
+        """Top-k chunks for query, regrouped per file in document order.
+
+        Returns {"filename", "content"} dicts so the result can be fed to the
+        compressor and prompt formatting like whole documents.
+        """
+        hits = sorted((chunk for _, chunk in self.search(query, k)), key=lambda chunk: chunk["id"])
+        grouped = {}
+        for chunk in hits:
+            grouped.setdefault(chunk["filename"], []).append(chunk["text"])
+        return [{"filename": filename, "content": "\n...\n".join(texts)} for filename, texts in grouped.items()]
+
+
+def stage_query(stage, *extra_text):
+    """Build a retrieval query for a stage, optionally enriched with user text."""
+    return " ".join([STAGE_QUERIES[stage], *[text for text in extra_text if text]])
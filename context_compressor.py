@@ -0,0 +1,212 @@
+"""Local extractive compression of uploaded document text.
+
+Before any OpenAI call, uploaded documents are cut down to a token budget:
+repeated page furniture (headers, footers, page numbers) is stripped,
+sentences that repeat what the user already typed are dropped, and the
+remaining sentences are ranked extractively so the most informative ones fit
+the budget. Sentences are split with spaCy when the model is installed and
+with a simple regex otherwise.
+"""
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+
+# A short line seen this many times is treated as page furniture
+FURNITURE_MIN_REPEATS = 3
+FURNITURE_MAX_CHARS = 80
+# Sentences this similar to the user's own text are dropped
+DUPLICATE_JACCARD = 0.7
+
+_FALLBACK_STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me more most my myself no nor not now of off on
+once only or other our ours ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves
+""".split())
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9+#.'-]*")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])|\n{2,}|\n(?=\s*[-•*]\s)")
+_PAGE_NUMBER_RE = re.compile(r"^\s*(page\s*)?\d+(\s*(of|/)\s*\d+)?\s*$", re.IGNORECASE)
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Approximate the GPT token count of text (about 4 characters per token)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def _load_nlp():
+    """Load a lightweight spaCy pipeline once, or return None if spaCy is unavailable."""
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            try:
+                import spacy
+                _nlp = spacy.load(SPACY_MODEL, disable=["ner", "lemmatizer", "tagger", "attribute_ruler"])
+            except (ImportError, OSError) as e:
+                logger.info("spaCy unavailable (%s); using regex sentence splitting", e)
+                _nlp = False
+        return _nlp or None
+
+
+def _stop_words():
+    try:
+        from spacy.lang.en.stop_words import STOP_WORDS
+        return STOP_WORDS
+    except ImportError:
+        return _FALLBACK_STOP_WORDS
+
+
+def split_sentences(text):
+    """Split text into sentences, keeping bullet points and short lines as their own units."""
+    nlp = _load_nlp()
+    sentences = []
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        if nlp is not None:
+            sentences.extend(sent.text.strip() for sent in nlp(block).sents)
+        else:
+            sentences.extend(part.strip() for part in _SENTENCE_RE.split(block))
+    return [sentence for sentence in sentences if sentence]
+
+
+def content_words(text, stop_words=None):
+    """Lowercased words of text with stop words removed."""
+    stop_words = _stop_words() if stop_words is None else stop_words
+    return [word for word in (w.lower().strip(".'-") for w in _WORD_RE.findall(text)) if word and word not in stop_words]
+
+
+def strip_page_furniture(text):
+    """Remove short lines that repeat across pages (headers, footers) and bare page numbers.
+
+    Returns (text, removed_line_count).
+    """
+    lines = text.split("\n")
+    counts = Counter(line.strip() for line in lines if 0 < len(line.strip()) <= FURNITURE_MAX_CHARS)
+    furniture = {line for line, count in counts.items() if count >= FURNITURE_MIN_REPEATS}
+    kept = []
+    removed = 0
+    for line in lines:
+        stripped = line.strip()
+        if stripped in furniture or (stripped and _PAGE_NUMBER_RE.match(stripped)):
+            removed += 1
+            continue
+        kept.append(line)
+    return "\n".join(kept), removed
+
+
+class CompressionReport:
+    """What the compressor removed and how many tokens that saved."""
+
+    def __init__(self):
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.furniture_lines = 0
+        self.duplicate_sentences = 0
+        self.dropped_sentences = 0
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_before - self.tokens_after
+
+    def as_dict(self):
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+            "furniture_lines": self.furniture_lines,
+            "duplicate_sentences": self.duplicate_sentences,
+            "dropped_sentences": self.dropped_sentences,
+        }
+
+
+def compress_documents(docs, initial_context="", token_budget=CONTEXT_TOKEN_BUDGET):
+    """Compress extracted documents to fit token_budget.
+
+    docs is a list of {"filename", "content"} dicts as produced by
+    document_extraction. Returns (compressed_docs, CompressionReport).
+    """
+    report = CompressionReport()
+    report.tokens_before = sum(estimate_tokens(doc["content"]) for doc in docs)
+    stop_words = _stop_words()
+
+    user_sentences = [set(content_words(s, stop_words)) for s in split_sentences(initial_context)]
+    user_sentences = [words for words in user_sentences if words]
+    normalized_user_text = " ".join(initial_context.lower().split())
+
+    # (doc index, position, sentence, content words)
+    candidates = []
+    for doc_index, doc in enumerate(docs):
+        text, removed = strip_page_furniture(doc["content"])
+        report.furniture_lines += removed
+        seen = set()
+        for position, sentence in enumerate(split_sentences(text)):
+            normalized = " ".join(sentence.lower().split())
+            words = content_words(sentence, stop_words)
+            if normalized in seen:
+                report.duplicate_sentences += 1
+                continue
+            seen.add(normalized)
+            copied = len(normalized) >= 20 and normalized in normalized_user_text
+            if copied or _duplicates_user_text(set(words), user_sentences):
+                report.duplicate_sentences += 1
+                continue
+            candidates.append((doc_index, position, sentence, words))
+
+    frequencies = Counter(word for *_, words in candidates for word in words)
+    top_frequency = max(frequencies.values(), default=1)
+    sentence_counts = Counter(doc_index for doc_index, *_ in candidates)
+
+    def score(candidate):
+        doc_index, position, _, words = candidate
+        if not words:
+            return 0.0
+        centrality = sum(frequencies[word] / top_frequency for word in set(words)) / math.sqrt(len(words))
+        # Resumes and statements front-load their summaries
+        lead_bonus = 1.0 + 0.2 * (1.0 - position / max(1, sentence_counts[doc_index]))
+        return centrality * lead_bonus
+
+    selected = []
+    used = 0
+    for candidate in sorted(candidates, key=score, reverse=True):
+        cost = estimate_tokens(candidate[2]) + 1
+        if used + cost > token_budget:
+            report.dropped_sentences += 1
+            continue
+        selected.append(candidate)
+        used += cost
+
+    selected.sort(key=lambda candidate: (candidate[0], candidate[1]))
+    compressed = []
+    for doc_index, doc in enumerate(docs):
+        sentences = [sentence for index, _, sentence, _ in selected if index == doc_index]
+        if sentences:
+            compressed.append({"filename": doc["filename"], "content": "\n".join(sentences)})
+
+    report.tokens_after = sum(estimate_tokens(doc["content"]) for doc in compressed)
+    logger.info("context compression %s", report.as_dict())
+    return compressed, report
+
+
+def _duplicates_user_text(words, user_sentences):
+    if not words:
+        return False
+    for user_words in user_sentences:
+        overlap = len(words & user_words)
+        if overlap and overlap / len(words | user_words) >= DUPLICATE_JACCARD:
+            return True
+    return False
@@ -0,0 +1,303 @@
+"""Text extraction for uploaded documents.
+
+Files are read straight from their uploaded bytes (PyPDF2 and python-docx both
+accept in-memory buffers), extracted in parallel on a thread pool, and large
+PDFs are split page-range by page-range across a process pool and reassembled
+in page order. Each file gets a time budget, counted from when a worker picks
+it up, so one bad PDF cannot stall the others, and the whole upload gets an
+overall budget the caller waits on at most.
+
+Extracted text is cached by the SHA-256 of the file bytes and the extractor
+version in a disk-backed tier shared by every session, so a resubmitted or
+commonly used document is only parsed once.
+
+Extractors are generators that yield pages, paragraphs or lines. Callers can
+pass a character budget so reading stops once enough text has been collected,
+which keeps memory flat however large the upload is.
+"""
+import concurrent.futures
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from llm_cache import TieredCache
+
+logger = logging.getLogger(__name__)
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TXT_MIME = "text/plain"
+
+# PDFs with at least this many pages are split across the process pool
+PARALLEL_PDF_MIN_PAGES = int(os.getenv("EXTRACTION_PARALLEL_PDF_MIN_PAGES", "40"))
+PDF_PAGES_PER_CHUNK = int(os.getenv("EXTRACTION_PDF_PAGES_PER_CHUNK", "16"))
+FILE_TIME_BUDGET_SECONDS = float(os.getenv("EXTRACTION_FILE_TIME_BUDGET", "30"))
+TOTAL_TIME_BUDGET_SECONDS = float(os.getenv("EXTRACTION_TOTAL_TIME_BUDGET", "60"))
+MAX_FILE_WORKERS = int(os.getenv("EXTRACTION_MAX_FILE_WORKERS", "8"))
+# Characters of document text allowed into a prompt (roughly 4 characters per token)
+CONTEXT_CHAR_BUDGET = int(os.getenv("CONTEXT_CHAR_BUDGET", "20000"))
+
+# Bump whenever extraction output changes so stale cache entries are ignored
+EXTRACTOR_VERSION = "3"
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", os.path.join(".cache", "extraction_cache.sqlite3"))
+EXTRACTION_CACHE_DISK_BYTES = int(os.getenv("EXTRACTION_CACHE_DISK_BYTES", str(500 * 1024 * 1024)))
+EXTRACTION_CACHE_MEMORY_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MEMORY_ENTRIES", "64"))
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Return the shared process pool used to split large PDFs."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=max(1, min(4, os.cpu_count() or 1)),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+_extraction_cache = None
+_extraction_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """Return the process-wide cache of extracted document text."""
+    global _extraction_cache
+    with _extraction_cache_lock:
+        if _extraction_cache is None:
+            _extraction_cache = TieredCache(
+                path=EXTRACTION_CACHE_PATH,
+                namespace="extraction",
+                ttl=None,
+                max_memory_entries=EXTRACTION_CACHE_MEMORY_ENTRIES,
+                max_disk_bytes=EXTRACTION_CACHE_DISK_BYTES,
+            )
+        return _extraction_cache
+
+
+def extraction_cache_key(mime_type, data, max_chars=None):
+    """Key extracted text by content hash, MIME type, extractor version and size cap."""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{EXTRACTOR_VERSION}:{mime_type}:{digest}:{max_chars or 'all'}"
+
+
+def iter_pdf_pages(data, start=0, stop=None):
+    """Yield the text of each page of a PDF held in memory."""
+    import PyPDF2
+
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
+    stop = len(pdf_reader.pages) if stop is None else stop
+    for i in range(start, stop):
+        yield (pdf_reader.pages[i].extract_text() or "") + "\n"
+
+
+def iter_docx_paragraphs(data):
+    """Yield each paragraph of a DOCX document held in memory."""
+    import docx
+
+    doc = docx.Document(io.BytesIO(data))
+    for paragraph in doc.paragraphs:
+        yield paragraph.text + "\n"
+
+
+def iter_txt_lines(data):
+    """Yield the lines of a UTF-8 text file without decoding it all at once."""
+    with io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='replace', newline='') as text:
+        yield from text
+
+
+def take_text(pieces, max_chars=None):
+    """Join pieces until max_chars is reached, then stop reading.
+
+    Returns (text, truncated).
+    """
+    parts = []
+    size = 0
+    truncated = False
+    try:
+        for piece in pieces:
+            if max_chars is not None and size + len(piece) >= max_chars:
+                parts.append(piece[:max_chars - size])
+                truncated = True
+                break
+            parts.append(piece)
+            size += len(piece)
+    finally:
+        close = getattr(pieces, "close", None)
+        if close:
+            close()
+    return "".join(parts), truncated
+
+
+def extract_pdf_pages(data, start, stop):
+    """Extract pages [start, stop) of a PDF held in memory."""
+    return list(iter_pdf_pages(data, start, stop))
+
+
+def extract_text_from_pdf(data, deadline=None, max_chars=None):
+    """Extract text from PDF bytes, fanning large documents out across the process pool."""
+    import PyPDF2
+
+    page_count = len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+    if page_count < PARALLEL_PDF_MIN_PAGES:
+        return take_text(iter_pdf_pages(data), max_chars)[0]
+
+    pool = get_process_pool()
+    futures = [
+        pool.submit(extract_pdf_pages, data, start, min(start + PDF_PAGES_PER_CHUNK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_CHUNK)
+    ]
+
+    def pages():
+        # Futures are consumed in submission order, which keeps pages in order
+        for future in futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            yield from future.result(timeout=remaining)
+
+    try:
+        return take_text(pages(), max_chars)[0]
+    finally:
+        # Page ranges past the budget are never needed
+        for future in futures:
+            future.cancel()
+
+
+def extract_text_from_docx(data, max_chars=None):
+    """Extract text from DOCX bytes."""
+    return take_text(iter_docx_paragraphs(data), max_chars)[0]
+
+
+def extract_text_from_txt(data, max_chars=None):
+    """Extract text from TXT bytes."""
+    return take_text(iter_txt_lines(data), max_chars)[0]
+
+
+def extract_document(mime_type, data, deadline=None, max_chars=None):
+    """Extract the text of one document given its MIME type and raw bytes."""
+    if mime_type == PDF_MIME:
+        return extract_text_from_pdf(data, deadline, max_chars)
+    elif mime_type == DOCX_MIME:
+        return extract_text_from_docx(data, max_chars)
+    elif mime_type == TXT_MIME:
+        return extract_text_from_txt(data, max_chars)
+    return f"Unsupported file type: {mime_type}"
+
+
+def _extract_on_worker(task, mime_type, data, time_budget, max_chars):
+    """Extract one upload on a worker thread; its time budget starts now, not when it was queued."""
+    task["deadline"] = time.monotonic() + time_budget
+    task["started"].set()
+    return extract_document(mime_type, data, task["deadline"], max_chars)
+
+
+def iter_uploaded_files(files, time_budget=FILE_TIME_BUDGET_SECONDS, cache=None, max_chars=None,
+                        total_budget=TOTAL_TIME_BUDGET_SECONDS):
+    """Yield {"filename", "content"} for each upload in order as it becomes ready.
+
+    Files are extracted in parallel, each capped at max_chars and time_budget
+    seconds of work. Files still queued or running total_budget seconds after
+    the call are given up on. Only bytes that have not been seen before are
+    extracted; the rest come from the cache. Closing the generator early
+    cancels extraction of the remaining files.
+    """
+    if not files:
+        return
+
+    cache = cache or get_extraction_cache()
+    jobs = []
+    pending = []
+    for file in files:
+        data = file.getvalue()
+        key = extraction_cache_key(file.type, data, max_chars)
+        cached = cache.get(key)
+        jobs.append((file, key, cached))
+        if cached is None:
+            pending.append((file, data))
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, min(MAX_FILE_WORKERS, len(pending))),
+        thread_name_prefix="extract",
+    )
+    overall_deadline = time.monotonic() + total_budget
+    futures = {}
+    for file, data in pending:
+        task = {"started": threading.Event(), "deadline": None}
+        futures[id(file)] = (task, executor.submit(_extract_on_worker, task, file.type, data, time_budget, max_chars))
+    del pending
+
+    try:
+        for file, key, text in jobs:
+            if text is None:
+                task, future = futures[id(file)]
+                try:
+                    # A file still queued behind slow ones only waits for the overall deadline
+                    if not task["started"].wait(max(0.0, overall_deadline - time.monotonic())):
+                        raise concurrent.futures.TimeoutError()
+                    deadline = min(task["deadline"], overall_deadline)
+                    text = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                    cache.set(key, text)
+                except concurrent.futures.TimeoutError:
+                    if time.monotonic() >= overall_deadline:
+                        logger.warning("Extraction of %s did not finish within the %.0fs upload budget", file.name, total_budget)
+                        text = f"Could not extract {file.name} within {total_budget:.0f} seconds."
+                    else:
+                        logger.warning("Extraction of %s exceeded %.0fs budget", file.name, time_budget)
+                        text = f"Could not extract {file.name} within {time_budget:.0f} seconds."
+                except Exception as e:
+                    logger.warning("Extraction of %s failed: %s", file.name, e)
+                    text = f"Could not extract {file.name}: {e}"
+            yield {
+                "filename": file.name,
+                "content": text
+            }
+    finally:
+        # Do not wait for stragglers that blew their budget or are no longer needed
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def process_uploaded_files(files, time_budget=FILE_TIME_BUDGET_SECONDS, cache=None, max_chars=None,
+                           total_budget=TOTAL_TIME_BUDGET_SECONDS):
+    """Process all uploaded files and extract their content, preserving upload order."""
+    return list(iter_uploaded_files(files, time_budget, cache, max_chars, total_budget))
+
+
+def collect_documents(files, max_chars=CONTEXT_CHAR_BUDGET):
+    """Read uploaded documents lazily until max_chars of text has been collected."""
+    collected = []
+    remaining = max_chars
+    docs = iter_uploaded_files(files, max_chars=max_chars)
+    try:
+        for doc in docs:
+            if remaining <= 0:
+                break
+            content = doc['content'][:remaining]
+            remaining -= len(content)
+            collected.append({
+                "filename": doc['filename'],
+                "content": content
+            })
+    finally:
+        docs.close()
+    return collected
+
+
+def format_document_context(initial_context, docs):
+    """Append extracted document text to the user's own context for a prompt."""
+    if not docs:
+        return initial_context
+    parts = [initial_context, "\n\nAdditional information from uploaded documents:\n"]
+    for doc in docs:
+        parts.append(f"\nContent from {doc['filename']}:\n{doc['content']}\n")
+    return "".join(parts)
+
+
+def build_document_context(initial_context, files, max_chars=CONTEXT_CHAR_BUDGET):
+    """Append uploaded document text to the user's context, stopping once max_chars of documents are in."""
+    return format_document_context(initial_context, collect_documents(files, max_chars))
@@ -0,0 +1,354 @@
+"""Write-behind autosave of questionnaire answers that have not been submitted yet.
+
+Every rerun hands the current answers to the process-wide DraftAutosaver,
+which only keeps the ones that changed since they were last sent. A background
+thread writes them once the user has paused typing for DRAFT_DEBOUNCE_SECONDS,
+after DRAFT_MAX_DELAY_SECONDS at the latest, or right away when asked to (on
+navigation). Each write is one upsert of the changed answers only, one row per
+question, so a long answer being typed costs one write per pause instead of one
+per rerun. The rows are restored when the user logs in again.
+
+Drafts are kept in the backend chosen by RESULTS_STORE, next to the results.
+The Supabase table is created with SUPABASE_SCHEMA below.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+
+from results_store import RESULTS_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+DRAFTS_TABLE = "questionnaire_drafts"
+DRAFT_DEBOUNCE_SECONDS = float(os.getenv("DRAFT_DEBOUNCE_SECONDS", "2"))
+DRAFT_MAX_DELAY_SECONDS = float(os.getenv("DRAFT_MAX_DELAY_SECONDS", "10"))
+# Failed writes are retried this many times before the answers wait for the user's next edit
+DRAFT_MAX_ATTEMPTS = int(os.getenv("DRAFT_MAX_ATTEMPTS", "5"))
+# Questionnaires whose last sent answers are remembered for diffing
+DRAFT_TRACKED_MAX = int(os.getenv("DRAFT_TRACKED_MAX", "1000"))
+
+SUPABASE_SCHEMA = """
+create table if not exists questionnaire_drafts (
+    user_id uuid not null references auth.users (id) on delete cascade,
+    questions_key text not null,
+    question_index integer not null,
+    response text not null,
+    updated_at timestamptz not null default now(),
+    primary key (user_id, questions_key, question_index)
+);
+alter table questionnaire_drafts enable row level security;
+create policy "Users manage their own drafts" on questionnaire_drafts
+    for all using (auth.uid() = user_id) with check (auth.uid() = user_id);
+"""
+
+
+class DraftStore(ABC):
+    """Interface shared by every draft backend."""
+
+    @abstractmethod
+    def save_answers(self, user_id, questions_key, answers):
+        """Upsert {question_index: response} for one questionnaire in a single write."""
+
+    @abstractmethod
+    def load_answers(self, user_id, questions_key):
+        """Return {question_index: response} saved for this questionnaire."""
+
+
+class SQLiteDraftStore(DraftStore):
+    """Drafts kept in the local results SQLite file."""
+
+    def __init__(self, path=RESULTS_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {DRAFTS_TABLE} (
+                    user_id TEXT NOT NULL,
+                    questions_key TEXT NOT NULL,
+                    question_index INTEGER NOT NULL,
+                    response TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, questions_key, question_index)
+                )"""
+            )
+            self._conn.commit()
+
+    def save_answers(self, user_id, questions_key, answers):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {DRAFTS_TABLE} (user_id, questions_key, question_index, response, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(str(user_id), questions_key, index, response, now) for index, response in answers.items()],
+            )
+            self._conn.commit()
+
+    def load_answers(self, user_id, questions_key):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT question_index, response FROM {DRAFTS_TABLE} WHERE user_id = ? AND questions_key = ?",
+                (str(user_id), questions_key),
+            ).fetchall()
+        return dict(rows)
+
+
+class SupabaseDraftStore(DraftStore):
+    """Drafts kept in the questionnaire_drafts table behind the app's Supabase client.
+
+    Save errors propagate so the autosaver can try again; load errors are
+    logged and treated as no draft. The client must already carry the
+    signed-in user's access token (brand_core.remember_auth_session).
+    """
+
+    def __init__(self, client, table=DRAFTS_TABLE):
+        self.client = client
+        self.table = table
+
+    def save_answers(self, user_id, questions_key, answers):
+        self.client.table(self.table).upsert(
+            [
+                {
+                    "user_id": str(user_id),
+                    "questions_key": questions_key,
+                    "question_index": index,
+                    "response": response,
+                }
+                for index, response in answers.items()
+            ],
+            on_conflict="user_id,questions_key,question_index",
+        ).execute()
+
+    def load_answers(self, user_id, questions_key):
+        try:
+            response = (
+                self.client.table(self.table)
+                .select("question_index", "response")
+                .eq("user_id", str(user_id))
+                .eq("questions_key", questions_key)
+                .execute()
+            )
+        except Exception as e:
+            logger.warning("Draft lookup failed: %s", e)
+            return {}
+        return {row["question_index"]: row["response"] for row in response.data}
+
+
+_sqlite_store = None
+_sqlite_store_lock = threading.Lock()
+
+
+def get_draft_store(supabase_client=None):
+    """Pick a backend from RESULTS_STORE ("supabase" or "sqlite"), like the results store."""
+    global _sqlite_store
+    backend = os.getenv("RESULTS_STORE", "supabase" if supabase_client is not None else "sqlite")
+    if backend == "supabase":
+        if supabase_client is None:
+            raise ValueError("RESULTS_STORE=supabase needs a Supabase client")
+        return SupabaseDraftStore(supabase_client)
+    if backend == "sqlite":
+        with _sqlite_store_lock:
+            if _sqlite_store is None:
+                _sqlite_store = SQLiteDraftStore()
+            return _sqlite_store
+    raise ValueError(f"Unknown RESULTS_STORE backend: {backend}")
+
+
+class DraftMetrics:
+    """Thread-safe flush counters, with the latencies and batch sizes of recent flushes."""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.changes = 0
+        self.flushes = 0
+        self.rows = 0
+        self.failures = 0
+        self._latencies = deque(maxlen=window)
+        self._batches = deque(maxlen=window)
+
+    def add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def record_flush(self, rows, latency):
+        with self._lock:
+            self.flushes += 1
+            self.rows += rows
+            self._latencies.append(latency)
+            self._batches.append(rows)
+
+    def as_dict(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "updates": self.updates,
+                # Answers that changed between reruns, before coalescing
+                "changes": self.changes,
+                "flushes": self.flushes,
+                "rows": self.rows,
+                "failures": self.failures,
+                "mean_batch": round(sum(self._batches) / len(self._batches), 2) if self._batches else None,
+                "max_batch": max(self._batches) if self._batches else None,
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else None,
+            }
+
+
+class _Pending:
+    """Unsent answers of one questionnaire."""
+
+    def __init__(self, store, now):
+        self.store = store
+        self.answers = {}
+        self.first_change = now
+        self.last_change = now
+        self.urgent = False
+        self.not_before = 0.0
+        self.attempts = 0
+
+
+class DraftAutosaver:
+    """Coalesces answer changes per user and questionnaire and writes them from a background thread."""
+
+    def __init__(self, debounce=DRAFT_DEBOUNCE_SECONDS, max_delay=DRAFT_MAX_DELAY_SECONDS, tracked=DRAFT_TRACKED_MAX,
+                 max_attempts=DRAFT_MAX_ATTEMPTS):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.tracked = tracked
+        self.metrics = DraftMetrics()
+        self._pending = {}
+        self._sent = OrderedDict()  # (user_id, questions_key) -> {index: response} last queued
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def update(self, store, user_id, questions_key, responses):
+        """Queue the answers in responses that differ from what was last queued for this questionnaire."""
+        key = (str(user_id), questions_key)
+        now = time.monotonic()
+        with self._cond:
+            sent = self._sent.pop(key, None)
+            if sent is None:
+                sent = {}
+            self._sent[key] = sent
+            while len(self._sent) > self.tracked:
+                # Forgetting what was sent only means those answers may be sent again
+                self._sent.popitem(last=False)
+            changed = {i: text for i, text in enumerate(responses) if text != sent.get(i, "")}
+            self.metrics.add(updates=1, changes=len(changed))
+            if not changed:
+                return 0
+            sent.update(changed)
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _Pending(store, now)
+            pending.store = store
+            pending.answers.update(changed)
+            pending.last_change = now
+            self._ensure_thread()
+            self._cond.notify()
+            return len(changed)
+
+    def remember(self, user_id, questions_key, answers):
+        """Record answers as already saved, e.g. drafts just restored from the store."""
+        with self._cond:
+            self._sent.setdefault((str(user_id), questions_key), {}).update(answers)
+
+    def request_flush(self, user_id):
+        """Write this user's pending answers now instead of waiting for a pause, without blocking."""
+        with self._cond:
+            for (owner, _), pending in self._pending.items():
+                if owner == str(user_id):
+                    pending.urgent = True
+            self._cond.notify()
+
+    def flush(self, user_id=None):
+        """Write pending answers (all, or one user's) in the calling thread."""
+        with self._cond:
+            keys = [key for key in self._pending if user_id is None or key[0] == str(user_id)]
+            batch = [(key, self._pending.pop(key)) for key in keys]
+        self._write(batch)
+
+    def _due(self, now):
+        due = []
+        wait = None
+        for key, pending in self._pending.items():
+            deadline = min(pending.last_change + self.debounce, pending.first_change + self.max_delay)
+            if pending.urgent:
+                deadline = now
+            deadline = max(deadline, pending.not_before)
+            if deadline <= now:
+                due.append(key)
+            else:
+                wait = deadline - now if wait is None else min(wait, deadline - now)
+        return due, wait
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="draft-autosave", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                due, wait = self._due(time.monotonic())
+                while not due:
+                    self._cond.wait(wait)
+                    due, wait = self._due(time.monotonic())
+                batch = [(key, self._pending.pop(key)) for key in due]
+            self._write(batch)
+
+    def _write(self, batch):
+        for (user_id, questions_key), pending in batch:
+            started = time.perf_counter()
+            try:
+                pending.store.save_answers(user_id, questions_key, pending.answers)
+            except Exception as e:
+                logger.warning("Saving draft answers failed, will retry: %s", e)
+                self.metrics.add(failures=1)
+                self._requeue((user_id, questions_key), pending)
+                continue
+            self.metrics.record_flush(len(pending.answers), time.perf_counter() - started)
+
+    def _requeue(self, key, failed):
+        with self._cond:
+            failed.attempts += 1
+            pending = self._pending.get(key)
+            if pending is None and failed.attempts >= self.max_attempts:
+                # E.g. an expired access token: stop retrying, and send the
+                # answers again with the next edit, which brings a fresh store
+                logger.warning("Giving up on %d draft answers after %d attempts", len(failed.answers), failed.attempts)
+                sent = self._sent.get(key, {})
+                for index, response in failed.answers.items():
+                    if sent.get(index) == response:
+                        del sent[index]
+                return
+            if pending is None:
+                pending = self._pending[key] = failed
+            else:
+                # Newer edits of the same answers win over the failed ones
+                pending.answers = {**failed.answers, **pending.answers}
+            pending.urgent = False
+            pending.not_before = time.monotonic() + self.max_delay
+            self._cond.notify()
+
+
+_autosaver = None
+_autosaver_lock = threading.Lock()
+
+
+def get_draft_autosaver():
+    """The process-wide autosaver."""
+    global _autosaver
+    with _autosaver_lock:
+        if _autosaver is None:
+            _autosaver = DraftAutosaver()
+        return _autosaver
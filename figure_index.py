@@ -0,0 +1,154 @@
+"""Local nearest-neighbour lookup of notable people with a similar personal brand.
+
+similar_figures.json is a curated catalog of positively regarded figures,
+each with a field, trait profile and one-line summary. The profiles are
+turned into L2-normalized TF-IDF vectors (a NumPy matrix) once per process, so
+matching an analysis is one sparse-ish dot product: milliseconds, instead of
+two sequential GPT-4 round trips. An LLM can still be asked to phrase the
+explanations for the chosen figures (see SIMILAR_FIGURES_MODE in the app).
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from context_compressor import content_words
+from template_registry import content_version
+
+FIGURES_PATH = os.getenv("FIGURES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "similar_figures.json"))
+FIGURES_TOP_K = 3
+
+# Trait words count more than the free-text summary when matching
+TRAIT_WEIGHT = 3
+_SUFFIX_RE = re.compile(r"(ings|ing|ers|er|ies|ied|ed|ness|ity|ive|ly|s)$")
+
+
+def stem(word):
+    """Crude suffix stripping so "mentoring", "mentor" and "mentors" meet."""
+    if len(word) <= 4:
+        return word
+    stemmed = _SUFFIX_RE.sub("", word)
+    return stemmed if len(stemmed) >= 3 else word
+
+
+def terms(text):
+    return [stem(word) for word in content_words(text)]
+
+
+def profile_terms(figure):
+    """Weighted terms describing one catalog entry."""
+    weighted = terms(" ".join(figure["traits"])) * TRAIT_WEIGHT
+    return weighted + terms(figure["summary"]) + terms(figure["field"])
+
+
+def load_catalog(path=FIGURES_PATH):
+    with open(path, "r", encoding="utf-8") as file:
+        catalog = json.load(file)
+    figures = catalog["figures"] if isinstance(catalog, dict) else catalog
+    for figure in figures:
+        if not figure.get("name") or not figure.get("traits"):
+            raise ValueError(f"Catalog entry needs a name and traits: {figure!r}")
+    return figures
+
+
+class FigureIndex:
+    """TF-IDF vectors of the catalog profiles with cosine nearest-neighbour search."""
+
+    def __init__(self, figures, version=""):
+        self.figures = list(figures)
+        self.version = version
+        counts = [Counter(profile_terms(figure)) for figure in self.figures]
+        self.trait_terms = [[set(terms(trait)) for trait in figure["traits"]] for figure in self.figures]
+        self.vocabulary = {term: i for i, term in enumerate(sorted({t for c in counts for t in c}))}
+        document_frequency = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for c in counts:
+            for term in c:
+                document_frequency[self.vocabulary[term]] += 1
+        self.idf = np.log((1 + len(self.figures)) / (1 + document_frequency)) + 1
+        self.matrix = np.zeros((len(self.figures), len(self.vocabulary)), dtype=np.float32)
+        for row, c in enumerate(counts):
+            for term, count in c.items():
+                # Sublinear term frequency so one repeated word cannot dominate
+                self.matrix[row, self.vocabulary[term]] = 1 + math.log(count)
+        self.matrix *= self.idf
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.matrix /= np.where(norms == 0, 1, norms)
+
+    @classmethod
+    def from_file(cls, path=FIGURES_PATH):
+        with open(path, "rb") as file:
+            version = content_version(file.read().decode("utf-8"))
+        return cls(load_catalog(path), version)
+
+    def __len__(self):
+        return len(self.figures)
+
+    def vectorize(self, query_terms):
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term, count in Counter(query_terms).items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                vector[column] = 1 + math.log(count)
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def query(self, text, k=FIGURES_TOP_K):
+        """Return up to k (score, figure, shared_traits) for text, best first."""
+        query_terms = terms(text)
+        vector = self.vectorize(query_terms)
+        if not vector.any():
+            return []
+        scores = self.matrix @ vector
+        k = min(k, len(self.figures))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        query_terms = set(query_terms)
+        matches = []
+        for row in best:
+            figure = self.figures[row]
+            shared = [trait for trait, words in zip(figure["traits"], self.trait_terms[row]) if query_terms & words]
+            matches.append((float(scores[row]), figure, shared))
+        return matches
+
+
+def format_matches(matches):
+    """The numbered list shown in the app and the PDF report."""
+    lines = []
+    for n, (_, figure, shared) in enumerate(matches, 1):
+        because = f" Like you, they are known for {', '.join(shared[:3])}." if shared else ""
+        lines.append(f"{n}. {figure['name']} ({figure['field']}) - {figure['summary']}{because}")
+    return "\n".join(lines)
+
+
+def explanation_messages(analysis, matches):
+    """Messages asking a model to phrase why each already chosen figure fits."""
+    chosen = "\n".join(
+        f"- {figure['name']} ({figure['field']}): {figure['summary']} Traits: {', '.join(figure['traits'])}"
+        for _, figure, _ in matches
+    )
+    return [
+        {"role": "system", "content": (
+            "You explain why notable people share a person's personal brand. For each notable figure given, "
+            "write their name and one or two sentences on how their brand aligns with the person's. "
+            "Use only the figures given, in the order given, as a numbered list."
+        )},
+        {"role": "user", "content": f"Personal brand analysis:\n{analysis}\n\nFigures:\n{chosen}"},
+    ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_figure_index():
+    """The process-wide index, built from FIGURES_PATH on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FigureIndex.from_file()
+        return _index
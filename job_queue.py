@@ -0,0 +1,268 @@
+"""Background jobs that outlive a Streamlit script run.
+
+Long LLM work is submitted as a job with a stable ID and runs on a
+process-wide worker pool, so a browser refresh or a dropped websocket does not
+throw it away. Jobs publish partial results while they run; the UI polls for
+them.
+
+Every job's status, partial results and final result are also written to the
+session key-value backend (see session_store), so a rerun served by another
+replica sees the job the same way as the replica running it, and a
+reconnecting session picks up a finished job instead of paying for the
+pipeline again. Partial results are published at most every
+JOB_PUBLISH_INTERVAL seconds. A job whose record has not been updated for
+JOB_STALE_SECONDS is reported as failed, since the process running it is gone.
+A process keeps the jobs it runs and the JOB_CACHE_ENTRIES finished jobs it
+saw last in memory; anything older is read back from the backend.
+"""
+import base64
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+import zlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL", str(7 * 24 * 3600)))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_PUBLISH_INTERVAL = float(os.getenv("JOB_PUBLISH_INTERVAL", "0.5"))
+# Longer than the slowest job is allowed to go without publishing (the analysis stage timeouts add up to 6 minutes)
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "600"))
+# Finished jobs kept in memory; older ones are read back from the backend when asked for
+JOB_CACHE_ENTRIES = int(os.getenv("JOB_CACHE_ENTRIES", "256"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """State of one background job."""
+
+    def __init__(self, job_id, kind, owner=None):
+        self.id = job_id
+        self.kind = kind
+        self.owner = owner
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.updated_at = self.created_at
+        self.partial = {}
+        self.result = None
+        self.error = None
+        self.error_stage = None
+        self.on_partial = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def set_partial(self, stage, text):
+        """Publish the text produced so far for a stage."""
+        with self._lock:
+            self.partial[stage] = text
+        if self.on_partial is not None:
+            self.on_partial(self)
+
+    def snapshot(self):
+        """Return a consistent copy of the partial results."""
+        with self._lock:
+            return dict(self.partial)
+
+    def to_dict(self):
+        result = dict(self.result or {})
+        for key, value in result.items():
+            if isinstance(value, bytes):
+                result[key] = {"__bytes__": base64.b64encode(value).decode()}
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "owner": self.owner,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "updated_at": self.updated_at,
+            "partial": self.snapshot(),
+            "result": result,
+            "error": self.error,
+            "error_stage": self.error_stage,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data["id"], data["kind"], data.get("owner"))
+        job.status = data["status"]
+        job.created_at = data["created_at"]
+        job.started_at = data.get("started_at")
+        job.finished_at = data.get("finished_at")
+        job.updated_at = data.get("updated_at") or job.finished_at or job.created_at
+        job.partial = data.get("partial") or {}
+        job.error = data.get("error")
+        job.error_stage = data.get("error_stage")
+        result = {}
+        for key, value in (data.get("result") or {}).items():
+            if isinstance(value, dict) and "__bytes__" in value:
+                value = base64.b64decode(value["__bytes__"])
+            result[key] = value
+        job.result = result
+        return job
+
+
+class JobQueue:
+    """Worker pool for this process, with every job's state published to a shared backend.
+
+    backend is a session_store.SessionBackend; by default the one the session
+    store uses, so jobs are as widely visible as the sessions that poll them.
+    """
+
+    def __init__(self, backend=None, workers=JOB_WORKERS, ttl=JOB_RESULT_TTL_SECONDS,
+                 publish_interval=JOB_PUBLISH_INTERVAL, stale_after=JOB_STALE_SECONDS, cache_entries=JOB_CACHE_ENTRIES):
+        if backend is None:
+            from session_store import get_session_store
+
+            backend = get_session_store().backend
+        self.backend = backend
+        self.ttl = ttl
+        self.publish_interval = publish_interval
+        self.stale_after = stale_after
+        self.cache_entries = cache_entries
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}  # jobs running in this process
+        self._finished = OrderedDict()  # finished jobs seen lately, least recently used first
+        self._published = {}  # job ID -> when its partial results were last written
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, *args, job_id=None, owner=None, force=False, **kwargs):
+        """Queue func(job, *args, **kwargs) and return the job ID.
+
+        When job_id is given and a job with that ID is running (here or on
+        another replica) or has already finished successfully, no new work is
+        started unless force is set.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            existing = self._cached(job_id) or self._load(job_id)
+            if existing is not None and not force and (existing.active or existing.status == DONE):
+                if not existing.active:
+                    self._remember(existing)
+                return job_id
+            if existing is not None and existing.active:
+                # Never run two copies of the same job at once
+                return job_id
+            job = Job(job_id, kind, owner)
+            job.on_partial = self._publish_partial
+            self._finished.pop(job_id, None)
+            self._jobs[job_id] = job
+        self._save(job)
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job_id
+
+    def get(self, job_id):
+        """Return the job with this ID, from this process or the shared backend, or None.
+
+        A job running on another replica is read afresh on every call.
+        """
+        with self._lock:
+            job = self._cached(job_id)
+            if job is not None:
+                return job
+        job = self._load(job_id)
+        if job is not None and not job.active:
+            with self._lock:
+                self._remember(job)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._save(job)
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            job.error_stage = getattr(e, "stage", None)
+            job.status = FAILED
+            logger.warning("Job %s (%s) failed: %s", job.id, job.kind, job.error)
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+            with self._lock:
+                self._published.pop(job.id, None)
+                self._remember(job)
+
+    def _cached(self, job_id):
+        """A job running here or finished lately, without reading the backend. Call with the lock held."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self._finished.get(job_id)
+            if job is not None:
+                self._finished.move_to_end(job_id)
+        return job
+
+    def _remember(self, job):
+        """Keep a finished job in memory, up to cache_entries of them. Call with the lock held."""
+        self._jobs.pop(job.id, None)
+        self._finished[job.id] = job
+        self._finished.move_to_end(job.id)
+        while len(self._finished) > self.cache_entries:
+            self._finished.popitem(last=False)
+
+    def _publish_partial(self, job):
+        """Write partial results, at most once per publish_interval per job."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._published.get(job.id, float("-inf")) < self.publish_interval:
+                return
+            self._published[job.id] = now
+        self._save(job)
+
+    # Shared record
+
+    def _save(self, job):
+        job.updated_at = time.time()
+        try:
+            payload = json.dumps(job.to_dict(), separators=(",", ":")).encode("utf-8")
+            self.backend.set("job:" + job.id, zlib.compress(payload, 6), self.ttl)
+        except Exception as e:
+            # The job still runs and is visible to this process
+            logger.warning("Could not publish job %s: %s", job.id, e)
+
+    def _load(self, job_id):
+        if not job_id or not all(c.isalnum() or c in "-_" for c in job_id):
+            return None
+        try:
+            blob = self.backend.get("job:" + job_id)
+            if not blob:
+                return None
+            job = Job.from_dict(json.loads(zlib.decompress(blob).decode("utf-8")))
+        except Exception as e:
+            logger.warning("Could not read job %s: %s", job_id, e)
+            return None
+        if job.active and time.time() - job.updated_at > self.stale_after:
+            job.status = FAILED
+            job.error = "The server running this job stopped before it finished."
+        return job
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
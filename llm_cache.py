@@ -0,0 +1,314 @@
+"""Content-addressed cache for OpenAI calls.
+
+Results are keyed by a SHA-256 of the model, messages and temperature and kept
+in two tiers: an in-process LRU for the current server and a SQLite file on
+disk that survives restarts and is shared by every Streamlit session. Each
+call runs in an llm.* tracing span recording the model, whether the cache
+answered and the tokens used.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import tracing
+from llm_retry import acall_with_retry, call_with_retry, sdk_client
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3"))
+DEFAULT_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_MAX_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+DEFAULT_MAX_DISK_BYTES = int(os.getenv("LLM_CACHE_DISK_BYTES", str(200 * 1024 * 1024)))
+
+
+def make_cache_key(model, messages, temperature, **extra):
+    """Hash the parts of a request that determine its output."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, **extra},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_disabled():
+    """Return True when caching is switched off for the whole process."""
+    return os.getenv("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+
+class TieredCache:
+    """Two-tier (memory LRU + SQLite) cache of str or bytes values with TTL and size bounds."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, namespace="llm", ttl=DEFAULT_TTL_SECONDS,
+                 max_memory_entries=DEFAULT_MAX_MEMORY_ENTRIES, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0,
+                          "writes": 0, "evictions": 0, "expired": 0}
+
+    # Disk tier
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (namespace, accessed_at)"
+            )
+        return self._conn
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and self.ttl > 0 and now - created_at > self.ttl
+
+    def _evict_disk(self, conn):
+        """Drop least recently used rows until the namespace fits its byte budget."""
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        rows = conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at",
+            (self.namespace,),
+        ).fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            doomed.append((self.namespace, key))
+            total -= size
+        conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", doomed)
+        self._counters["evictions"] += len(doomed)
+
+    # Public API
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            value, created_at = row
+            if self._expired(created_at, now):
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+                conn.commit()
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return None
+            conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            conn.commit()
+            self._remember(key, value, created_at)
+            self._counters["disk_hits"] += 1
+            return value
+
+    def set(self, key, value):
+        """Store value under key in both tiers."""
+        now = time.time()
+        size = len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+        with self._lock:
+            self._remember(key, value, now)
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, value, size, now, now),
+            )
+            self._evict_disk(conn)
+            conn.commit()
+            self._counters["writes"] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        """Empty both tiers for this namespace."""
+        with self._lock:
+            self._memory.clear()
+            conn = self._connect()
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+            conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters plus current tier sizes."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            return stats
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide cache used for OpenAI results."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = TieredCache(namespace="llm")
+        return _llm_cache
+
+
+def cache_lookup(cache, key, bypass=False):
+    """Return the cached text for key, or None when missing or bypassed."""
+    if bypass or cache_disabled():
+        cache.record_bypass()
+        return None
+    return cache.get(key)
+
+
+def cache_store(cache, key, text):
+    """Remember a fresh result unless caching is disabled."""
+    if text is not None and not cache_disabled():
+        cache.set(key, text)
+
+
+def cached_chat_completion(client, *, model, messages, temperature, bypass=False, cache=None, retry_policy=None, **kwargs):
+    """Return the text of a chat completion, serving repeated requests from the cache.
+
+    With bypass=True the model is always called and the fresh answer replaces
+    whatever was cached for the same request.
+    """
+    cache = cache or get_llm_cache()
+    key = make_cache_key(model, messages, temperature, api="chat.completions", **kwargs)
+    with tracing.span("llm.chat.completions", model=model) as span:
+        cached = cache_lookup(cache, key, bypass)
+        span.set(cached=cached is not None)
+        if cached is not None:
+            return cached
+
+        response = call_with_retry(
+            sdk_client(client).chat.completions,
+            retry_policy=retry_policy,
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            **kwargs
+        )
+        tracing.record_usage(getattr(response, "usage", None), span)
+    text = response.choices[0].message.content
+    cache_store(cache, key, text)
+    return text
+
+
+async def acached_chat_completion(client, *, model, messages, temperature, bypass=False, cache=None, retry_policy=None, **kwargs):
+    """Async counterpart of cached_chat_completion for an AsyncOpenAI client."""
+    cache = cache or get_llm_cache()
+    key = make_cache_key(model, messages, temperature, api="chat.completions", **kwargs)
+    with tracing.span("llm.chat.completions", model=model) as span:
+        cached = cache_lookup(cache, key, bypass)
+        span.set(cached=cached is not None)
+        if cached is not None:
+            return cached
+
+        response = await acall_with_retry(
+            sdk_client(client).chat.completions,
+            retry_policy=retry_policy,
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            **kwargs
+        )
+        tracing.record_usage(getattr(response, "usage", None), span)
+    text = response.choices[0].message.content
+    cache_store(cache, key, text)
+    return text
+
+
+def cached_response(client, *, model, input, temperature, bypass=False, cache=None, retry_policy=None, **kwargs):
+    """Return the output text of a Responses API call, served from the cache when possible."""
+    cache = cache or get_llm_cache()
+    key = make_cache_key(model, input, temperature, api="responses", **kwargs)
+    with tracing.span("llm.responses", model=model) as span:
+        cached = cache_lookup(cache, key, bypass)
+        span.set(cached=cached is not None)
+        if cached is not None:
+            return cached
+
+        response = call_with_retry(
+            sdk_client(client).responses,
+            retry_policy=retry_policy,
+            model=model,
+            input=input,
+            temperature=temperature,
+            **kwargs
+        )
+        tracing.record_usage(getattr(response, "usage", None), span)
+    text = response.output_text
+    cache_store(cache, key, text)
+    return text
+
+
+async def acached_response(client, *, model, input, temperature, bypass=False, cache=None, retry_policy=None, **kwargs):
+    """Async counterpart of cached_response for an AsyncOpenAI client."""
+    cache = cache or get_llm_cache()
+    key = make_cache_key(model, input, temperature, api="responses", **kwargs)
+    with tracing.span("llm.responses", model=model) as span:
+        cached = cache_lookup(cache, key, bypass)
+        span.set(cached=cached is not None)
+        if cached is not None:
+            return cached
+
+        response = await acall_with_retry(
+            sdk_client(client).responses,
+            retry_policy=retry_policy,
+            model=model,
+            input=input,
+            temperature=temperature,
+            **kwargs
+        )
+        tracing.record_usage(getattr(response, "usage", None), span)
+    text = response.output_text
+    cache_store(cache, key, text)
+    return text
@@ -0,0 +1,175 @@
+"""Small async DAG executor for the post-submission LLM pipeline.
+
+Stages are async callables declared with the names of the stages they depend
+on. Each stage starts as soon as all of its dependencies have finished, so
+independent work overlaps and adding a stage only adds latency if it sits on
+the critical path. Every stage can carry its own timeout; when one stage
+fails or times out the remaining stages are cancelled. Each stage runs in a
+tracing span named after it, under whatever span was current when the
+pipeline started.
+"""
+import asyncio
+import logging
+import time
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineError(Exception):
+    """Raised when a stage fails, times out or the pipeline is cancelled."""
+
+    def __init__(self, stage, error, report=None):
+        super().__init__(f"Stage '{stage}' failed: {error!r}")
+        self.stage = stage
+        self.error = error
+        self.report = report
+
+
+class Stage:
+    """One node of the pipeline.
+
+    func is called with the results of its dependencies as keyword arguments,
+    named after the dependency stages.
+    """
+
+    def __init__(self, name, func, deps=(), timeout=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+
+
+class PipelineReport:
+    """Timings of one pipeline run, relative to its start."""
+
+    def __init__(self):
+        self.timings = {}
+        self.status = {}
+        self.wall_time = None
+        self.critical_path = []
+
+    @property
+    def critical_path_latency(self):
+        if not self.critical_path:
+            return 0.0
+        return self.timings[self.critical_path[-1]][1]
+
+    def as_dict(self):
+        return {
+            "wall_time": self.wall_time,
+            "critical_path": list(self.critical_path),
+            "critical_path_latency": self.critical_path_latency,
+            "stages": {
+                name: {
+                    "start": start,
+                    "end": end,
+                    "duration": end - start,
+                    "status": self.status.get(name),
+                }
+                for name, (start, end) in self.timings.items()
+            },
+        }
+
+    def summary(self):
+        path = " -> ".join(
+            f"{name} ({self.timings[name][1] - self.timings[name][0]:.2f}s)" for name in self.critical_path
+        )
+        return f"wall={self.wall_time:.2f}s critical_path={path or 'n/a'}"
+
+
+class Pipeline:
+    """Collection of stages that runs as a dependency graph."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, func, deps=(), timeout=None):
+        """Declare a stage. Dependencies must already be declared, which keeps the graph acyclic."""
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already declared")
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on undeclared stages: {', '.join(missing)}")
+        self.stages[name] = Stage(name, func, deps, timeout)
+        return self
+
+    async def run(self, timeout=None):
+        """Run every stage and return (results, report).
+
+        Raises PipelineError carrying the partial report if any stage fails.
+        """
+        report = PipelineReport()
+        results = {}
+        tasks = {}
+        started = time.perf_counter()
+
+        async def run_stage(stage):
+            for dep in stage.deps:
+                await tasks[dep]
+            kwargs = {dep: results[dep] for dep in stage.deps}
+            begin = time.perf_counter() - started
+            report.status[stage.name] = "running"
+            try:
+                with tracing.span(stage.name, deps=list(stage.deps)):
+                    if stage.timeout:
+                        value = await asyncio.wait_for(stage.func(**kwargs), stage.timeout)
+                    else:
+                        value = await stage.func(**kwargs)
+            except asyncio.CancelledError:
+                report.status[stage.name] = "cancelled"
+                raise
+            except asyncio.TimeoutError as e:
+                report.status[stage.name] = "timeout"
+                raise PipelineError(stage.name, e) from e
+            except Exception as e:
+                report.status[stage.name] = "failed"
+                raise PipelineError(stage.name, e) from e
+            finally:
+                report.timings[stage.name] = (begin, time.perf_counter() - started)
+            report.status[stage.name] = "done"
+            results[stage.name] = value
+            return value
+
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+
+        try:
+            gathered = asyncio.gather(*tasks.values())
+            if timeout:
+                await asyncio.wait_for(gathered, timeout)
+            else:
+                await gathered
+        except BaseException as e:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            report.wall_time = time.perf_counter() - started
+            report.critical_path = self._critical_path(report)
+            if isinstance(e, PipelineError):
+                e.report = report
+                raise
+            if isinstance(e, asyncio.TimeoutError):
+                raise PipelineError("pipeline", e, report) from e
+            raise
+
+        report.wall_time = time.perf_counter() - started
+        report.critical_path = self._critical_path(report)
+        logger.info("pipeline %s", report.summary())
+        return results, report
+
+    def _critical_path(self, report):
+        """Walk back from the last stage to finish through its latest-finishing dependency."""
+        finished = [name for name in self.stages if name in report.timings]
+        if not finished:
+            return []
+        current = max(finished, key=lambda name: report.timings[name][1])
+        path = [current]
+        while True:
+            deps = [dep for dep in self.stages[current].deps if dep in report.timings]
+            if not deps:
+                break
+            current = max(deps, key=lambda name: report.timings[name][1])
+            path.append(current)
+        return list(reversed(path))
@@ -0,0 +1,353 @@
+"""Adaptive retry, backoff and client-side rate limiting for OpenAI calls.
+
+Every call goes through a per-model token bucket sized to our tokens-per-minute
+and requests-per-minute budget, so requests are delayed up front instead of
+eating 429s. The bucket is corrected from the x-ratelimit-* headers OpenAI
+returns. Transient failures (rate limits, timeouts, connection errors, 5xx)
+are retried with jittered exponential backoff via tenacity, honouring
+Retry-After when the server sends it. A call takes its budget from the
+bucket once, however many attempts it needs; retries only wait out the
+backoff and any slowdown the server asked for. How many attempts a call gets
+and the budget it draws from come from a RetryPolicy, by default the one
+built from the environment. Counters for retries and time spent waiting are
+kept in RetryMetrics and added to the current tracing span.
+
+The SDK is imported inside the functions that call it, so importing this
+module (and llm_cache, which builds on it) does not slow down page loads.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    stop_after_delay,
+    wait_random_exponential,
+)
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TPM = int(os.getenv("OPENAI_TPM", "80000"))
+DEFAULT_RPM = int(os.getenv("OPENAI_RPM", "500"))
+MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "6"))
+MAX_RETRY_SECONDS = float(os.getenv("OPENAI_MAX_RETRY_SECONDS", "180"))
+# Completion tokens assumed when a request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 800
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value):
+    """Parse OpenAI reset durations such as "20ms", "1.5s" or "6m0s" into seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    matches = _DURATION_RE.findall(value)
+    if not matches:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in matches)
+
+
+def retry_after_seconds(headers):
+    """Seconds the server asked us to wait, from retry-after-ms or Retry-After."""
+    if not headers:
+        return None
+    millis = headers.get("retry-after-ms")
+    if millis is not None:
+        try:
+            return float(millis) / 1000.0
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
+
+
+def estimate_request_tokens(kwargs):
+    """Rough token cost of a request: prompt characters / 4 plus the completion allowance."""
+    prompt = kwargs.get("messages") or kwargs.get("input") or ""
+    if not isinstance(prompt, str):
+        prompt = " ".join(str(message.get("content", "")) if isinstance(message, dict) else str(message) for message in prompt)
+    completion = kwargs.get("max_tokens") or kwargs.get("max_output_tokens") or DEFAULT_COMPLETION_TOKENS
+    return len(prompt) // 4 + completion
+
+
+class RetryMetrics:
+    """Thread-safe counters describing retries and waiting."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.backoff_seconds = 0.0
+        self.throttle_seconds = 0.0
+
+    def add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "failures": self.failures,
+                "backoff_seconds": round(self.backoff_seconds, 3),
+                "throttle_seconds": round(self.throttle_seconds, 3),
+            }
+
+
+class TokenBucket:
+    """Token and request budgets for one model, refilled continuously."""
+
+    def __init__(self, tokens_per_minute=DEFAULT_TPM, requests_per_minute=DEFAULT_RPM):
+        self.token_capacity = float(tokens_per_minute)
+        self.request_capacity = float(requests_per_minute)
+        self.tokens = self.token_capacity
+        self.requests = self.request_capacity
+        self.blocked_until = 0.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_capacity / 60.0)
+        self.requests = min(self.request_capacity, self.requests + elapsed * self.request_capacity / 60.0)
+
+    def reserve(self, tokens):
+        """Take budget for a request and return how long the caller must wait before sending it."""
+        # A single request larger than the whole budget can only wait for a full bucket
+        tokens = min(tokens, self.token_capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= tokens
+            self.requests -= 1
+            wait = max(
+                self.blocked_until - now,
+                -self.tokens * 60.0 / self.token_capacity if self.tokens < 0 else 0.0,
+                -self.requests * 60.0 / self.request_capacity if self.requests < 0 else 0.0,
+                0.0,
+            )
+            return wait
+
+    def blocked_for(self):
+        """Seconds left of a slowdown the server asked for."""
+        with self._lock:
+            return max(0.0, self.blocked_until - time.monotonic())
+
+    def update_from_headers(self, headers):
+        """Trust the server's view of our remaining budget when it is tighter than ours."""
+        if not headers:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            for kind in ("tokens", "requests"):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                try:
+                    if limit is not None:
+                        setattr(self, f"{kind[:-1]}_capacity", float(limit))
+                    if remaining is not None:
+                        setattr(self, kind, min(getattr(self, kind), float(remaining)))
+                except ValueError:
+                    continue
+
+    def block_for(self, seconds):
+        """Hold every caller back after the server told us to slow down."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RetryPolicy:
+    """How often and for how long a call is retried, and the per-model budget it is throttled to.
+
+    Unset limits fall back to the OPENAI_* settings, e.g. a batch run on a
+    higher usage tier passes its own tokens and requests per minute.
+    """
+
+    def __init__(self, max_attempts=None, max_seconds=None, tokens_per_minute=None, requests_per_minute=None):
+        self.max_attempts = max(1, int(max_attempts or MAX_ATTEMPTS))
+        self.max_seconds = max_seconds or MAX_RETRY_SECONDS
+        self.tokens_per_minute = tokens_per_minute or DEFAULT_TPM
+        self.requests_per_minute = requests_per_minute or DEFAULT_RPM
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+_metrics = RetryMetrics()
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_retry_metrics():
+    """Return the process-wide retry metrics."""
+    return _metrics
+
+
+def get_bucket(model, policy=DEFAULT_POLICY):
+    """Return the rate-limit bucket shared by every call to a model under the same budget."""
+    key = (model, policy.tokens_per_minute, policy.requests_per_minute)
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(policy.tokens_per_minute, policy.requests_per_minute)
+        return _buckets[key]
+
+
+def is_transient(error):
+    """Errors worth retrying: rate limits, timeouts, dropped connections and server errors."""
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code in (409, 429) or error.status_code >= 500)
+
+
+class wait_retry_after:
+    """tenacity wait strategy: honour Retry-After, else jittered exponential backoff."""
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or wait_random_exponential(multiplier=1, max=60)
+
+    def __call__(self, retry_state):
+        error = retry_state.outcome.exception()
+        response = getattr(error, "response", None)
+        server_wait = retry_after_seconds(getattr(response, "headers", None))
+        if server_wait is not None:
+            # Spread concurrent callers out a little so they do not all return at once
+            return server_wait + random.uniform(0, min(1.0, server_wait * 0.1 + 0.1))
+        return self.fallback(retry_state)
+
+
+def _before_sleep(model, bucket):
+    import openai
+
+    def before_sleep(retry_state):
+        error = retry_state.outcome.exception()
+        wait = retry_state.next_action.sleep if retry_state.next_action else 0.0
+        rate_limited = isinstance(error, openai.RateLimitError)
+        _metrics.add(retries=1, backoff_seconds=wait, rate_limited=1 if rate_limited else 0)
+        tracing.increment("retries")
+        tracing.increment("backoff_seconds", wait)
+        if rate_limited:
+            bucket.block_for(wait)
+        logger.warning("OpenAI call to %s failed (%s); retry %d in %.1fs",
+                       model, type(error).__name__, retry_state.attempt_number, wait)
+    return before_sleep
+
+
+def _retry_kwargs(model, bucket, policy):
+    return dict(
+        retry=retry_if_exception(is_transient),
+        wait=wait_retry_after(),
+        stop=stop_after_attempt(policy.max_attempts) | stop_after_delay(policy.max_seconds),
+        before_sleep=_before_sleep(model, bucket),
+        reraise=True,
+    )
+
+
+def _throttle(bucket, kwargs, attempt_number):
+    """Seconds to hold an attempt back. Only the first attempt of a call takes budget from the bucket."""
+    if attempt_number == 1:
+        wait = bucket.reserve(estimate_request_tokens(kwargs))
+    else:
+        wait = bucket.blocked_for()
+    if wait > 0:
+        _metrics.add(throttle_seconds=wait)
+        tracing.increment("throttle_seconds", wait)
+    return wait
+
+
+def sdk_client(client):
+    """The client with the SDK's own retries switched off, so only this layer retries."""
+    with_options = getattr(client, "with_options", None)
+    return with_options(max_retries=0) if with_options else client
+
+
+def _headers_of(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None)
+
+
+def call_with_retry(resource, retry_policy=None, **kwargs):
+    """Call resource.create(**kwargs) (e.g. client.chat.completions) with throttling and retries."""
+    import openai
+
+    policy = retry_policy or DEFAULT_POLICY
+    model = kwargs.get("model", "default")
+    bucket = get_bucket(model, policy)
+    raw_create = getattr(getattr(resource, "with_raw_response", None), "create", None)
+    _metrics.add(calls=1)
+
+    def attempt(attempt_number):
+        wait = _throttle(bucket, kwargs, attempt_number)
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            if raw_create is None:
+                return resource.create(**kwargs)
+            raw = raw_create(**kwargs)
+            bucket.update_from_headers(raw.headers)
+            return raw.parse()
+        except openai.APIError as e:
+            bucket.update_from_headers(_headers_of(e))
+            raise
+
+    try:
+        for attempt_state in Retrying(**_retry_kwargs(model, bucket, policy)):
+            with attempt_state:
+                return attempt(attempt_state.retry_state.attempt_number)
+    except Exception:
+        _metrics.add(failures=1)
+        raise
+
+
+async def acall_with_retry(resource, retry_policy=None, **kwargs):
+    """Async counterpart of call_with_retry for AsyncOpenAI resources."""
+    import openai
+
+    policy = retry_policy or DEFAULT_POLICY
+    model = kwargs.get("model", "default")
+    bucket = get_bucket(model, policy)
+    raw_create = getattr(getattr(resource, "with_raw_response", None), "create", None)
+    _metrics.add(calls=1)
+
+    async def attempt(attempt_number):
+        wait = _throttle(bucket, kwargs, attempt_number)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            if raw_create is None:
+                return await resource.create(**kwargs)
+            raw = await raw_create(**kwargs)
+            bucket.update_from_headers(raw.headers)
+            return raw.parse()
+        except openai.APIError as e:
+            bucket.update_from_headers(_headers_of(e))
+            raise
+
+    try:
+        async for attempt_state in AsyncRetrying(**_retry_kwargs(model, bucket, policy)):
+            with attempt_state:
+                return await attempt(attempt_state.retry_state.attempt_number)
+    except Exception:
+        _metrics.add(failures=1)
+        raise
@@ -0,0 +1,159 @@
+"""Streaming wrappers around OpenAI chat completions.
+
+A StreamedCompletion yields text deltas as they arrive so the page can render
+them token by token, then keeps the assembled text for session state, the PDF
+report and the cache. Time-to-first-token is logged per pipeline stage and
+recorded, with token usage, on an llm.chat.completions tracing span.
+AsyncStreamedCompletion does the same for an AsyncOpenAI client.
+"""
+import logging
+import time
+
+import tracing
+from llm_cache import cache_lookup, cache_store, get_llm_cache, make_cache_key
+from llm_retry import acall_with_retry, call_with_retry, sdk_client
+
+logger = logging.getLogger(__name__)
+
+
+class StreamedCompletion:
+    """Iterable over the text deltas of one chat completion."""
+
+    def __init__(self, client, *, stage, model, messages, temperature, bypass=False, cache=None, **kwargs):
+        self.client = client
+        self.stage = stage
+        self.model = model
+        self.messages = messages
+        self.temperature = temperature
+        self.bypass = bypass
+        self.cache = cache or get_llm_cache()
+        self.kwargs = kwargs
+        self.key = make_cache_key(model, messages, temperature, api="chat.completions", **kwargs)
+        self.text = None
+        self.cached = False
+        self.time_to_first_token = None
+        self.total_time = None
+        self._start = None
+        self._parts = []
+        self.span = None
+
+    def _begin(self):
+        """Start the clock and return the cached text, if any."""
+        self._start = time.perf_counter()
+        self.span = tracing.start_span("llm.chat.completions", model=self.model, stage=self.stage, streamed=True)
+        cached = cache_lookup(self.cache, self.key, self.bypass)
+        self.span.set(cached=cached is not None)
+        if cached is not None:
+            self.cached = True
+            self.text = cached
+            self.time_to_first_token = self.total_time = time.perf_counter() - self._start
+            logger.info("stage=%s cached=true ttft=%.3fs", self.stage, self.time_to_first_token)
+            self.span.end()
+        return cached
+
+    def _create_kwargs(self):
+        kwargs = dict(
+            model=self.model,
+            messages=self.messages,
+            temperature=self.temperature,
+            stream=True,
+            # The final chunk then carries token usage for the trace
+            stream_options={"include_usage": True},
+        )
+        kwargs.update(self.kwargs)
+        return kwargs
+
+    def _delta(self, chunk):
+        """Record one streamed chunk and return its text, or None if it has none."""
+        tracing.record_usage(getattr(chunk, "usage", None), self.span)
+        if not chunk.choices:
+            return None
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            return None
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self._start
+            self.span.set(ttft_ms=round(self.time_to_first_token * 1000, 1))
+            logger.info("stage=%s cached=false ttft=%.3fs", self.stage, self.time_to_first_token)
+        self._parts.append(delta)
+        return delta
+
+    def _finish(self):
+        self.text = "".join(self._parts)
+        self.total_time = time.perf_counter() - self._start
+        logger.info("stage=%s total=%.3fs chars=%d", self.stage, self.total_time, len(self.text))
+        if self.text:
+            cache_store(self.cache, self.key, self.text)
+
+    def __iter__(self):
+        cached = self._begin()
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            # Retries cover opening the stream; a stream that breaks midway is not replayed
+            with tracing.use_span(self.span):
+                stream = call_with_retry(sdk_client(self.client).chat.completions, **self._create_kwargs())
+            for chunk in stream:
+                delta = self._delta(chunk)
+                if delta:
+                    yield delta
+            self._finish()
+        except Exception as e:
+            self.span.end(error=e)
+            raise
+        finally:
+            self.span.end()
+
+
+class AsyncStreamedCompletion(StreamedCompletion):
+    """Async iterable over the text deltas of one chat completion."""
+
+    async def __aiter__(self):
+        cached = self._begin()
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            with tracing.use_span(self.span):
+                stream = await acall_with_retry(sdk_client(self.client).chat.completions, **self._create_kwargs())
+            async for chunk in stream:
+                delta = self._delta(chunk)
+                if delta:
+                    yield delta
+            self._finish()
+        except Exception as e:
+            self.span.end(error=e)
+            raise
+        finally:
+            self.span.end()
+
+
+def stream_chat_completion(client, *, stage, model, messages, temperature, bypass=False, cache=None, **kwargs):
+    """Return a StreamedCompletion; iterate it (or pass it to st.write_stream) to run the call."""
+    return StreamedCompletion(
+        client,
+        stage=stage,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        bypass=bypass,
+        cache=cache,
+        **kwargs
+    )
+
+
+def astream_chat_completion(client, *, stage, model, messages, temperature, bypass=False, cache=None, **kwargs):
+    """Return an AsyncStreamedCompletion for use with `async for`."""
+    return AsyncStreamedCompletion(
+        client,
+        stage=stage,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        bypass=bypass,
+        cache=cache,
+        **kwargs
+    )
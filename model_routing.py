@@ -0,0 +1,148 @@
+"""Which model, token limit and temperature each LLM stage uses.
+
+Defaults live in DEFAULT_ROUTES. A JSON file at MODEL_ROUTES_PATH
+(model_routes.json by default) overrides them per stage and is re-read when
+it changes, so a stage can be moved to another model without a deploy:
+
+    {"similar_figures": {"model": "gpt-4o-mini", "max_tokens": 300, "temperature": 0.5}}
+
+Run benchmarks/model_eval.py against recorded stage inputs before changing a
+route. Setting EVAL_RECORD_PATH makes the app append every stage's input and
+output to that JSONL file for the harness; it contains user data, so it is
+off by default.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, replace
+
+logger = logging.getLogger(__name__)
+
+MODEL_ROUTES_PATH = os.getenv("MODEL_ROUTES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_routes.json"))
+EVAL_RECORD_PATH = os.getenv("EVAL_RECORD_PATH")
+
+# USD per million (input, output) tokens, for cost estimates
+MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1-nano": (0.1, 0.4),
+}
+
+
+@dataclass(frozen=True)
+class StageRoute:
+    model: str
+    temperature: float = 0.7
+    max_tokens: int = None
+
+    def request_kwargs(self):
+        """Keyword arguments for chat.completions.create()."""
+        kwargs = {"model": self.model, "temperature": self.temperature}
+        if self.max_tokens:
+            kwargs["max_tokens"] = self.max_tokens
+        return kwargs
+
+
+DEFAULT_ROUTES = {
+    "questions": StageRoute("gpt-4"),
+    "analysis": StageRoute("gpt-4"),
+    "similar_figures": StageRoute("gpt-4"),
+}
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD for one call, or None for a model without a known price."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class RouteTable:
+    """Stage routes: the defaults overlaid with the routes file, reloaded when it changes."""
+
+    def __init__(self, path=MODEL_ROUTES_PATH, defaults=None):
+        self.path = path
+        self.defaults = dict(defaults or DEFAULT_ROUTES)
+        self._routes = dict(self.defaults)
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._routes, self._stamp = dict(self.defaults), None
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return
+        try:
+            with open(self.path, "r") as file:
+                overrides = json.load(file)
+            routes = dict(self.defaults)
+            for stage, settings in overrides.items():
+                base = routes.get(stage) or StageRoute(settings["model"])
+                routes[stage] = replace(base, **settings)
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            # Keep serving the last good routes, like the template registry does
+            if stamp != self._stamp:
+                logger.error("Ignoring invalid model routes in %s: %s", self.path, e)
+            self._stamp = stamp
+            return
+        self._routes, self._stamp = routes, stamp
+        logger.info("Loaded model routes from %s", self.path)
+
+    def route(self, stage):
+        with self._lock:
+            self._load()
+            return self._routes.get(stage) or DEFAULT_ROUTES["analysis"]
+
+    def describe(self, *stages):
+        """Stable text of the routes for stages, for use in result fingerprints."""
+        return json.dumps({stage: asdict(self.route(stage)) for stage in stages}, sort_keys=True)
+
+
+_routes = None
+_routes_lock = threading.Lock()
+
+
+def get_routes():
+    """The process-wide route table."""
+    global _routes
+    with _routes_lock:
+        if _routes is None:
+            _routes = RouteTable()
+        return _routes
+
+
+def route(stage):
+    return get_routes().route(stage)
+
+
+_record_lock = threading.Lock()
+
+
+def record_stage(stage, stage_route, messages, output, latency):
+    """Append one stage call to EVAL_RECORD_PATH for offline evaluation, when enabled."""
+    if not EVAL_RECORD_PATH or output is None:
+        return
+    line = json.dumps({
+        "stage": stage,
+        "model": stage_route.model,
+        "temperature": stage_route.temperature,
+        "max_tokens": stage_route.max_tokens,
+        "messages": messages,
+        "output": output,
+        "latency": round(latency, 3),
+        "recorded_at": time.time(),
+    })
+    with _record_lock:
+        with open(EVAL_RECORD_PATH, "a") as file:
+            file.write(line + "\n")
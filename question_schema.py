@@ -0,0 +1,295 @@
+"""Schema, parsing and local repair for generated questionnaire JSON.
+
+The question generation call asks for a JSON array of {"question",
+"description"} objects. Models that support structured outputs are held to
+QUESTIONS_SCHEMA by the API; older ones only get the instruction in the
+prompt, so their answers are checked here. Malformed text (code fences, prose
+around the array, trailing commas, smart quotes, a cut-off final object) is
+repaired locally. Only when nothing can be salvaged is the model asked again,
+once, with the parse error. QuestionMetrics tracks how often each path is
+taken. QuestionStreamParser picks complete questions out of a streamed answer
+so the questionnaire can start before generation finishes.
+"""
+import json
+import logging
+import re
+import threading
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "description": {"type": "string"},
+    },
+    "required": ["question", "description"],
+    "additionalProperties": False,
+}
+
+# Structured outputs need an object at the root, so the array is wrapped
+QUESTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {"questions": {"type": "array", "items": QUESTION_SCHEMA}},
+    "required": ["questions"],
+    "additionalProperties": False,
+}
+
+# Model families that accept response_format={"type": "json_schema"}
+STRUCTURED_OUTPUT_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([\]}])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+class QuestionFormatError(ValueError):
+    """Generated questions could not be parsed or repaired."""
+
+
+class QuestionMetrics:
+    """Thread-safe counters for how generated question JSON was obtained."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.valid = 0
+        self.repaired = 0
+        self.retried = 0
+        self.failed = 0
+
+    def add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def as_dict(self):
+        with self._lock:
+            malformed = self.repaired + self.retried + self.failed
+            return {
+                "responses": self.responses,
+                "valid": self.valid,
+                "repaired": self.repaired,
+                "retried": self.retried,
+                "failed": self.failed,
+                # Share of malformed answers fixed without another model call
+                "salvage_rate": round(self.repaired / malformed, 3) if malformed else None,
+            }
+
+
+_metrics = QuestionMetrics()
+
+
+def get_question_metrics():
+    """Process-wide counters for question parsing."""
+    return _metrics
+
+
+def supports_structured_output(model):
+    return model.startswith(STRUCTURED_OUTPUT_MODELS)
+
+
+def question_request_kwargs(model):
+    """Extra create() arguments asking the model for schema-valid questions, where it can."""
+    if not supports_structured_output(model):
+        return {}
+    return {
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "questions", "schema": QUESTIONS_SCHEMA, "strict": True},
+        }
+    }
+
+
+def validate_questions(data):
+    """Return data as a list of {"question", "description"} dicts, dropping unusable items."""
+    if isinstance(data, dict):
+        data = data.get("questions", [data] if "question" in data else None)
+    if not isinstance(data, list):
+        raise QuestionFormatError(f"expected a JSON array of questions, got {type(data).__name__}")
+    questions = []
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        question = item.get("question")
+        if not isinstance(question, str) or not question.strip():
+            continue
+        description = item.get("description")
+        questions.append({
+            "question": question.strip(),
+            "description": description.strip() if isinstance(description, str) else "",
+        })
+    if not questions:
+        raise QuestionFormatError("no usable questions in the response")
+    return questions
+
+
+def _salvage_objects(text):
+    """Decode every complete top-level {...} in text, e.g. from a truncated array."""
+    decoder = json.JSONDecoder()
+    objects = []
+    position = text.find("{")
+    while position != -1:
+        try:
+            value, end = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            position = text.find("{", position + 1)
+            continue
+        objects.append(value)
+        position = text.find("{", end)
+    return objects
+
+
+def repair_json(text):
+    """Best-effort cleanup of almost-JSON; returns the decoded value or raises QuestionFormatError."""
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    text = text.translate(_SMART_QUOTES).strip()
+
+    # Cut away prose before and after the outermost array (or object)
+    start = min((i for i in (text.find("["), text.find("{")) if i != -1), default=-1)
+    if start == -1:
+        raise QuestionFormatError("no JSON found in the response")
+    end = text.rfind("]" if text[start] == "[" else "}")
+    candidate = text[start:end + 1] if end > start else text[start:]
+    candidate = _TRAILING_COMMA_RE.sub(r"\1", candidate)
+
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    objects = _salvage_objects(candidate)
+    if objects:
+        return objects
+    raise QuestionFormatError("response is not valid JSON and could not be repaired")
+
+
+def parse_questions(text):
+    """Parse generated questions, repairing the text locally if needed.
+
+    Returns (questions, repaired). Raises QuestionFormatError when nothing
+    usable can be recovered.
+    """
+    try:
+        return validate_questions(json.loads(text)), False
+    except (json.JSONDecodeError, TypeError, QuestionFormatError):
+        pass
+    return validate_questions(repair_json(text or "")), True
+
+
+class QuestionStreamParser:
+    """Incremental parser yielding each question object as soon as its closing brace arrives.
+
+    Feed it streamed text; it tracks nesting and string state across chunks,
+    so prose, code fences or a {"questions": [...]} wrapper around the array
+    do not matter. Every closed object with a "question" field is validated
+    and returned once.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.questions = []
+        self._starts = []  # buffer offsets of the currently open objects
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._length = 0
+
+    def feed(self, text):
+        """Consume the next chunk of text and return the questions it completed."""
+        completed = []
+        self.buffer.append(text)
+        for char in text:
+            position = self._length
+            self._length += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                # Quotes in prose outside the JSON (apostrophes, "quoted" words) are not strings
+                self._in_string = self._depth > 0
+            elif char in "{[":
+                self._depth += 1
+                if char == "{":
+                    self._starts.append(position)
+            elif char in "}]":
+                self._depth = max(self._depth - 1, 0)
+                if char == "}" and self._starts:
+                    question = self._complete(self._starts.pop(), position)
+                    if question:
+                        completed.append(question)
+        self.questions.extend(completed)
+        return completed
+
+    def _complete(self, start, end):
+        if len(self.buffer) > 1:
+            self.buffer = ["".join(self.buffer)]
+        snippet = self.buffer[0][start:end + 1]
+        try:
+            item = json.loads(snippet)
+        except json.JSONDecodeError:
+            try:
+                item = json.loads(_TRAILING_COMMA_RE.sub(r"\1", snippet))
+            except json.JSONDecodeError:
+                return None
+        if not isinstance(item, dict) or "question" not in item:
+            return None
+        try:
+            return validate_questions([item])[0]
+        except QuestionFormatError:
+            return None
+
+    @property
+    def text(self):
+        return "".join(self.buffer)
+
+
+def retry_messages(messages, bad_text, error):
+    """The original conversation plus the invalid answer and what was wrong with it."""
+    return list(messages) + [
+        {"role": "assistant", "content": bad_text or ""},
+        {"role": "user", "content": (
+            f"That response could not be parsed ({error}). Reply with only a JSON array of objects "
+            "with 'question' and 'description' string fields, and no other text."
+        )},
+    ]
+
+
+def generate_questions(complete, messages, text=None):
+    """Run complete(messages, fresh) and return validated questions.
+
+    complete performs the model call and returns its text; fresh=True asks it
+    to skip any cache. Pass text when the first answer was already streamed.
+    Local repair is tried before the single corrective retry.
+    """
+    _metrics.add(responses=1)
+    if text is None:
+        text = complete(messages, False)
+    try:
+        questions, repaired = parse_questions(text)
+    except QuestionFormatError as e:
+        logger.warning("Generated questions could not be repaired (%s); asking the model again", e)
+        with tracing.span("question_retry"):
+            text = complete(retry_messages(messages, text, e), True)
+        try:
+            questions, _ = parse_questions(text)
+        except QuestionFormatError:
+            _metrics.add(failed=1)
+            tracing.annotate(question_parse="failed")
+            raise
+        _metrics.add(retried=1)
+        tracing.annotate(question_parse="retried", questions=len(questions))
+        return questions
+
+    _metrics.add(repaired=1 if repaired else 0, valid=0 if repaired else 1)
+    if repaired:
+        logger.info("Repaired malformed question JSON locally (%d questions)", len(questions))
+    tracing.annotate(question_parse="repaired" if repaired else "valid", questions=len(questions))
+    return questions
@@ -0,0 +1,334 @@
+"""Standalone PDF report rendering.
+
+Both report layouts live here and render from plain data, so they run the
+same inside a Streamlit session, in a background job or in a batch:
+
+    create_brand_pdf(analysis, responses, questions, similar_figures, initial_context)
+    create_skills_pdf(analysis, responses, questions)
+
+Questions may be {"question", "description"} dicts (brand builder) or
+(question, description) tuples (skills question banks). Output is
+byte-for-byte deterministic for the same input (reportlab invariant mode), so
+reports can be memoized, diffed and regenerated safely.
+
+Regenerating a cohort renders across a process pool:
+
+    python report_engine.py cohort.jsonl --out-dir reports/ --workers 8
+    python report_engine.py --benchmark 200
+
+Each input line is {"id": ..., "kind": "brand" | "skills", "analysis": ...,
+"responses": [...], "questions": [...], "similar_figures": ..., "initial_context": ...}.
+"""
+import argparse
+import concurrent.futures
+import functools
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+logger = logging.getLogger("report_engine")
+
+ACCENT_COLOR = colors.HexColor('#2E4053')
+
+
+@functools.lru_cache(maxsize=None)
+def report_styles(accent=True):
+    """Build the paragraph styles once per process; they are only read while rendering.
+
+    The brand report uses the accent colour and a taller body leading; the
+    skills report uses plain black text.
+    """
+    styles = getSampleStyleSheet()
+    color = {"textColor": ACCENT_COLOR} if accent else {}
+
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        **color
+    )
+
+    section_title_style = ParagraphStyle(
+        'SectionTitle',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceAfter=15,
+        **color
+    )
+
+    body_style = ParagraphStyle(
+        'CustomBody',
+        parent=styles['Normal'],
+        fontSize=12,
+        spaceAfter=12,
+        **({"leading": 14} if accent else {})
+    )
+
+    bold_style = ParagraphStyle(
+        'BoldStyle',
+        parent=styles['Normal'],
+        fontSize=12,
+        spaceAfter=12,
+        fontName='Helvetica-Bold',
+        **color
+    )
+
+    return {"title": title_style, "section": section_title_style, "body": body_style, "bold": bold_style}
+
+
+def normalize_questions(questions):
+    """Return questions as (question, description) pairs whatever shape they arrived in."""
+    normalized = []
+    for q in questions:
+        if isinstance(q, dict):
+            normalized.append((q.get('question', ''), q.get('description') or ''))
+        else:
+            question, description = q
+            normalized.append((question, description or ''))
+    return normalized
+
+
+def build_document(content):
+    """Lay out flowables into PDF bytes with stable IDs and timestamps."""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, invariant=1)
+    doc.build(content)
+    return buffer.getvalue()
+
+
+def create_brand_pdf(analysis, responses, questions, similar_figures, initial_context):
+    """The personal brand builder report."""
+    styles = report_styles(accent=True)
+
+    # Build PDF content
+    content = []
+
+    # Add title
+    content.append(Paragraph("Personal Brand Analysis", styles["title"]))
+    content.append(Spacer(1, 20))
+
+    # Add initial context section
+    content.append(Paragraph("Initial Context", styles["section"]))
+    content.append(Paragraph(initial_context, styles["body"]))
+    content.append(Spacer(1, 20))
+
+    # Add analysis section
+    content.append(Paragraph("Analysis", styles["section"]))
+
+    # Split the result into sections based on numbered points
+    sections = analysis.split('\n\n')
+    for section in sections:
+        if section.strip():
+            # Check if it's a numbered section
+            if section.strip()[0].isdigit():
+                # Extract the section title and content
+                parts = section.split('.', 1)
+                if len(parts) > 1:
+                    section_title = parts[0].strip() + '.'
+                    section_content = parts[1].strip()
+                    # First line: section number and title
+                    content.append(Paragraph(section_title, styles["bold"]))
+                    # Second line: content
+                    content.append(Paragraph(section_content, styles["body"]))
+                else:
+                    content.append(Paragraph(section, styles["body"]))
+            else:
+                content.append(Paragraph(section, styles["body"]))
+            content.append(Spacer(1, 12))
+
+    # Add similar personal brands section
+    content.append(Paragraph("Notable People with Similar Personal Brands", styles["section"]))
+    content.append(Paragraph(similar_figures, styles["body"]))
+    content.append(Spacer(1, 20))
+
+    content.append(PageBreak())
+
+    # Add questions and responses section
+    content.append(Paragraph("Your Responses", styles["section"]))
+    content.append(Spacer(1, 15))
+
+    for i, ((question, description), r) in enumerate(zip(normalize_questions(questions), responses), 1):
+        if r.strip():  # Only include answered questions
+            content.append(Paragraph(f"Question {i}: {question}", styles["bold"]))
+            if description:
+                content.append(Paragraph(description, styles["body"]))
+            content.append(Paragraph(r, styles["body"]))
+            content.append(Spacer(1, 20))
+
+    return build_document(content)
+
+
+def create_skills_pdf(analysis, responses, questions):
+    """The skills analyzer report."""
+    styles = report_styles(accent=False)
+
+    # Build PDF content
+    content = []
+
+    # Add title
+    content.append(Paragraph("Your Personal Brand Analysis", styles["title"]))
+    content.append(Spacer(1, 20))
+
+    # Process the result to handle any line starting with **
+    lines = analysis.split('\n')
+    for line in lines:
+        if line.strip().startswith('**'):
+            # Remove the ** and make it bold
+            clean_line = line.strip().replace('**', '')
+            content.append(Paragraph(f"<b>{clean_line}</b>", styles["bold"]))
+        else:
+            content.append(Paragraph(line, styles["body"]))
+
+    # Add page break before responses
+    content.append(PageBreak())
+    content.append(Spacer(1, 20))
+
+    # Add questions and responses
+    content.append(Paragraph("<b>Your Responses</b>", styles["bold"]))
+    for i, ((question, _), response) in enumerate(zip(normalize_questions(questions), responses), 1):
+        content.append(Paragraph(f"<b>Question {i}: {question}</b>", styles["bold"]))
+        content.append(Paragraph(response, styles["body"]))
+        content.append(Spacer(1, 20))
+
+    return build_document(content)
+
+
+def render(data):
+    """Render one report from a plain dict (see the module docstring)."""
+    kind = data.get("kind", "brand")
+    if kind == "brand":
+        return create_brand_pdf(
+            data["analysis"],
+            data.get("responses", []),
+            data.get("questions", []),
+            data.get("similar_figures", ""),
+            data.get("initial_context", ""),
+        )
+    if kind == "skills":
+        return create_skills_pdf(data["analysis"], data.get("responses", []), data.get("questions", []))
+    raise ValueError(f"Unknown report kind: {kind}")
+
+
+def _render_item(item):
+    """Process-pool task: render one report, writing it to disk when given a path."""
+    report_id, data, out_path = item
+    try:
+        pdf = render(data)
+    except Exception as e:
+        return report_id, None, f"{type(e).__name__}: {e}"
+    if out_path:
+        with open(out_path, "wb") as file:
+            file.write(pdf)
+        return report_id, len(pdf), None
+    return report_id, pdf, None
+
+
+def render_batch(items, workers=None, out_dir=None, chunksize=4):
+    """Render (id, data) pairs across a process pool.
+
+    Yields (id, result, error) in input order. result is the PDF bytes, or the
+    byte count when out_dir is given and workers write the files themselves
+    (which avoids shipping every PDF back to the parent).
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = (
+        (report_id, data, os.path.join(out_dir, f"{report_id}.pdf") if out_dir else None)
+        for report_id, data in items
+    )
+    if workers == 1:
+        yield from map(_render_item, tasks)
+        return
+    # spawn keeps workers independent of Streamlit's threads when called from the app
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        yield from executor.map(_render_item, tasks, chunksize=chunksize)
+
+
+def sample_report(i, kind="brand"):
+    """A realistic synthetic report for benchmarks; content varies with i."""
+    paragraphs = [
+        f"{n}. Theme {n} for respondent {i}. " + "You turn ambiguous problems into clear plans people can act on. " * 6
+        for n in range(1, 9)
+    ]
+    questions = [{"question": f"Question {n} about strengths and values?", "description": "Think about recent examples."} for n in range(1, 10)]
+    return {
+        "kind": kind,
+        "analysis": "\n\n".join(paragraphs),
+        "responses": [f"Answer {n} from respondent {i}. " + "Specific story with outcomes. " * 8 for n in range(1, 10)],
+        "questions": questions,
+        "similar_figures": "1. Ada Lovelace - visionary.\n2. Satya Nadella - empathetic leader.\n3. Brene Brown - courageous voice.",
+        "initial_context": f"Respondent {i} is an engineer who mentors others and leads platform teams. " * 3,
+    }
+
+
+def benchmark(count=200, workers=None):
+    """Reports/second serially and across the process pool, plus a determinism check."""
+    items = [(f"bench-{i}", sample_report(i, "brand" if i % 2 else "skills")) for i in range(count)]
+    results = {}
+
+    started = time.perf_counter()
+    serial = [pdf for _, pdf, _ in render_batch(items, workers=1)]
+    results["serial_reports_per_sec"] = count / (time.perf_counter() - started)
+
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    pooled = [pdf for _, pdf, _ in render_batch(items, workers=workers)]
+    results["pool_reports_per_sec"] = count / (time.perf_counter() - started)
+
+    results["workers"] = workers
+    results["reports"] = count
+    results["speedup"] = results["pool_reports_per_sec"] / results["serial_reports_per_sec"]
+    results["deterministic"] = serial == pooled
+    return results
+
+
+def iter_input(path):
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                yield str(record.get("id", f"row-{line_number}")), record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render PDF reports from a JSONL file across a process pool.")
+    parser.add_argument("input", nargs="?", help="JSONL file of report data")
+    parser.add_argument("--out-dir", default="reports", help="directory for the rendered PDFs")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: CPU count)")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="render N synthetic reports and print reports/sec")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.benchmark, args.workers or None), indent=2))
+        return 0
+    if not args.input:
+        parser.error("an input file is required unless --benchmark is given")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    started = time.perf_counter()
+    done = failed = 0
+    for report_id, _, error in render_batch(iter_input(args.input), args.workers or None, args.out_dir):
+        if error:
+            failed += 1
+            logger.warning("Report %s failed: %s", report_id, error)
+        else:
+            done += 1
+    elapsed = time.perf_counter() - started
+    logger.info("Rendered %d reports (%d failed) in %.1fs (%.1f reports/s)", done, failed, elapsed, done / elapsed if elapsed else 0.0)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Memoized, off-thread PDF rendering.
+
+Reports are rendered on a small worker pool and memoized by a hash of the
+renderer and everything passed to it, in memory and in a SQLite file under
+.cache/. Rerunning a page therefore never re-renders an unchanged report, and
+concurrent requests for the same report share a single render.
+
+Pages serve the bytes with st.download_button, which hands the browser a URL
+keyed by the content hash instead of inlining the file into the page.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from llm_cache import TieredCache
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_PATH = os.getenv("REPORT_CACHE_PATH", os.path.join(".cache", "report_cache.sqlite3"))
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", str(7 * 24 * 3600)))
+REPORT_CACHE_DISK_BYTES = int(os.getenv("REPORT_CACHE_DISK_BYTES", str(200 * 1024 * 1024)))
+REPORT_CACHE_MEMORY_ENTRIES = int(os.getenv("REPORT_CACHE_MEMORY_ENTRIES", "32"))
+MAX_RENDER_WORKERS = int(os.getenv("MAX_RENDER_WORKERS", "2"))
+# Bump when a renderer's layout changes so old memoized reports are not served
+REPORT_LAYOUT_VERSION = "1"
+
+_report_cache = None
+_report_cache_lock = threading.Lock()
+_render_pool = None
+_render_pool_lock = threading.Lock()
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def get_report_cache():
+    """Return the process-wide memo of rendered reports."""
+    global _report_cache
+    with _report_cache_lock:
+        if _report_cache is None:
+            _report_cache = TieredCache(
+                path=REPORT_CACHE_PATH,
+                namespace="reports",
+                ttl=REPORT_CACHE_TTL,
+                max_memory_entries=REPORT_CACHE_MEMORY_ENTRIES,
+                max_disk_bytes=REPORT_CACHE_DISK_BYTES,
+            )
+        return _report_cache
+
+
+def get_render_pool():
+    """Return the shared worker pool reports are rendered on."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_RENDER_WORKERS, thread_name_prefix="report-render"
+            )
+        return _render_pool
+
+
+def report_key(render, *args):
+    """Hash a renderer and its arguments into a memo key."""
+    payload = json.dumps(
+        [render.__module__, render.__qualname__, REPORT_LAYOUT_VERSION, args],
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def submit_report(render, *args, cache=None):
+    """Return a Future for render(*args), resolved from the memo when possible."""
+    cache = cache or get_report_cache()
+    key = report_key(render, *args)
+    cached = cache.get(key)
+    if cached is not None:
+        future = concurrent.futures.Future()
+        future.set_result(bytes(cached))
+        return future
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            return future
+
+        def task():
+            try:
+                started = time.perf_counter()
+                data = render(*args)
+                logger.info("report=%s rendered in %.3fs bytes=%d", render.__qualname__, time.perf_counter() - started, len(data))
+                cache.set(key, data)
+                return data
+            finally:
+                with _in_flight_lock:
+                    _in_flight.pop(key, None)
+
+        future = get_render_pool().submit(task)
+        _in_flight[key] = future
+        return future
+
+
+def render_report(render, *args, cache=None):
+    """Render (or recall) a report and return its bytes."""
+    return submit_report(render, *args, cache=cache).result()
+
+
+async def arender_report(render, *args, cache=None):
+    """Async counterpart of render_report that does not block the event loop."""
+    return await asyncio.wrap_future(submit_report(render, *args, cache=cache))
@@ -0,0 +1,202 @@
+"""Persisted questionnaire and analysis results.
+
+Results are keyed by user ID and an input fingerprint: a hash of everything
+that determines the output (prompts, templates, models, answers). Before
+calling OpenAI the app looks the fingerprint up, so a returning user sees
+their saved report, and work is only redone when the inputs or prompt
+templates have actually changed.
+
+Two backends share one interface: SupabaseResultsStore for production and
+SQLiteResultsStore for local development and tests. The Supabase table is
+created with SUPABASE_SCHEMA below.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+RESULTS_TABLE = "analysis_results"
+RESULTS_DB_PATH = os.getenv("RESULTS_DB_PATH", os.path.join(".cache", "results.sqlite3"))
+
+SUPABASE_SCHEMA = """
+create table if not exists analysis_results (
+    user_id uuid not null references auth.users (id) on delete cascade,
+    fingerprint text not null,
+    kind text not null,
+    payload jsonb not null,
+    created_at timestamptz not null default now(),
+    primary key (user_id, fingerprint)
+);
+create index if not exists analysis_results_latest on analysis_results (user_id, kind, created_at desc);
+alter table analysis_results enable row level security;
+create policy "Users manage their own results" on analysis_results
+    for all using (auth.uid() = user_id) with check (auth.uid() = user_id);
+"""
+
+
+def fingerprint(*parts):
+    """Hash the inputs that determine a result into a stable key."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def user_job_id(user_id, result_key):
+    """ID of the background job that computes the result stored under result_key for user_id.
+
+    Fingerprints do not include the user, so two users with the same inputs
+    would otherwise share, and be refused, one job.
+    """
+    return fingerprint(user_id, result_key)[:32]
+
+
+class ResultsStore(ABC):
+    """Interface shared by every results backend."""
+
+    @abstractmethod
+    def get(self, user_id, fingerprint):
+        """Return the payload stored for this user and fingerprint, or None."""
+
+    @abstractmethod
+    def put(self, user_id, fingerprint, kind, payload):
+        """Store (or replace) a payload of the given kind."""
+
+    @abstractmethod
+    def latest(self, user_id, kind):
+        """Return the most recently stored payload of this kind for the user, or None."""
+
+
+class SQLiteResultsStore(ResultsStore):
+    """Results kept in a local SQLite file."""
+
+    def __init__(self, path=RESULTS_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {RESULTS_TABLE} (
+                    user_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, fingerprint)
+                )"""
+            )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {RESULTS_TABLE}_latest ON {RESULTS_TABLE} (user_id, kind, created_at)"
+            )
+            self._conn.commit()
+
+    def get(self, user_id, fingerprint):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT payload FROM {RESULTS_TABLE} WHERE user_id = ? AND fingerprint = ?",
+                (str(user_id), fingerprint),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, user_id, fingerprint, kind, payload):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {RESULTS_TABLE} (user_id, fingerprint, kind, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (str(user_id), fingerprint, kind, json.dumps(payload), time.time()),
+            )
+            self._conn.commit()
+
+    def latest(self, user_id, kind):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT payload FROM {RESULTS_TABLE} WHERE user_id = ? AND kind = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (str(user_id), kind),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class SupabaseResultsStore(ResultsStore):
+    """Results kept in the analysis_results table behind the app's Supabase client.
+
+    Storage problems are logged and treated as misses so they never block the
+    user from getting fresh results. The client must already carry the
+    signed-in user's access token (brand_core.remember_auth_session) so
+    requests pass the table's row level security policy.
+    """
+
+    def __init__(self, client, table=RESULTS_TABLE):
+        self.client = client
+        self.table = table
+
+    def get(self, user_id, fingerprint):
+        try:
+            response = (
+                self.client.table(self.table)
+                .select("payload")
+                .eq("user_id", str(user_id))
+                .eq("fingerprint", fingerprint)
+                .limit(1)
+                .execute()
+            )
+        except Exception as e:
+            logger.warning("Results lookup failed: %s", e)
+            return None
+        return response.data[0]["payload"] if response.data else None
+
+    def put(self, user_id, fingerprint, kind, payload):
+        try:
+            self.client.table(self.table).upsert(
+                {
+                    "user_id": str(user_id),
+                    "fingerprint": fingerprint,
+                    "kind": kind,
+                    "payload": payload,
+                },
+                on_conflict="user_id,fingerprint",
+            ).execute()
+        except Exception as e:
+            logger.warning("Saving results failed: %s", e)
+
+    def latest(self, user_id, kind):
+        try:
+            response = (
+                self.client.table(self.table)
+                .select("payload")
+                .eq("user_id", str(user_id))
+                .eq("kind", kind)
+                .order("created_at", desc=True)
+                .limit(1)
+                .execute()
+            )
+        except Exception as e:
+            logger.warning("Results lookup failed: %s", e)
+            return None
+        return response.data[0]["payload"] if response.data else None
+
+
+_sqlite_store = None
+_sqlite_store_lock = threading.Lock()
+
+
+def get_results_store(supabase_client=None):
+    """Pick a backend from RESULTS_STORE ("supabase" or "sqlite")."""
+    global _sqlite_store
+    backend = os.getenv("RESULTS_STORE", "supabase" if supabase_client is not None else "sqlite")
+    if backend == "supabase":
+        if supabase_client is None:
+            raise ValueError("RESULTS_STORE=supabase needs a Supabase client")
+        return SupabaseResultsStore(supabase_client)
+    if backend == "sqlite":
+        with _sqlite_store_lock:
+            if _sqlite_store is None:
+                _sqlite_store = SQLiteResultsStore()
+            return _sqlite_store
+    raise ValueError(f"Unknown RESULTS_STORE backend: {backend}")
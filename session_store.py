@@ -0,0 +1,408 @@
+"""Session state kept outside the Streamlit process.
+
+Streamlit keeps st.session_state in the memory of the process that owns the
+websocket, which pins a user to one replica. Here the part of the state that
+matters (questionnaire, answers, analysis) is written to a key-value backend
+at the end of every run and read back when a run arrives at a process that
+has not seen the session yet. The session is identified by an opaque ID in
+the page URL (?sid=...), so any replica behind a load balancer can serve any
+rerun. The ID alone is not enough to restore a session: state is stored under
+the ID together with a cookie the browser sends but the URL does not carry, so
+a leaked link (history, Referer, copy and paste) gives nothing away. IDs are
+only ever issued by the server, and a new one is issued at login.
+
+The login itself (the Supabase access and refresh tokens) is never written to
+the backend. It is kept in the memory of the process that signed in, so a
+reload served by that process stays signed in, while a session that moves to
+another replica asks the user to log in again and then carries on with its
+restored state.
+
+State is stored as zlib-compressed compact JSON. Bytes (rendered PDFs) are
+dropped, since they are rebuilt from the rest, and uploaded document chunks
+are stored once under their own content key instead of in every session write.
+
+Backends, chosen with SESSION_STORE:
+    "sqlite" (default): a local SQLite file, shared by processes on one host
+    "memory": in-process and size-bounded, for tests and single-process runs
+    "redis": a shared Redis at REDIS_URL, for multi-host deployments
+"""
+import hashlib
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(".cache", "sessions.sqlite3"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_MEMORY_MAX_ENTRIES = int(os.getenv("SESSION_MEMORY_MAX_ENTRIES", "1000"))
+SESSION_PARAM = "sid"
+# Cookie the stored state is bound to, next to the ID in the URL
+BINDING_COOKIE = os.getenv("SESSION_BINDING_COOKIE", "_streamlit_xsrf")
+
+# The session_state keys that survive a move to another process
+PERSISTED_KEYS = (
+    "user",
+    "user_name",
+    "initial_context",
+    "questions_data",
+    "responses",
+    "current_question",
+    "max_question_viewed",
+    "questions_key",
+    "questions_job_id",
+    "analysis_job_id",
+    "analysis_result",
+    "analysis_record",
+    "context_compression",
+    "documents_key",
+    "trace_ids",
+)
+
+# The session_state keys that make up the login; they stay in this process
+LOGIN_KEYS = ("logged_in", "access_token", "refresh_token", "token_expires_at")
+
+_FORMAT = b"\x01"
+
+
+def _default(value):
+    if isinstance(value, SimpleNamespace):
+        return {"__ns__": vars(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return None
+    raise TypeError(f"{type(value).__name__} is not serializable")
+
+
+def _object_hook(data):
+    if len(data) == 1 and "__ns__" in data:
+        return SimpleNamespace(**data["__ns__"])
+    return data
+
+
+def encode_state(state):
+    """Compact, compressed bytes for a dict of session values; values that cannot be stored are skipped."""
+    values = {}
+    for key, value in state.items():
+        try:
+            values[key] = json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":"))
+        except (TypeError, ValueError) as e:
+            logger.warning("Not persisting session value %s: %s", key, e)
+    payload = "{" + ",".join(f"{json.dumps(key)}:{value}" for key, value in values.items()) + "}"
+    return _FORMAT + zlib.compress(payload.encode("utf-8"), 6)
+
+
+def decode_state(blob):
+    if not blob or blob[:1] != _FORMAT:
+        raise ValueError("unknown session state format")
+    return json.loads(zlib.decompress(blob[1:]).decode("utf-8"), object_hook=_object_hook)
+
+
+class SessionBackend(ABC):
+    """Interface shared by every session backend: bytes values with a time to live."""
+
+    @abstractmethod
+    def get(self, key):
+        """Return the stored bytes, or None when missing or expired."""
+
+    @abstractmethod
+    def set(self, key, value, ttl=SESSION_TTL_SECONDS):
+        """Store bytes under key for ttl seconds."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Forget key if it is stored."""
+
+
+class MemorySessionBackend(SessionBackend):
+    """Sessions in this process, least recently used dropped past max_entries."""
+
+    def __init__(self, max_entries=SESSION_MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=SESSION_TTL_SECONDS):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions in a local SQLite file; expired rows are pruned as new ones are written."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path=SESSION_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL
+                )"""
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM sessions WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key, value, ttl=SESSION_TTL_SECONDS):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(value), time.time() + ttl),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            self._conn.commit()
+
+
+class RedisSessionBackend(SessionBackend):
+    """Sessions in a shared Redis, which expires them itself. Needs the redis package."""
+
+    def __init__(self, url=None, prefix="brand:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=SESSION_TTL_SECONDS):
+        self.client.set(self.prefix + key, value, ex=int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class SessionStore:
+    """Loads and saves session state through a backend, writing only when something changed."""
+
+    def __init__(self, backend, ttl=SESSION_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+
+    def load(self, session_id):
+        """Return (values, blob) for a stored session, or ({}, None)."""
+        try:
+            blob = self.backend.get("session:" + session_id)
+            return (decode_state(blob), blob) if blob else ({}, None)
+        except Exception as e:
+            # A broken or unreachable store starts a fresh session rather than failing the page
+            logger.warning("Loading session state failed: %s", e)
+            return {}, None
+
+    def save(self, session_id, blob):
+        try:
+            self.backend.set("session:" + session_id, blob, self.ttl)
+        except Exception as e:
+            logger.warning("Saving session state failed: %s", e)
+
+    def delete(self, session_id):
+        try:
+            self.backend.delete("session:" + session_id)
+        except Exception as e:
+            logger.warning("Deleting session state failed: %s", e)
+
+    def put_documents(self, chunks):
+        """Store document chunks once under a content key, which the session state then refers to."""
+        blob = encode_state({"chunks": chunks})
+        key = hashlib.sha256(blob).hexdigest()[:32]
+        try:
+            self.backend.set("documents:" + key, blob, self.ttl)
+        except Exception as e:
+            logger.warning("Saving document chunks failed: %s", e)
+        return key
+
+    def get_documents(self, key):
+        """The chunks stored under key, or [] once they have expired."""
+        try:
+            blob = self.backend.get("documents:" + key)
+            return decode_state(blob)["chunks"] if blob else []
+        except Exception as e:
+            logger.warning("Loading document chunks failed: %s", e)
+            return []
+
+
+_store = None
+_store_lock = threading.Lock()
+# Logins of the sessions this process served, by storage key (see LOGIN_KEYS)
+_logins = MemorySessionBackend()
+
+
+def get_session_store():
+    """Pick a backend from SESSION_STORE ("sqlite", "memory" or "redis")."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.getenv("SESSION_STORE", "sqlite")
+            if backend == "sqlite":
+                _store = SessionStore(SQLiteSessionBackend())
+            elif backend == "memory":
+                _store = SessionStore(MemorySessionBackend())
+            elif backend == "redis":
+                _store = SessionStore(RedisSessionBackend())
+            else:
+                raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
+        return _store
+
+
+def browser_binding(cookies):
+    """A digest of a secret the browser sends with every request but the URL never carries, or None.
+
+    This is Streamlit's XSRF cookie, which its server sets on the first page
+    load when XSRF protection is on (the default). The server re-masks the
+    cookie on every response, so the digest is taken of the token inside it.
+    """
+    value = cookies.get(BINDING_COOKIE) if cookies else None
+    if not value:
+        return None
+    parts = value.split("|")
+    if parts[0] == "2" and len(parts) == 4:
+        try:
+            mask, masked = bytes.fromhex(parts[1]), bytes.fromhex(parts[2])
+        except ValueError:
+            return None
+        if len(mask) != 4:
+            return None
+        value = bytes(byte ^ mask[i % 4] for i, byte in enumerate(masked)).hex()
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def _storage_key(session_id, binding):
+    return hashlib.sha256(f"{session_id}:{binding}".encode("utf-8")).hexdigest()
+
+
+def _new_session(session_state, query_params):
+    session_id = secrets.token_urlsafe(24)
+    query_params[SESSION_PARAM] = session_id
+    session_state["_session_id"] = session_id
+    session_state["_session_key"] = _storage_key(session_id, session_state["_session_binding"])
+    session_state["_session_digest"] = None
+    return session_id
+
+
+def restore_session(session_state, query_params, binding):
+    """Bring this browser session's stored state into session_state; returns the session ID.
+
+    State is stored under the ID in the URL together with binding (see
+    browser_binding), so a link copied out of the address bar restores nothing
+    in another browser. An ID with no stored state is replaced by a fresh one,
+    so a client cannot choose its own. Without a binding nothing is stored and
+    the state lives in this process only, as with plain Streamlit.
+
+    Only the first run a process sees for a session reads the store; later runs
+    already hold the state in memory.
+    """
+    session_state["_session_binding"] = binding
+    if binding is None:
+        session_state["_session_id"] = session_state["_session_key"] = None
+        return None
+    session_id = query_params.get(SESSION_PARAM)
+    if session_id and session_state.get("_session_id") == session_id:
+        return session_id
+    key = _storage_key(session_id, binding) if session_id else None
+    values, blob = get_session_store().load(key) if key else ({}, None)
+    if blob is None:
+        return _new_session(session_state, query_params)
+    for name, value in values.items():
+        if name in PERSISTED_KEYS:
+            session_state[name] = value
+    # Only the process the user signed in with has the login; elsewhere the app asks for it again
+    session_state.update(_logins.get(key) or {})
+    session_state["_session_id"] = session_id
+    session_state["_session_key"] = key
+    session_state["_session_digest"] = hashlib.sha256(blob).digest()
+    return session_id
+
+
+def rotate_session(session_state, query_params, user_id):
+    """Move the session to a fresh ID at login, and drop the stored state of the old one.
+
+    State restored from a session of another user, who left this browser
+    without logging out, is dropped from session_state as well.
+    """
+    previous = session_state.get("user")
+    if previous is not None and previous.id != user_id:
+        for name in PERSISTED_KEYS:
+            session_state.pop(name, None)
+    key = session_state.get("_session_key")
+    if not key:
+        return None
+    get_session_store().delete(key)
+    _logins.delete(key)
+    return _new_session(session_state, query_params)
+
+
+def save_session(session_state):
+    """Write the persisted keys back to the store if they changed during this run.
+
+    The login is kept in this process only.
+    """
+    key = session_state.get("_session_key")
+    if not key:
+        return False
+    if session_state.get("logged_in"):
+        _logins.set(key, {name: session_state.get(name) for name in LOGIN_KEYS})
+    blob = encode_state({name: session_state[name] for name in PERSISTED_KEYS if name in session_state})
+    digest = hashlib.sha256(blob).digest()
+    if digest == session_state.get("_session_digest"):
+        return False
+    get_session_store().save(key, blob)
+    session_state["_session_digest"] = digest
+    return True
+
+
+def end_session(session_state, query_params):
+    """Forget the stored session, e.g. on logout; the next run starts a new one."""
+    key = session_state.get("_session_key")
+    if key:
+        get_session_store().delete(key)
+        _logins.delete(key)
+    session_state["_session_id"] = session_state["_session_key"] = None
+    session_state["_session_digest"] = None
+    query_params.pop(SESSION_PARAM, None)
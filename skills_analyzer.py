@@ -1,14 +1,14 @@
 import streamlit as st
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
-import base64
+from brand_core import get_openai_client
+from llm_cache import cached_response
+from skills_prompts import QUESTION_FILES, build_prompt, load_prompt, load_questions
+from report_renderer import render_report
+from template_registry import TemplateError
+import contextlib
+import tracing
+from trace_panel import render_trace_panel
 
 
 # Try loading from Streamlit secrets first
@@ -26,8 +26,6 @@ if not api_key:
     st.error("OPENAI_API_KEY not found in environment variables")
     st.stop()
 
-client = OpenAI(api_key=api_key)
-
 # Access control
 allowed_keys = ["peterrocks", "rajrocks"]
 key = st.text_input("Enter access key:", type="password")
@@ -44,54 +42,21 @@ if key:
         # User type selection
         user_type = st.radio(
             "Select who you are:",
-            ["Knowledge Worker Seeking Career Growth or Organizational Shift - Internally or Switch Companies","Career Changer Moving into Enterprise/Business Architecture or AI as a Business-Technology Connector, Pivoting into more Strategic Role.","Neither: Creator, Student, Solopreneur, or Anyone Seeking more Clarity on Your Professional Identity."],
+            list(QUESTION_FILES),
             horizontal=True
         )
         
-        # Map user type to question file
-        question_files = {
-            "Knowledge Worker Seeking Career Growth or Organizational Shift - Internally or Switch Companies": "questions1.txt",
-            "Career Changer Moving into Enterprise/Business Architecture or AI as a Business-Technology Connector, Pivoting into more Strategic Role.": "questions2.txt",
-            "Neither: Creator, Student, Solopreneur, or Anyone Seeking more Clarity on Your Professional Identity.": "questions3.txt"
-        }
-        
-        selected_file = question_files[user_type]
+        selected_file = QUESTION_FILES[user_type]
         
-        # Read questions from file
-        def load_questions(file_path):
-            try:
-                questions = []
-                current_question = None
-                current_description = []
-                
-                with open(file_path, 'r') as file:
-                    for line in file:
-                        line = line.strip()
-                        if line.startswith('Q:'):
-                            if current_question is not None:
-                                questions.append((current_question, '\n'.join(current_description)))
-                            current_question = line[2:].strip()
-                            current_description = []
-                        elif line.startswith('D:'):
-                            current_description.append(line[2:].strip())
-                        elif line and current_description:  # If it's a continuation of the description
-                            current_description.append(line)
-                
-                if current_question is not None:
-                    questions.append((current_question, '\n'.join(current_description)))
-                
-                return questions
-            except FileNotFoundError:
-                st.error(f"Question file {file_path} not found. Please contact support.")
-                st.stop()
-
-        # Load prompt from file
-        def load_prompt(file_path="prompt.txt"):
-            with open(file_path, 'r') as file:
-                return file.read()
-
         # Load questions and prompt
-        questions = load_questions(selected_file)
+        try:
+            questions = load_questions(selected_file)
+        except FileNotFoundError:
+            st.error(f"Question file {selected_file} not found. Please contact support.")
+            st.stop()
+        except TemplateError:
+            st.error(f"Question file {selected_file} is invalid. Please contact support.")
+            st.stop()
         prompt_template = load_prompt()
 
         st.write("Answer the following questions to help identify your core competencies and shape your personal brand.")
@@ -108,96 +73,48 @@ if key:
             submitted = st.form_submit_button("Submit")
 
         if submitted:
-            with st.spinner("Analyzing your responses..."):
+            with st.spinner("Analyzing your responses..."), tracing.span("skills_analysis", question_file=selected_file) as run:
+                st.session_state.trace_ids = {"analysis": run.trace_id}
                 # Build the prompt
-                prompt = prompt_template + "\n\n"
-                
-                for i, ((question, _), response) in enumerate(zip(questions, responses), 1):
-                    prompt += f"{i}. {question}\n{response}\n\n"
+                with tracing.span("prompt_assembly"):
+                    prompt = build_prompt(prompt_template, questions, responses)
 
                 try:
-                    response = client.responses.create(
+                    result = cached_response(
+                        get_openai_client(api_key),
                         model="gpt-4.1",
                         input=prompt,
                         temperature=0.7
                     )
-
-                    result = response.output_text
-                    st.success("Here is your personal brand insight:")
-                    st.write(result)
-
-                    # PDF Download functionality
-                    st.markdown("---")
-                    st.subheader("Download Your Results")
-                    
-                    def create_pdf(result, responses, questions):
-                        buffer = io.BytesIO()
-                        doc = SimpleDocTemplate(buffer, pagesize=letter)
-                        styles = getSampleStyleSheet()
-                        
-                        # Custom styles
-                        title_style = ParagraphStyle(
-                            'CustomTitle',
-                            parent=styles['Heading1'],
-                            fontSize=16,
-                            spaceAfter=30
-                        )
-                        
-                        body_style = ParagraphStyle(
-                            'CustomBody',
-                            parent=styles['Normal'],
-                            fontSize=12,
-                            spaceAfter=12
-                        )
-                        
-                        bold_style = ParagraphStyle(
-                            'BoldStyle',
-                            parent=styles['Normal'],
-                            fontSize=12,
-                            spaceAfter=12,
-                            fontName='Helvetica-Bold'
-                        )
-                        
-                        # Build PDF content
-                        content = []
-                        
-                        # Add title
-                        content.append(Paragraph("Your Personal Brand Analysis", title_style))
-                        content.append(Spacer(1, 20))
-                        
-                        # Process the result to handle any line starting with **
-                        lines = result.split('\n')
-                        for line in lines:
-                            if line.strip().startswith('**'):
-                                # Remove the ** and make it bold
-                                clean_line = line.strip().replace('**', '')
-                                content.append(Paragraph(f"<b>{clean_line}</b>", bold_style))
-                            else:
-                                content.append(Paragraph(line, body_style))
-                        
-                        # Add page break before responses
-                        content.append(PageBreak())
-                        content.append(Spacer(1, 20))
-                        
-                        # Add questions and responses
-                        content.append(Paragraph("<b>Your Responses</b>", bold_style))
-                        for i, ((question, _), response) in enumerate(zip(questions, responses), 1):
-                            content.append(Paragraph(f"<b>Question {i}: {question}</b>", bold_style))
-                            content.append(Paragraph(response, body_style))
-                            content.append(Spacer(1, 20))
-                        
-                        # Build PDF
-                        doc.build(content)
-                        return buffer.getvalue()
-
-                    # Create PDF
-                    pdf_data = create_pdf(result, responses, questions)
-                    
-                    # Create download button
-                    b64 = base64.b64encode(pdf_data).decode()
-                    href = f'<a href="data:application/pdf;base64,{b64}" download="personal-brand-analysis.pdf">📥 Download PDF Report</a>'
-                    st.markdown(href, unsafe_allow_html=True)
+                    # Kept in session state so the report survives the rerun a download click triggers
+                    st.session_state.skills_result = (selected_file, result, responses)
 
                 except Exception as e:
                     st.error("An error occurred while trying to generate insights. Please check your API key and try again.")
                     st.exception(e)
+
+        saved = st.session_state.get("skills_result")
+        if saved and saved[0] == selected_file:
+            _, result, saved_responses = saved
+            st.success("Here is your personal brand insight:")
+            st.write(result)
+
+            # PDF Download functionality
+            st.markdown("---")
+            st.subheader("Download Your Results")
+
+            # Rendered once per distinct report and served by Streamlit's media endpoint;
+            # only the run that produced the report adds the render to its trace
+            pdf_span = tracing.span("pdf", trace_id=st.session_state.trace_ids["analysis"]) if submitted else contextlib.nullcontext()
+            from report_engine import create_skills_pdf
+            with pdf_span:
+                pdf_data = render_report(create_skills_pdf, result, saved_responses, questions)
+            st.download_button(
+                "📥 Download PDF Report",
+                data=pdf_data,
+                file_name="personal-brand-analysis.pdf",
+                mime="application/pdf"
+            )
+
+        with st.sidebar:
+            render_trace_panel(st.session_state.get("trace_ids", {}))
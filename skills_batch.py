@@ -0,0 +1,240 @@
+"""Headless batch runner for the skills analyzer.
+
+Reads respondents from a JSONL file, builds the same prompt as
+skills_analyzer.py from prompt.txt and the questions1/2/3.txt banks, and runs
+the Responses API calls concurrently under a concurrency cap.
+
+Each input line looks like:
+
+    {"id": "r-001", "bank": "questions1", "answers": ["Jane", "People ask me ...", ...]}
+
+"bank" is a bank name, question file or the respondent type shown in the app.
+"answers" is either a list in question order or an object mapping question
+text (or 1-based question number) to answer.
+
+The output JSONL doubles as the checkpoint: every finished respondent is
+appended and flushed immediately, and a rerun skips IDs already in it, so a
+crashed run resumes where it stopped. Failures go to <output>.errors.jsonl and
+are retried on the next run.
+
+    python skills_batch.py respondents.jsonl -o results.jsonl --concurrency 32 --pdf-dir reports/
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from llm_cache import acached_response
+from llm_retry import RetryPolicy, get_retry_metrics
+from skills_prompts import PROMPT_FILE, build_prompt, load_prompt, load_questions, resolve_question_file
+from report_engine import create_skills_pdf
+from template_registry import get_registry
+
+logger = logging.getLogger("skills_batch")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_completed_ids(output_path):
+    """IDs already written to the output file by an earlier run."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r") as file:
+        for line in file:
+            try:
+                completed.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                # A torn final line from a crash; that respondent is simply redone
+                continue
+    return completed
+
+
+def iter_respondents(input_path):
+    """Yield (id, record) for each non-empty input line."""
+    with open(input_path, "r") as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield str(record.get("id", f"row-{line_number}")), record
+
+
+def order_answers(questions, answers):
+    """Line answers up with the bank's questions, filling gaps with empty strings."""
+    if isinstance(answers, list):
+        return [str(a) for a in answers[:len(questions)]] + [""] * max(0, len(questions) - len(answers))
+    ordered = []
+    for i, (question, _) in enumerate(questions, 1):
+        answer = answers.get(question, answers.get(str(i), ""))
+        ordered.append(str(answer))
+    return ordered
+
+
+class BatchRun:
+    """One resumable batch over an input file."""
+
+    def __init__(self, args):
+        self.args = args
+        self.base_dir = args.base_dir
+        self.prompt_template = load_prompt(os.path.join(self.base_dir, PROMPT_FILE))
+        self.banks = {}
+        self.client = AsyncOpenAI()
+        self.retry_policy = RetryPolicy(
+            max_attempts=args.max_retries + 1,
+            tokens_per_minute=args.tpm,
+            requests_per_minute=args.rpm,
+        )
+        self.errors_path = args.output + ".errors.jsonl"
+        self.completed = read_completed_ids(args.output)
+        self.counts = {"done": 0, "skipped": 0, "failed": 0}
+        self.rows_since_sync = 0
+
+    def questions_for(self, bank):
+        file_name = resolve_question_file(bank)
+        if file_name not in self.banks:
+            self.banks[file_name] = load_questions(os.path.join(self.base_dir, file_name))
+        return self.banks[file_name]
+
+    def append(self, file, record):
+        file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        file.flush()
+        self.rows_since_sync += 1
+        if self.rows_since_sync >= 50:
+            os.fsync(file.fileno())
+            self.rows_since_sync = 0
+
+    async def process(self, respondent_id, record, output, errors):
+        try:
+            questions = self.questions_for(record["bank"])
+            responses = order_answers(questions, record.get("answers", []))
+            prompt = build_prompt(self.prompt_template, questions, responses)
+            started = time.perf_counter()
+            result = await acached_response(
+                self.client,
+                model=self.args.model,
+                input=prompt,
+                temperature=self.args.temperature,
+                bypass=self.args.no_cache,
+                retry_policy=self.retry_policy
+            )
+            latency = time.perf_counter() - started
+            if self.args.pdf_dir:
+                pdf_data = await asyncio.to_thread(create_skills_pdf, result, responses, questions)
+                with open(os.path.join(self.args.pdf_dir, f"{respondent_id}.pdf"), "wb") as file:
+                    file.write(pdf_data)
+        except Exception as e:
+            self.counts["failed"] += 1
+            logger.warning("Respondent %s failed: %s", respondent_id, e)
+            self.append(errors, {"id": respondent_id, "error": f"{type(e).__name__}: {e}", "at": time.time()})
+            return
+
+        self.append(output, {
+            "id": respondent_id,
+            "bank": record["bank"],
+            "model": self.args.model,
+            # Which prompt and question bank text produced this result
+            "template_version": get_registry().version(
+                os.path.join(self.base_dir, PROMPT_FILE),
+                os.path.join(self.base_dir, resolve_question_file(record["bank"]))
+            ),
+            "result": result,
+            "latency": round(latency, 3),
+        })
+        self.counts["done"] += 1
+
+    async def run(self):
+        if self.args.pdf_dir:
+            os.makedirs(self.args.pdf_dir, exist_ok=True)
+        queue = asyncio.Queue(maxsize=self.args.concurrency * 2)
+        started = time.perf_counter()
+
+        with open(self.args.output, "a") as output, open(self.errors_path, "a") as errors:
+
+            async def worker():
+                while True:
+                    item = await queue.get()
+                    try:
+                        if item is None:
+                            return
+                        await self.process(*item, output, errors)
+                        total = self.counts["done"] + self.counts["failed"]
+                        if total % self.args.progress_every == 0:
+                            rate = total / (time.perf_counter() - started)
+                            logger.info("%d processed (%d failed), %.1f respondents/s", total, self.counts["failed"], rate)
+                    finally:
+                        queue.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.args.concurrency)]
+            queued = 0
+            for respondent_id, record in iter_respondents(self.args.input):
+                if respondent_id in self.completed:
+                    self.counts["skipped"] += 1
+                    continue
+                if self.args.limit and queued >= self.args.limit:
+                    break
+                # Mark as seen so duplicate IDs in the input are only run once
+                self.completed.add(respondent_id)
+                await queue.put((respondent_id, record))
+                queued += 1
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            os.fsync(output.fileno())
+
+        elapsed = time.perf_counter() - started
+        processed = self.counts["done"] + self.counts["failed"]
+        logger.info(
+            "Finished: %d done, %d failed, %d skipped from checkpoint in %.1fs (%.2f respondents/s)",
+            self.counts["done"], self.counts["failed"], self.counts["skipped"], elapsed,
+            processed / elapsed if elapsed else 0.0,
+        )
+        retry_stats = get_retry_metrics().as_dict()
+        logger.info(
+            "OpenAI: %d retries (%d rate limited), %.1fs backing off, %.1fs throttled client-side",
+            retry_stats["retries"], retry_stats["rate_limited"],
+            retry_stats["backoff_seconds"], retry_stats["throttle_seconds"],
+        )
+        return self.counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the skills analyzer over a JSONL file of respondents.")
+    parser.add_argument("input", help="JSONL file of respondents")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file for results; also the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="maximum concurrent OpenAI calls (default 16)")
+    parser.add_argument("--model", default="gpt-4.1")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--pdf-dir", help="also render a PDF report per respondent into this directory")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many new respondents")
+    parser.add_argument("--max-retries", type=int, default=5, help="retries per call on rate limits and transient errors")
+    parser.add_argument("--tpm", type=int, help="tokens-per-minute budget for the model (default OPENAI_TPM)")
+    parser.add_argument("--rpm", type=int, help="requests-per-minute budget for the model (default OPENAI_RPM)")
+    parser.add_argument("--no-cache", action="store_true", help="always call the model instead of reusing cached answers")
+    parser.add_argument("--base-dir", default=BASE_DIR, help="directory holding prompt.txt and the question banks")
+    parser.add_argument("--progress-every", type=int, default=100)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(message)s")
+    # One line per HTTP request drowns out progress on large runs
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    args = parse_args(argv)
+    if not os.getenv("OPENAI_API_KEY"):
+        logger.error("OPENAI_API_KEY not found in environment variables")
+        return 2
+    counts = asyncio.run(BatchRun(args).run())
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""Question banks and prompt assembly for the skills analyzer.
+
+Shared by the Streamlit app (skills_analyzer.py) and the headless batch
+runner (skills_batch.py) so both send exactly the same prompt.
+"""
+import os
+
+from template_registry import get_registry
+
+# Respondent type shown in the app -> question bank file
+QUESTION_FILES = {
+    "Knowledge Worker Seeking Career Growth or Organizational Shift - Internally or Switch Companies": "questions1.txt",
+    "Career Changer Moving into Enterprise/Business Architecture or AI as a Business-Technology Connector, Pivoting into more Strategic Role.": "questions2.txt",
+    "Neither: Creator, Student, Solopreneur, or Anyone Seeking more Clarity on Your Professional Identity.": "questions3.txt"
+}
+
+PROMPT_FILE = "prompt.txt"
+
+
+def load_questions(file_path):
+    """Return the validated (question, description) tuples of a Q:/D: question bank."""
+    return get_registry().questions(file_path).questions
+
+
+def load_prompt(file_path=PROMPT_FILE):
+    return get_registry().template(file_path).text
+
+
+def resolve_question_file(bank):
+    """Map a bank name ("questions1"), file name or respondent type to its question file."""
+    if bank in QUESTION_FILES:
+        return QUESTION_FILES[bank]
+    file_name = bank if bank.endswith(".txt") else f"{bank}.txt"
+    if file_name in QUESTION_FILES.values() or os.path.exists(get_registry().resolve_path(file_name)):
+        return file_name
+    raise ValueError(f"Unknown question bank: {bank}")
+
+
+def build_prompt(prompt_template, questions, responses):
+    """Append the numbered questions and answers to the prompt template."""
+    prompt = prompt_template + "\n\n"
+    for i, ((question, _), response) in enumerate(zip(questions, responses), 1):
+        prompt += f"{i}. {question}\n{response}\n\n"
+    return prompt
@@ -0,0 +1,187 @@
+"""Process-wide registry of prompt templates and question banks.
+
+Each file is read, parsed and validated once and then served from memory as an
+immutable object. On every access the file's mtime is checked, so editing a
+template on disk takes effect on the next rerun without restarting the app.
+An edit that fails validation is logged and the last good version keeps being
+served.
+
+Every compiled object carries a version hash of its content; callers use it
+(or TemplateRegistry.version for several files) as part of cache keys.
+"""
+import hashlib
+import logging
+import os
+import string
+import threading
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Placeholders each template must contain; templates not listed are used verbatim
+REQUIRED_PLACEHOLDERS = {
+    "analysis_prompt.txt": ("user_name", "initial_context", "responses"),
+}
+
+
+class TemplateError(ValueError):
+    """A template or question bank failed validation."""
+
+
+def content_version(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    text: str
+    placeholders: frozenset
+    version: str
+
+    def render(self, **values):
+        """Fill the template's placeholders."""
+        return self.text.format(**values)
+
+
+@dataclass(frozen=True)
+class QuestionBank:
+    name: str
+    questions: tuple  # ((question, description), ...)
+    version: str
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions)
+
+
+def compile_template(name, text):
+    """Check a template's placeholders and return a PromptTemplate."""
+    required = REQUIRED_PLACEHOLDERS.get(os.path.basename(name))
+    if required is None:
+        return PromptTemplate(name, text, frozenset(), content_version(text))
+    try:
+        fields = {field for _, field, _, _ in string.Formatter().parse(text) if field is not None}
+    except ValueError as e:
+        raise TemplateError(f"{name}: malformed placeholder ({e})")
+    missing = set(required) - fields
+    if missing:
+        raise TemplateError(f"{name}: missing placeholders {sorted(missing)}")
+    unknown = fields - set(required)
+    if unknown:
+        # str.format would raise KeyError for these at render time
+        raise TemplateError(f"{name}: unknown placeholders {sorted(unknown)}; escape literal braces as {{{{ }}}}")
+    return PromptTemplate(name, text, frozenset(fields), content_version(text))
+
+
+def compile_questions(name, text):
+    """Parse a Q:/D: question bank, rejecting anything the parser would silently drop."""
+    questions = []
+    current_question = None
+    current_description = []
+
+    for line_number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if line.startswith('Q:'):
+            if current_question is not None:
+                questions.append((current_question, '\n'.join(current_description)))
+            current_question = line[2:].strip()
+            current_description = []
+            if not current_question:
+                raise TemplateError(f"{name}:{line_number}: empty question")
+        elif line.startswith('D:'):
+            if current_question is None:
+                raise TemplateError(f"{name}:{line_number}: description before the first question")
+            current_description.append(line[2:].strip())
+        elif line and current_description:  # If it's a continuation of the description
+            current_description.append(line)
+        elif line:
+            raise TemplateError(f"{name}:{line_number}: text outside a Q:/D: block")
+
+    if current_question is not None:
+        questions.append((current_question, '\n'.join(current_description)))
+    if not questions:
+        raise TemplateError(f"{name}: no questions found")
+    for question, description in questions:
+        if not description:
+            raise TemplateError(f"{name}: question {question!r} has no D: description")
+
+    return QuestionBank(name, tuple(questions), content_version(text))
+
+
+class TemplateRegistry:
+    """Compiled templates and question banks, reloaded when their file changes."""
+
+    def __init__(self, base_dir=BASE_DIR):
+        self.base_dir = base_dir
+        self._entries = {}  # path -> ((mtime_ns, size), compiled)
+        self._lock = threading.Lock()
+
+    def resolve_path(self, name):
+        """Absolute path of a registry file; relative names are under base_dir."""
+        return name if os.path.isabs(name) else os.path.join(self.base_dir, name)
+
+    def _get(self, name, compile_func):
+        path = self.resolve_path(name)
+        stat = os.stat(path)  # FileNotFoundError propagates to the caller
+        signature = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+            with open(path, "r", encoding="utf-8") as file:
+                text = file.read()
+            try:
+                compiled = compile_func(name, text)
+            except TemplateError:
+                if entry is None:
+                    raise
+                logger.exception("Keeping the previous version of %s", name)
+                # Remember the broken signature so the error is logged once, not on every rerun
+                self._entries[path] = (signature, entry[1])
+                return entry[1]
+            if entry is not None:
+                logger.info("Reloaded %s (version %s)", name, compiled.version)
+            self._entries[path] = (signature, compiled)
+            return compiled
+
+    def template(self, name):
+        """Return the compiled PromptTemplate for a file."""
+        return self._get(name, compile_template)
+
+    def questions(self, name):
+        """Return the compiled QuestionBank for a file."""
+        return self._get(name, compile_questions)
+
+    def version(self, *names):
+        """Combined version hash of the named files, for use in cache keys."""
+        versions = []
+        for name in names:
+            entry = self._entries.get(self.resolve_path(name))
+            if entry is None:
+                with open(self.resolve_path(name), "r", encoding="utf-8") as file:
+                    versions.append(content_version(file.read()))
+            else:
+                versions.append(entry[1].version)
+        return content_version("|".join(versions))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide template registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TemplateRegistry()
+        return _registry
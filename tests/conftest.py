@@ -0,0 +1,10 @@
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+# Spans are still recorded in memory, but not appended to .cache/traces.jsonl
+os.environ.setdefault("TRACE_SINK", "none")
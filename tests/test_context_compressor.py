@@ -0,0 +1,39 @@
+from context_compressor import compress_documents, estimate_tokens, strip_page_furniture
+
+
+def test_strip_page_furniture_removes_repeated_headers_and_page_numbers():
+    page = "ACME Corp - Confidential\nReal content line {n}.\nPage {n} of 3"
+    text = "\n".join(page.format(n=n) for n in range(1, 4))
+    stripped, removed = strip_page_furniture(text)
+    assert stripped.split("\n") == [f"Real content line {n}." for n in range(1, 4)]
+    assert removed == 6
+
+
+def test_compression_drops_sentences_the_user_already_wrote():
+    context = "I lead a platform engineering team of twelve people at a fintech startup."
+    docs = [{"filename": "resume.txt", "content": (
+        "I lead a platform engineering team of twelve people at a fintech startup.\n\n"
+        "Previously built payment reconciliation systems processing millions of transactions."
+    )}]
+    compressed, report = compress_documents(docs, context, token_budget=1000)
+    assert compressed == [{"filename": "resume.txt", "content": "Previously built payment reconciliation systems processing millions of transactions."}]
+    assert report.duplicate_sentences == 1
+
+
+def test_compression_respects_the_token_budget():
+    sentences = [f"Delivered project number {n} on time with measurable revenue growth." for n in range(50)]
+    docs = [{"filename": "a.txt", "content": "\n\n".join(sentences)}]
+    compressed, report = compress_documents(docs, "", token_budget=100)
+    assert sum(estimate_tokens(doc["content"]) for doc in compressed) <= 100
+    assert report.dropped_sentences > 0
+    assert report.tokens_saved == report.tokens_before - report.tokens_after > 0
+    # Kept sentences stay in document order
+    kept = compressed[0]["content"].split("\n")
+    assert kept == sorted(kept, key=sentences.index)
+
+
+def test_compression_drops_repeated_sentences_within_a_document():
+    docs = [{"filename": "a.txt", "content": "Built a data platform.\n\nBuilt a data platform.\n\nMentored engineers."}]
+    compressed, report = compress_documents(docs, "", token_budget=1000)
+    assert compressed[0]["content"] == "Built a data platform.\nMentored engineers."
+    assert report.duplicate_sentences == 1
@@ -0,0 +1,51 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import document_extraction
+from document_extraction import TXT_MIME, process_uploaded_files
+
+
+class DictCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+
+def upload(name, text):
+    data = text.encode("utf-8")
+    return SimpleNamespace(name=name, type=TXT_MIME, getvalue=lambda: data)
+
+
+@pytest.fixture
+def one_slow_worker(monkeypatch):
+    """Each extraction takes 0.2s, and files wait for the single worker."""
+    monkeypatch.setattr(document_extraction, "MAX_FILE_WORKERS", 1)
+
+    def slow_extract(mime_type, data, deadline=None, max_chars=None):
+        time.sleep(0.2)
+        return data.decode("utf-8")
+
+    monkeypatch.setattr(document_extraction, "extract_document", slow_extract)
+
+
+def test_time_budget_starts_when_a_worker_picks_the_file_up(one_slow_worker):
+    files = [upload("a.txt", "first"), upload("b.txt", "second")]
+    docs = process_uploaded_files(files, time_budget=0.35, cache=DictCache(), total_budget=5)
+    # b.txt is done 0.4s after submission, but only 0.2s after it started
+    assert [doc["content"] for doc in docs] == ["first", "second"]
+
+
+def test_overall_budget_gives_up_on_files_still_waiting(one_slow_worker):
+    files = [upload("a.txt", "first"), upload("b.txt", "second"), upload("c.txt", "third")]
+    started = time.monotonic()
+    docs = process_uploaded_files(files, time_budget=5, cache=DictCache(), total_budget=0.3)
+    assert time.monotonic() - started < 0.5
+    assert docs[0]["content"] == "first"
+    assert all(doc["content"].startswith("Could not extract") for doc in docs[1:])
@@ -0,0 +1,47 @@
+import time
+
+from draft_autosave import DraftAutosaver, DraftStore
+
+
+class MemoryDraftStore(DraftStore):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.writes = []
+
+    def save_answers(self, user_id, questions_key, answers):
+        if self.fail:
+            raise PermissionError("JWT expired")
+        self.writes.append(dict(answers))
+
+    def load_answers(self, user_id, questions_key):
+        return {}
+
+
+def test_only_changed_answers_are_written():
+    store = MemoryDraftStore()
+    autosaver = DraftAutosaver(debounce=60, max_delay=60)
+    autosaver.update(store, "u", "q", ["a", ""])
+    autosaver.update(store, "u", "q", ["a", "b"])
+    autosaver.flush("u")
+    autosaver.update(store, "u", "q", ["a", "b"])
+    autosaver.update(store, "u", "q", ["a", "c"])
+    autosaver.flush("u")
+    assert store.writes == [{0: "a", 1: "b"}, {1: "c"}]
+
+
+def test_failing_writes_are_dropped_and_resent_with_the_next_edit():
+    expired = MemoryDraftStore(fail=True)
+    autosaver = DraftAutosaver(debounce=60, max_delay=0, max_attempts=2)
+    autosaver.update(expired, "u", "q", ["a", "b"])
+    autosaver.flush("u")
+    assert ("u", "q") in autosaver._pending
+    time.sleep(0.01)
+    autosaver.flush("u")
+    assert ("u", "q") not in autosaver._pending
+    assert autosaver.metrics.failures == 2
+
+    # A later rerun brings a store with a fresh token and only one changed answer
+    fresh = MemoryDraftStore()
+    autosaver.update(fresh, "u", "q", ["a", "b2"])
+    autosaver.flush("u")
+    assert fresh.writes == [{0: "a", 1: "b2"}]
@@ -0,0 +1,149 @@
+import threading
+import time
+
+from job_queue import DONE, FAILED, RUNNING, JobQueue
+from results_store import fingerprint, user_job_id
+from session_store import MemorySessionBackend
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def replicas(**kwargs):
+    """Two job queues that only share the backend, like two app processes."""
+    backend = MemorySessionBackend()
+    return JobQueue(backend, publish_interval=0, **kwargs), JobQueue(backend, publish_interval=0, **kwargs)
+
+
+def test_other_replica_sees_running_job_partials_and_result():
+    a, b = replicas()
+    release = threading.Event()
+
+    def work(job):
+        job.set_partial("analysis", "Half of it")
+        release.wait(5)
+        return {"analysis": "All of it", "pdf": b"%PDF"}
+
+    job_id = a.submit("analysis", work, owner="user-1")
+    wait_for(lambda: (b.get(job_id) or a.get(job_id)).snapshot().get("analysis"))
+
+    seen = b.get(job_id)
+    assert seen.status == RUNNING and seen.owner == "user-1"
+    assert seen.snapshot() == {"analysis": "Half of it"}
+
+    release.set()
+    wait_for(lambda: b.get(job_id).status == DONE)
+    assert b.get(job_id).result == {"analysis": "All of it", "pdf": b"%PDF"}
+
+
+def test_submitting_on_another_replica_joins_the_running_job():
+    a, b = replicas()
+    release = threading.Event()
+    runs = []
+
+    def work(job):
+        runs.append(job.id)
+        release.wait(5)
+        return {}
+
+    job_id = a.submit("analysis", work, job_id="same-inputs")
+    wait_for(lambda: runs)
+    assert b.submit("analysis", work, job_id="same-inputs") == job_id
+    release.set()
+    wait_for(lambda: b.get(job_id).status == DONE)
+    assert runs == [job_id]
+
+    # A finished job is reused too, unless forced
+    b.submit("analysis", work, job_id="same-inputs")
+    assert runs == [job_id]
+
+
+def test_failures_are_visible_to_other_replicas():
+    a, b = replicas()
+
+    def work(job):
+        raise ValueError("bad input")
+
+    job_id = a.submit("analysis", work)
+    wait_for(lambda: b.get(job_id) is not None and b.get(job_id).status == FAILED)
+    assert "bad input" in b.get(job_id).error
+
+
+def test_job_of_a_vanished_replica_is_reported_failed():
+    a, b = replicas(stale_after=0.05)
+    release = threading.Event()
+    job_id = a.submit("analysis", lambda job: release.wait(5) and {})
+    wait_for(lambda: b.get(job_id) is not None and b.get(job_id).status in (RUNNING, FAILED))
+    time.sleep(0.1)
+    assert b.get(job_id).status == FAILED
+    release.set()
+
+
+def test_partials_are_published_at_most_once_per_interval():
+    backend = MemorySessionBackend()
+    writes = []
+    original_set = backend.set
+    backend.set = lambda key, value, ttl: writes.append(key) or original_set(key, value, ttl)
+    queue = JobQueue(backend, publish_interval=60)
+
+    def work(job):
+        for i in range(100):
+            job.set_partial("analysis", "x" * i)
+        return {}
+
+    job_id = queue.submit("analysis", work)
+    wait_for(lambda: queue.get(job_id).status == DONE)
+    # Queued, running, one partial and the final state
+    assert len(writes) == 4
+
+
+def test_users_with_the_same_inputs_get_separate_jobs():
+    queue = JobQueue(MemorySessionBackend())
+    analysis_key = fingerprint("analysis", "gpt-4", "the same prompt", ["the same answers"])
+
+    def work(job, user_id):
+        return {"analysis": f"for {user_id}"}
+
+    job_ids = {
+        user_id: queue.submit("analysis", work, user_id, job_id=user_job_id(user_id, analysis_key), owner=user_id)
+        for user_id in ("user-1", "user-2")
+    }
+    assert job_ids["user-1"] != job_ids["user-2"]
+
+    for user_id, job_id in job_ids.items():
+        wait_for(lambda: queue.get(job_id).status == DONE)
+        job = queue.get(job_id)
+        assert job.owner == user_id
+        assert job.result == {"analysis": f"for {user_id}"}
+
+
+def test_finished_question_job_is_not_handed_to_another_user():
+    queue = JobQueue(MemorySessionBackend())
+    questions_key = fingerprint("questions", "gpt-4", "system prompt", "the same context")
+
+    def work(job, user_id):
+        return {"questions_data": [{"question": f"For {user_id}?", "description": ""}]}
+
+    first = queue.submit("questions", work, "user-1", job_id=user_job_id("user-1", questions_key), owner="user-1")
+    wait_for(lambda: queue.get(first).status == DONE)
+
+    second = queue.submit("questions", work, "user-2", job_id=user_job_id("user-2", questions_key), owner="user-2")
+    assert second != first
+    wait_for(lambda: queue.get(second).status == DONE)
+    assert queue.get(second).owner == "user-2"
+    assert queue.get(second).result["questions_data"][0]["question"] == "For user-2?"
+
+
+def test_only_the_latest_finished_jobs_stay_in_memory():
+    backend = MemorySessionBackend()
+    queue = JobQueue(backend, cache_entries=2)
+    job_ids = [queue.submit("analysis", lambda job, n: {"n": n}, n) for n in range(5)]
+    wait_for(lambda: all(queue.get(job_id).status == DONE for job_id in job_ids))
+
+    assert len(queue._finished) == 2 and not queue._jobs
+    # Older ones are still read back from the backend
+    assert queue.get(job_ids[0]).result == {"n": 0}
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from llm_pipeline import Pipeline, PipelineError
+
+
+def run(pipeline, timeout=None):
+    return asyncio.run(pipeline.run(timeout=timeout))
+
+
+def test_stages_receive_their_dependencies_results():
+    async def analysis():
+        return "analysis"
+
+    async def figures(analysis):
+        return analysis + "+figures"
+
+    async def pdf(analysis, figures):
+        return [analysis, figures]
+
+    pipeline = Pipeline()
+    pipeline.add("analysis", analysis)
+    pipeline.add("figures", figures, deps=["analysis"])
+    pipeline.add("pdf", pdf, deps=["analysis", "figures"])
+    results, report = run(pipeline)
+
+    assert results == {"analysis": "analysis", "figures": "analysis+figures", "pdf": ["analysis", "analysis+figures"]}
+    assert report.critical_path == ["analysis", "figures", "pdf"]
+    assert set(report.status.values()) == {"done"}
+
+
+def test_independent_stages_overlap():
+    async def slow():
+        await asyncio.sleep(0.2)
+
+    pipeline = Pipeline()
+    pipeline.add("a", slow)
+    pipeline.add("b", slow)
+    _, report = run(pipeline)
+    assert report.wall_time < 0.35
+
+
+def test_undeclared_or_duplicate_stages_are_rejected():
+    async def noop():
+        pass
+
+    pipeline = Pipeline().add("a", noop)
+    with pytest.raises(ValueError):
+        pipeline.add("a", noop)
+    with pytest.raises(ValueError):
+        pipeline.add("b", noop, deps=["missing"])
+
+
+def test_stage_timeout_cancels_the_rest():
+    cancelled = []
+
+    async def hangs():
+        await asyncio.sleep(10)
+
+    async def sibling():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("sibling")
+            raise
+
+    async def downstream(hangs):
+        raise AssertionError("must not start")
+
+    pipeline = Pipeline()
+    pipeline.add("hangs", hangs, timeout=0.05)
+    pipeline.add("sibling", sibling)
+    pipeline.add("downstream", downstream, deps=["hangs"])
+    with pytest.raises(PipelineError) as info:
+        run(pipeline)
+
+    error = info.value
+    assert error.stage == "hangs"
+    assert isinstance(error.error, asyncio.TimeoutError)
+    assert error.report.status["hangs"] == "timeout"
+    assert error.report.status["sibling"] == "cancelled"
+    assert "downstream" not in error.report.status
+    assert cancelled == ["sibling"]
+
+
+def test_stage_failure_carries_stage_and_report():
+    async def fails(ok):
+        raise RuntimeError("boom")
+
+    async def ok():
+        return 1
+
+    pipeline = Pipeline()
+    pipeline.add("ok", ok)
+    pipeline.add("fails", fails, deps=["ok"])
+    with pytest.raises(PipelineError) as info:
+        run(pipeline)
+
+    assert info.value.stage == "fails"
+    assert isinstance(info.value.error, RuntimeError)
+    assert info.value.report.status == {"ok": "done", "fails": "failed"}
+
+
+def test_pipeline_timeout_cancels_running_stages():
+    async def hangs():
+        await asyncio.sleep(10)
+
+    pipeline = Pipeline().add("hangs", hangs)
+    with pytest.raises(PipelineError) as info:
+        run(pipeline, timeout=0.05)
+
+    assert info.value.stage == "pipeline"
+    assert info.value.report.status["hangs"] == "cancelled"
+
+
+def test_cancelling_the_run_cancels_its_stages():
+    cancelled = []
+
+    async def main():
+        running = asyncio.Event()
+
+        async def hangs():
+            running.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append("hangs")
+                raise
+
+        task = asyncio.ensure_future(Pipeline().add("hangs", hangs).run())
+        await running.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert cancelled == ["hangs"]
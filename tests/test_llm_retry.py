@@ -0,0 +1,97 @@
+import pytest
+
+from llm_retry import (
+    DEFAULT_POLICY,
+    RetryPolicy,
+    TokenBucket,
+    _throttle,
+    estimate_request_tokens,
+    get_bucket,
+    parse_duration,
+    retry_after_seconds,
+)
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("20ms", 0.02),
+    ("1.5s", 1.5),
+    ("6m0s", 360.0),
+    ("1h2m", 3720.0),
+    ("3", 3.0),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds)
+
+
+def test_parse_duration_rejects_unknown_values():
+    assert parse_duration("soon") is None
+    assert parse_duration(None) is None
+
+
+def test_retry_after_prefers_milliseconds():
+    assert retry_after_seconds({"retry-after-ms": "250", "retry-after": "5"}) == 0.25
+    assert retry_after_seconds({"retry-after": "5"}) == 5.0
+    assert retry_after_seconds({}) is None
+
+
+def test_estimate_request_tokens_counts_prompt_and_completion():
+    kwargs = {"messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 100}
+    assert estimate_request_tokens(kwargs) == len("x" * 400) // 4 + 100
+
+
+def test_bucket_does_not_wait_within_budget():
+    bucket = TokenBucket(tokens_per_minute=6000, requests_per_minute=60)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(1000) == 0.0
+
+
+def test_bucket_waits_for_the_refill_of_the_overdraft():
+    bucket = TokenBucket(tokens_per_minute=6000, requests_per_minute=600)
+    assert bucket.reserve(6000) == 0.0
+    # 600 tokens over budget refill in 6 seconds at 100 tokens per second
+    assert bucket.reserve(600) == pytest.approx(6.0, abs=0.05)
+
+
+def test_bucket_limits_requests_as_well_as_tokens():
+    bucket = TokenBucket(tokens_per_minute=10 ** 9, requests_per_minute=60)
+    waits = [bucket.reserve(1) for _ in range(61)]
+    assert waits[:60] == [0.0] * 60
+    assert waits[60] == pytest.approx(1.0, abs=0.05)
+
+
+def test_oversized_request_only_waits_for_a_full_bucket():
+    bucket = TokenBucket(tokens_per_minute=6000, requests_per_minute=600)
+    bucket.reserve(6000)
+    assert bucket.reserve(10 ** 6) == pytest.approx(60.0, abs=0.05)
+
+
+def test_bucket_trusts_tighter_server_headers():
+    bucket = TokenBucket(tokens_per_minute=6000, requests_per_minute=600)
+    bucket.update_from_headers({"x-ratelimit-remaining-tokens": "0", "x-ratelimit-limit-tokens": "6000"})
+    assert bucket.reserve(100) == pytest.approx(1.0, abs=0.05)
+
+
+def test_block_for_holds_every_caller_back():
+    bucket = TokenBucket(tokens_per_minute=6000, requests_per_minute=600)
+    bucket.block_for(2.0)
+    assert bucket.reserve(1) == pytest.approx(2.0, abs=0.05)
+
+
+def test_retries_of_a_call_do_not_take_budget_again():
+    bucket = TokenBucket(tokens_per_minute=6000, requests_per_minute=600)
+    kwargs = {"messages": "x" * 4000, "max_tokens": 5000}
+    assert _throttle(bucket, kwargs, 1) == 0.0
+    # Only a slowdown the server asked for holds a retry back
+    assert _throttle(bucket, kwargs, 2) == 0.0
+    bucket.block_for(2.0)
+    assert _throttle(bucket, kwargs, 3) == pytest.approx(2.0, abs=0.05)
+    assert bucket.tokens == pytest.approx(6000 - estimate_request_tokens(kwargs), abs=5)
+    assert bucket.requests == pytest.approx(599, abs=0.1)
+
+
+def test_policies_with_their_own_limits_get_their_own_bucket():
+    batch = RetryPolicy(max_attempts=3, tokens_per_minute=10 ** 6, requests_per_minute=5000)
+    assert get_bucket("gpt-4", batch) is get_bucket("gpt-4", RetryPolicy(tokens_per_minute=10 ** 6, requests_per_minute=5000))
+    assert get_bucket("gpt-4", batch) is not get_bucket("gpt-4")
+    assert get_bucket("gpt-4", batch).token_capacity == 10 ** 6
+    assert batch.max_attempts == 3 and DEFAULT_POLICY.max_attempts >= 1
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from question_schema import (
+    QuestionFormatError,
+    QuestionStreamParser,
+    generate_questions,
+    parse_questions,
+    repair_json,
+)
+
+QUESTIONS = [
+    {"question": "What drives you?", "description": "Think about your motivation."},
+    {"question": "What is your biggest win?", "description": "Pick one, with a {brace} in it."},
+    {"question": "Who do you serve?", "description": ""},
+]
+
+
+def test_valid_json_is_not_repaired():
+    questions, repaired = parse_questions(json.dumps(QUESTIONS))
+    assert questions == QUESTIONS
+    assert not repaired
+
+
+def test_repair_strips_code_fence_and_prose():
+    text = "Here are your questions:\n```json\n" + json.dumps(QUESTIONS, indent=2) + "\n```\nGood luck!"
+    assert repair_json(text) == QUESTIONS
+
+
+def test_repair_removes_trailing_commas():
+    text = '[{"question": "What drives you?", "description": "Why",}, {"question": "Next?", "description": "",},]'
+    assert repair_json(text) == [
+        {"question": "What drives you?", "description": "Why"},
+        {"question": "Next?", "description": ""},
+    ]
+
+
+def test_repair_replaces_smart_quotes():
+    text = "[{“question”: “What drives you?”, “description”: “”}]"
+    assert repair_json(text) == [{"question": "What drives you?", "description": ""}]
+
+
+def test_repair_salvages_complete_objects_of_truncated_array():
+    text = json.dumps(QUESTIONS)
+    truncated = text[:text.index('"Who do you serve?"') + 5]
+    assert repair_json(truncated) == QUESTIONS[:2]
+
+
+def test_repair_raises_without_json():
+    with pytest.raises(QuestionFormatError):
+        repair_json("I could not think of any questions.")
+
+
+def test_parse_unwraps_structured_output_and_drops_unusable_items():
+    text = json.dumps({"questions": [{"question": "  Why?  "}, {"question": ""}, "not an object"]})
+    questions, repaired = parse_questions(text)
+    assert questions == [{"question": "Why?", "description": ""}]
+    assert not repaired
+
+
+def test_parse_marks_repaired_text():
+    questions, repaired = parse_questions("```\n" + json.dumps(QUESTIONS) + "\n```")
+    assert questions == QUESTIONS
+    assert repaired
+
+
+def stream(text, size):
+    parser = QuestionStreamParser()
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    return parser, completed
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10000])
+def test_stream_parser_is_independent_of_chunk_boundaries(size):
+    text = 'Sure! Here\'s the "list":\n```json\n{"questions": ' + json.dumps(QUESTIONS) + "}\n```"
+    parser, completed = stream(text, size)
+    assert completed == QUESTIONS
+    assert parser.questions == QUESTIONS
+    assert parser.text == text
+
+
+def test_stream_parser_handles_escapes_split_across_chunks():
+    item = {"question": 'Say "hi" \\ or {not}?', "description": "a\\\"b"}
+    text = json.dumps([item])
+    for split in range(1, len(text)):
+        parser = QuestionStreamParser()
+        completed = parser.feed(text[:split]) + parser.feed(text[split:])
+        assert completed == [item], split
+
+
+def test_stream_parser_returns_each_question_once_as_it_closes():
+    parser = QuestionStreamParser()
+    text = json.dumps(QUESTIONS)
+    first_end = text.index("}") + 1
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == QUESTIONS[:1]
+    assert parser.feed(text[first_end:]) == QUESTIONS[1:]
+    assert parser.feed("") == []
+
+
+def test_stream_parser_tolerates_trailing_comma_inside_object():
+    parser = QuestionStreamParser()
+    assert parser.feed('[{"question": "Why?", "description": "",}]') == [{"question": "Why?", "description": ""}]
+
+
+def test_generate_questions_repairs_before_retrying():
+    calls = []
+
+    def complete(messages, fresh):
+        calls.append(fresh)
+        return "```json\n" + json.dumps(QUESTIONS) + ",\n```"
+
+    assert generate_questions(complete, [{"role": "user", "content": "hi"}]) == QUESTIONS
+    assert calls == [False]
+
+
+def test_generate_questions_retries_once_with_the_error():
+    calls = []
+
+    def complete(messages, fresh):
+        calls.append((len(messages), fresh))
+        return json.dumps(QUESTIONS) if fresh else "no questions, sorry"
+
+    messages = [{"role": "user", "content": "hi"}]
+    assert generate_questions(complete, messages) == QUESTIONS
+    assert calls == [(1, False), (3, True)]
+
+
+def test_generate_questions_raises_when_retry_is_malformed_too():
+    with pytest.raises(QuestionFormatError):
+        generate_questions(lambda messages, fresh: "still nothing", [{"role": "user", "content": "hi"}])
@@ -0,0 +1,176 @@
+from types import SimpleNamespace
+
+import pytest
+
+import session_store
+from session_store import (
+    MemorySessionBackend,
+    SessionStore,
+    browser_binding,
+    decode_state,
+    encode_state,
+    end_session,
+    restore_session,
+    rotate_session,
+    save_session,
+)
+
+
+@pytest.fixture(autouse=True)
+def memory_store(monkeypatch):
+    store = SessionStore(MemorySessionBackend())
+    monkeypatch.setattr(session_store, "_store", store)
+    monkeypatch.setattr(session_store, "_logins", MemorySessionBackend())
+    return store
+
+
+def other_process(monkeypatch):
+    """Forget the logins this process holds, as a replica that never served the session would."""
+    monkeypatch.setattr(session_store, "_logins", MemorySessionBackend())
+
+
+def xsrf_cookie(token, mask):
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(token))
+    return {"_streamlit_xsrf": f"2|{mask.hex()}|{masked.hex()}|1700000000"}
+
+
+def log_in(state, params, user_id="victim"):
+    rotate_session(state, params, user_id)
+    state.update(
+        logged_in=True,
+        user=SimpleNamespace(id=user_id, email=f"{user_id}@example.com"),
+        access_token="secret-access",
+        refresh_token="secret-refresh",
+    )
+    save_session(state)
+
+
+def test_state_round_trips_through_encoding():
+    state = {"user": SimpleNamespace(id="1", email="a@b.c"), "responses": ["é", ""], "pdf": b"%PDF"}
+    decoded = decode_state(encode_state(state))
+    assert vars(decoded["user"]) == {"id": "1", "email": "a@b.c"}
+    assert decoded["responses"] == ["é", ""]
+    assert decoded["pdf"] is None
+
+
+def test_binding_ignores_the_per_response_mask():
+    token = bytes(range(16))
+    first = browser_binding(xsrf_cookie(token, b"\x01\x02\x03\x04"))
+    assert first == browser_binding(xsrf_cookie(token, b"\xff\x00\xaa\x55"))
+    assert first != browser_binding(xsrf_cookie(bytes(16), b"\x01\x02\x03\x04"))
+    assert browser_binding({}) is None
+    assert browser_binding({"_streamlit_xsrf": "2|zz|zz|1"}) is None
+
+
+def test_a_reload_in_the_same_process_stays_signed_in():
+    params, state = {}, {}
+    restore_session(state, params, "browser")
+    log_in(state, params)
+    state["responses"] = ["Curiosity"]
+    save_session(state)
+
+    reloaded = {}
+    assert restore_session(reloaded, dict(params), "browser") == params["sid"]
+    assert reloaded["logged_in"] and reloaded["access_token"] == "secret-access"
+    assert reloaded["responses"] == ["Curiosity"]
+
+
+def test_another_replica_restores_the_state_but_not_the_login(monkeypatch, memory_store):
+    params, state = {}, {}
+    restore_session(state, params, "browser")
+    log_in(state, params)
+    state["responses"] = ["Curiosity"]
+    save_session(state)
+
+    # No token ever reaches the shared backend
+    stored = "".join(str(decode_state(blob)) for blob, _ in memory_store.backend._entries.values())
+    assert "Curiosity" in stored and "secret" not in stored
+
+    other_process(monkeypatch)
+    replica = {}
+    assert restore_session(replica, dict(params), "browser") == params["sid"]
+    assert replica["user"].id == "victim" and replica["responses"] == ["Curiosity"]
+    assert "logged_in" not in replica and "access_token" not in replica
+
+    # Logging in again there carries on with the restored state
+    log_in(replica, params)
+    assert replica["responses"] == ["Curiosity"]
+
+
+def test_logging_in_as_someone_else_drops_the_restored_state(monkeypatch):
+    params, state = {}, {}
+    restore_session(state, params, "shared-browser")
+    log_in(state, params, "first")
+    state["responses"] = ["Private answer"]
+    save_session(state)
+
+    other_process(monkeypatch)
+    replica = {}
+    restore_session(replica, dict(params), "shared-browser")
+    log_in(replica, params, "second")
+    assert "responses" not in replica and replica["user"].id == "second"
+
+
+def test_a_leaked_link_restores_nothing_in_another_browser():
+    params, state = {}, {}
+    restore_session(state, params, "victim-browser")
+    log_in(state, params)
+
+    leaked = dict(params)
+    attacker = {}
+    restore_session(attacker, leaked, "attacker-browser")
+    assert "logged_in" not in attacker and "access_token" not in attacker
+    assert leaked["sid"] != params["sid"]
+
+
+def test_client_chosen_ids_are_replaced():
+    params = {"sid": "attacker-chosen"}
+    state = {}
+    session_id = restore_session(state, params, "browser")
+    assert session_id != "attacker-chosen"
+    assert params["sid"] == session_id
+
+
+def test_login_issues_a_new_id_and_drops_the_old_one():
+    params, state = {}, {}
+    restore_session(state, params, "browser")
+    save_session(state)
+    before = params["sid"]
+
+    log_in(state, params)
+    assert params["sid"] != before
+
+    # Whoever held the pre-login ID, even in the same browser, gets a new empty session
+    stale = {"sid": before}
+    other = {}
+    restore_session(other, stale, "browser")
+    assert "logged_in" not in other and stale["sid"] != before
+
+
+def test_nothing_is_stored_without_a_binding(memory_store):
+    params, state = {"sid": "anything"}, {}
+    assert restore_session(state, params, None) is None
+    state["logged_in"] = True
+    assert not save_session(state)
+    assert not memory_store.backend._entries
+
+
+def test_unchanged_state_is_not_written_again():
+    params, state = {}, {}
+    restore_session(state, params, "browser")
+    state["responses"] = ["a"]
+    assert save_session(state)
+    assert not save_session(state)
+
+
+def test_logout_forgets_the_session():
+    params, state = {}, {}
+    restore_session(state, params, "browser")
+    log_in(state, params)
+    session_id = params["sid"]
+    end_session(state, params)
+    assert "sid" not in params
+
+    replica = {}
+    restore_session(replica, {"sid": session_id}, "browser")
+    assert "logged_in" not in replica
@@ -0,0 +1,88 @@
+"""Optional sidebar panel showing where the time and tokens of the current run went.
+
+Also keeps how long recent script runs took per scope: "page" for a full
+rerun, or the name of a fragment for a fragment-scoped one.
+"""
+import contextlib
+import threading
+import time
+from collections import defaultdict, deque
+
+import streamlit as st
+
+from tracing import trace_breakdown
+
+
+class RerunMetrics:
+    """Thread-safe durations of recent script runs, per scope."""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._durations = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, scope, seconds):
+        with self._lock:
+            self._durations[scope].append(seconds)
+
+    def latest(self, scope):
+        """Duration of the most recent run of scope, or None."""
+        with self._lock:
+            durations = self._durations.get(scope)
+            return durations[-1] if durations else None
+
+    def as_dict(self):
+        with self._lock:
+            stats = {}
+            for scope, durations in self._durations.items():
+                ordered = sorted(durations)
+                stats[scope] = {
+                    "runs": len(ordered),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+                }
+            return stats
+
+
+_rerun_metrics = RerunMetrics()
+
+
+def get_rerun_metrics():
+    """Process-wide script run durations."""
+    return _rerun_metrics
+
+
+@contextlib.contextmanager
+def timed_rerun(scope):
+    """Record how long the enclosed script run (or fragment run) took, however it ends."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _rerun_metrics.record(scope, time.perf_counter() - started)
+
+
+def render_trace_panel(trace_ids, key="show_trace_panel"):
+    """Show a per-stage breakdown for each {label: trace_id} when the user asks for it."""
+    if not st.toggle("Show timing breakdown", key=key):
+        return
+    reruns = _rerun_metrics.as_dict()
+    if reruns:
+        st.caption("Reruns: " + ", ".join(
+            f"{scope} p50 {stats['p50_ms']} ms / p95 {stats['p95_ms']} ms ({stats['runs']})"
+            for scope, stats in reruns.items()
+        ))
+    if not trace_ids:
+        st.caption("Nothing has run yet in this session.")
+        return
+    for label, trace_id in trace_ids.items():
+        rows = trace_breakdown(trace_id)
+        st.markdown(f"**{label.replace('_', ' ').title()}**")
+        if not rows:
+            # Spans live in server memory, so a restart forgets them
+            st.caption("No timings recorded on this server.")
+            continue
+        st.dataframe(rows, hide_index=True)
+        prompt_tokens = sum(row["tokens in"] or 0 for row in rows)
+        completion_tokens = sum(row["tokens out"] or 0 for row in rows)
+        if prompt_tokens or completion_tokens:
+            st.caption(f"Tokens: {prompt_tokens} in / {completion_tokens} out")
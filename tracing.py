@@ -0,0 +1,217 @@
+"""Lightweight spans for timing each stage of a run.
+
+    with span("question_generation", stage="questions"):
+        ...
+
+Spans nest through a context variable, so asyncio tasks and asyncio.to_thread
+inherit the current span; work handed to other threads (background jobs)
+starts its own root span, optionally joining an existing trace by ID. The LLM
+helpers annotate the span they run in with model, token counts, cache status
+and retries.
+
+Finished spans are appended as OTLP-style JSON lines to TRACE_SINK_PATH
+(.cache/traces.jsonl by default; TRACE_SINK=none turns the file off), and
+the most recent traces are kept in memory for the app's timing panel.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TRACE_SINK = os.getenv("TRACE_SINK", "jsonl")
+TRACE_SINK_PATH = os.getenv("TRACE_SINK_PATH", os.path.join(".cache", "traces.jsonl"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "personal-branding")
+MAX_RECENT_TRACES = 200
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_recent = OrderedDict()  # trace_id -> [Span, ...]
+_recent_lock = threading.Lock()
+_sink_lock = threading.Lock()
+
+
+class Span:
+    """One timed operation inside a trace."""
+
+    def __init__(self, name, trace_id=None, parent=None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else (trace_id or uuid.uuid4().hex)
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns = None
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        _remember(self)
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def add(self, key, amount=1):
+        """Accumulate a numeric attribute, e.g. tokens over several calls."""
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self, error=None):
+        if self.end_time_ns is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        self.end_time_ns = time.time_ns()
+        if error is not None:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+        _export(self)
+
+    def to_dict(self):
+        with self._lock:
+            attributes = dict(self.attributes)
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_time_ns,
+            "end_time_unix_nano": self.end_time_ns,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": {"code": self.status, "message": self.error},
+            "attributes": attributes,
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+def _remember(span):
+    with _recent_lock:
+        spans = _recent.setdefault(span.trace_id, [])
+        spans.append(span)
+        _recent.move_to_end(span.trace_id)
+        while len(_recent) > MAX_RECENT_TRACES:
+            _recent.popitem(last=False)
+
+
+def _export(span):
+    if TRACE_SINK == "none":
+        return
+    line = json.dumps(span.to_dict(), default=str)
+    try:
+        with _sink_lock:
+            directory = os.path.dirname(TRACE_SINK_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(TRACE_SINK_PATH, "a") as file:
+                file.write(line + "\n")
+    except OSError as e:
+        # Telemetry must never break a user's run
+        logger.warning("Could not write span %s: %s", span.name, e)
+
+
+def current_span():
+    """The innermost open span in this context, or None."""
+    return _current_span.get()
+
+
+def start_span(name, trace_id=None, **attributes):
+    """Open a span under the current one without making it current; call .end() when done."""
+    return Span(name, trace_id=trace_id, parent=_current_span.get(), **attributes)
+
+
+@contextlib.contextmanager
+def use_span(span):
+    """Make an existing span current for the duration of the block."""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextlib.contextmanager
+def span(name, trace_id=None, **attributes):
+    """Time a block as a child of the current span, or as a new trace root."""
+    current = start_span(name, trace_id=trace_id, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def annotate(**attributes):
+    """Set attributes on the current span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def increment(key, amount=1):
+    """Add to a numeric attribute of the current span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.add(key, amount)
+
+
+def record_usage(usage, target=None):
+    """Add an OpenAI usage object's token counts (chat or Responses API) to a span."""
+    target = target or _current_span.get()
+    if target is None or usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", None)
+    if prompt is None:
+        prompt = getattr(usage, "input_tokens", 0)
+    completion = getattr(usage, "completion_tokens", None)
+    if completion is None:
+        completion = getattr(usage, "output_tokens", 0)
+    target.add("prompt_tokens", prompt or 0)
+    target.add("completion_tokens", completion or 0)
+
+
+def get_trace(trace_id):
+    """Spans recorded in this process for a trace, in start order."""
+    with _recent_lock:
+        spans = list(_recent.get(trace_id, ()))
+    return sorted(spans, key=lambda s: s.start_time_ns)
+
+
+def trace_breakdown(trace_id):
+    """Rows summarising a trace for display, children listed under their parents."""
+    spans = get_trace(trace_id)
+    children = {}
+    for s in spans:
+        children.setdefault(s.parent_id, []).append(s)
+    known = {s.span_id for s in spans}
+    rows = []
+
+    def walk(s, depth):
+        attributes = s.to_dict()["attributes"]
+        rows.append({
+            "stage": ("  " * (depth - 1) + "↳ " if depth else "") + s.name,
+            "ms": round(s.duration * 1000) if s.duration is not None else None,
+            "model": attributes.get("model"),
+            "tokens in": attributes.get("prompt_tokens"),
+            "tokens out": attributes.get("completion_tokens"),
+            "cached": attributes.get("cached"),
+            "retries": attributes.get("retries"),
+            "status": s.status if s.duration is not None else "running",
+        })
+        for child in children.get(s.span_id, ()):
+            walk(child, depth + 1)
+
+    for s in spans:
+        # Roots, plus spans whose parent lives in another process or was evicted
+        if s.parent_id is None or s.parent_id not in known:
+            walk(s, 0)
+    return rows